@@ -1 +1,28 @@
-__all__ = ["adsb", "adsb_parser", "adsb_producer", "adsb_rtlsdr"]
+__all__ = [
+    "adsb",
+    "adsb_archive",
+    "adsb_benchmark",
+    "adsb_broker",
+    "adsb_capture",
+    "adsb_columns",
+    "adsb_consumer",
+    "adsb_crc",
+    "adsb_dedup",
+    "adsb_diagnostics",
+    "adsb_feeds",
+    "adsb_metrics",
+    "adsb_multiprocess",
+    "adsb_noise",
+    "adsb_oversampled",
+    "adsb_parser",
+    "adsb_pipeline",
+    "adsb_producer",
+    "adsb_raw",
+    "adsb_receivers",
+    "adsb_record",
+    "adsb_replay",
+    "adsb_rtlsdr",
+    "adsb_signal",
+    "adsb_spatial",
+    "adsb_tracker",
+]
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 """
 This Python script uses RTL-SDR to retrieve radio samples for the ADS-B frequency of 1090 and
-publishes those samples to a Kafka topic.
+publishes the messages decoded from those samples to a Kafka topic. In raw
+mode it publishes the samples themselves, as compressed IQ blocks, for
+adsb_consumer to decode on other hosts.
 """
 
 # Python Standard Libraries
@@ -9,24 +11,134 @@ import asyncio
 import os
 import sys
 
+import adsb_dedup
 import adsb_producer
+import adsb_replay
 
 BOOTSTRAP_SERVERS = os.environ.get("ADSB_KAFKA_SERVERS")
 KAFKA_TOPIC = os.environ.get("ADSB_KAFKA_TOPIC")
 
+# Topic raw IQ blocks are published to instead of decoded messages, disabled
+# when unset. The blocks are already compressed.
+RAW_TOPIC = os.environ.get("ADSB_RAW_TOPIC")
+
+# Comma separated specs of several sources to receive at once, each in its
+# own process, see adsb_receivers. They replace the dongle, so neither a
+# replay nor raw mode can be used with them.
+SOURCES = os.environ.get("ADSB_SOURCES")
+
+# Sample rate of the dongle, 2.4 or 2.56 Msps decode the frames that start
+# between two samples at some cost in CPU. Raw IQ blocks are decoded at the
+# default 2 Msps only.
+SAMPLE_RATE = os.environ.get("ADSB_SAMPLE_RATE")
+
+# Number of worker processes decoding the samples of the dongle, see
+# adsb_multiprocess, decoded in the pipeline itself when unset. The workers
+# decode at the default 2 Msps only.
+DECODE_WORKERS = os.environ.get("ADSB_DECODE_WORKERS")
+
+# Capture file replayed instead of reading the dongle, at a multiple of real
+# time, 0 for as fast as possible, and looped when ADSB_REPLAY_LOOP is 1
+REPLAY_CAPTURE = os.environ.get("ADSB_REPLAY_CAPTURE")
+REPLAY_SPEED = float(os.environ.get("ADSB_REPLAY_SPEED", adsb_replay.SPEED))
+REPLAY_LOOP = os.environ.get("ADSB_REPLAY_LOOP") == "1"
+
+# What the pipeline queues do when they are full: block, drop-oldest or
+# drop-newest
+QUEUE_POLICY = os.environ.get("ADSB_QUEUE_POLICY", "block")
+
+# Seconds within which a repeated frame is not published again and the minimum
+# seconds between two positions of an aircraft, each disabled when unset
+DEDUP_WINDOW = os.environ.get("ADSB_DEDUP_WINDOW")
+POSITION_RATE_LIMIT = os.environ.get("ADSB_POSITION_RATE_LIMIT")
+
+# Local ports serving the Beast binary and SBS-1 BaseStation feeds, disabled
+# when unset
+BEAST_PORT = os.environ.get("ADSB_BEAST_PORT")
+SBS_PORT = os.environ.get("ADSB_SBS_PORT")
+
+# Directory archiving the decoded frames, disabled when unset
+ARCHIVE_DIRECTORY = os.environ.get("ADSB_ARCHIVE_DIRECTORY")
+
+# Directory to render diagnostic plots of the signal to, disabled when unset
+DIAGNOSTICS_DIRECTORY = os.environ.get("ADSB_DIAGNOSTICS_DIRECTORY")
+
+# Local port serving the pipeline metrics, disabled when unset, and whether
+# every stage is profiled as well
+METRICS_PORT = os.environ.get("ADSB_METRICS_PORT")
+METRICS_PROFILE = os.environ.get("ADSB_METRICS_PROFILE") == "1"
+
 
 def main() -> int:
     """
         The main method to initiate application execution
     """
 
-    producer = adsb_producer.AdsbProducer()
-    producer.configure(BOOTSTRAP_SERVERS)
+    if SOURCES and (REPLAY_CAPTURE or RAW_TOPIC):
+        print('ADSB_SOURCES can not be used with ADSB_REPLAY_CAPTURE or '
+              'ADSB_RAW_TOPIC.', file=sys.stderr)
+        return 1
+
+    if SAMPLE_RATE and RAW_TOPIC:
+        print('ADSB_SAMPLE_RATE can not be used with ADSB_RAW_TOPIC.',
+              file=sys.stderr)
+        return 1
+
+    if DECODE_WORKERS and (SOURCES or RAW_TOPIC or SAMPLE_RATE):
+        print('ADSB_DECODE_WORKERS can not be used with ADSB_SOURCES, '
+              'ADSB_RAW_TOPIC or ADSB_SAMPLE_RATE.', file=sys.stderr)
+        return 1
+
+    sdr = None
+    if REPLAY_CAPTURE:
+        sdr = adsb_replay.AdsbReplay.from_capture(
+            REPLAY_CAPTURE, speed=REPLAY_SPEED, loop=REPLAY_LOOP)
+
+    sources = SOURCES.split(",") if SOURCES else None
+
+    producer = adsb_producer.AdsbProducer(sdr, sources)
+
+    if RAW_TOPIC:
+        producer.configure(BOOTSTRAP_SERVERS, compression_type=None)
+        producer.set_raw_topic(RAW_TOPIC)
+    else:
+        producer.configure(BOOTSTRAP_SERVERS)
+
     producer.set_topic(KAFKA_TOPIC)
+    producer.set_queue_policy(QUEUE_POLICY)
+
+    if SAMPLE_RATE:
+        producer.set_sample_rate(float(SAMPLE_RATE))
+
+    if DECODE_WORKERS:
+        producer.set_decode_workers(int(DECODE_WORKERS))
+
+    if DEDUP_WINDOW or POSITION_RATE_LIMIT:
+        rate_limits = None
+        if POSITION_RATE_LIMIT:
+            rate_limits = dict.fromkeys(
+                adsb_dedup.POSITION_RATE_LIMITS, float(POSITION_RATE_LIMIT))
+
+        producer.set_dedup(
+            float(DEDUP_WINDOW) if DEDUP_WINDOW else 0, rate_limits)
+
+    if BEAST_PORT or SBS_PORT:
+        producer.set_feeds(
+            int(BEAST_PORT) if BEAST_PORT else None,
+            int(SBS_PORT) if SBS_PORT else None
+        )
+
+    if ARCHIVE_DIRECTORY:
+        producer.set_archive(ARCHIVE_DIRECTORY)
+
+    if DIAGNOSTICS_DIRECTORY:
+        producer.set_diagnostics(DIAGNOSTICS_DIRECTORY)
+
+    if METRICS_PORT:
+        producer.set_metrics(int(METRICS_PORT), METRICS_PROFILE)
 
     try:
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(producer.run())
+        asyncio.run(producer.run())
     except KeyboardInterrupt:
         print('Aborted manually.', file=sys.stderr)
         return 1
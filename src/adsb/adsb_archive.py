@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+On-disk archive of decoded frames, queried by ICAO address and time range
+without a database.
+
+Frames are appended to segment files as NumPy structured records of a fixed
+size, FRAME_DTYPE. Once a segment holds segment_frames records it is closed
+and a small index is written next to it:
+
+    time_range  minimum and maximum timestamp of the segment
+    icaos       sorted ICAO addresses heard in the segment
+    starts      offset of the first row of every address in order
+    order       rows of the segment sorted by address, in time order for
+                each address
+
+A query skips every segment whose time range or addresses do not match and
+only reads the rows of the address from the others, through a memory map of
+the segment. The segment being written has no index yet and is scanned.
+"""
+
+import glob
+import os
+
+import adsb_columns
+import adsb_crc
+import numpy
+
+FRAME_DTYPE = numpy.dtype([
+    ("timestamp", "<f8"),
+    ("icao", "<u4"),
+    ("downlink_format", "u1"),
+    ("length", "u1"),
+    ("signal_level", "<f4"),
+    ("frame", "u1", (adsb_crc.MESSAGE_BYTES,)),
+])
+
+# Number of frames of a segment, 32 MB of records
+SEGMENT_FRAMES = 1024 * 1024
+
+SEGMENT_PATTERN = "segment-{:08d}.frames"
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".frames"
+INDEX_SUFFIX = ".index.npz"
+
+
+def to_records(messages):
+    """Returns the archive records of a batch of parser messages"""
+
+    batch = adsb_columns.as_batch(messages)
+
+    records = numpy.zeros(len(batch), dtype=FRAME_DTYPE)
+    records["timestamp"] = batch.timestamps
+    records["signal_level"] = batch.levels
+    records["icao"] = adsb_columns.icao_addresses(batch.frames, batch.lengths)
+    records["downlink_format"] = batch.frames[:, 0] >> 3
+    records["length"] = batch.lengths // 8
+    records["frame"] = batch.frames
+
+    return records
+
+
+def segment_number(path):
+    """Returns the number of a segment file"""
+
+    name = os.path.basename(path)
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def segment_paths(directory):
+    """Returns the paths of the segment files of a directory, oldest first"""
+
+    return sorted(
+        glob.glob(os.path.join(
+            directory, SEGMENT_PREFIX + "*" + SEGMENT_SUFFIX)),
+        key=segment_number
+    )
+
+
+def read_segment(path):
+    """Returns a memory map of the records of a segment file"""
+
+    count = os.path.getsize(path) // FRAME_DTYPE.itemsize
+    if not count:
+        return numpy.zeros(0, dtype=FRAME_DTYPE)
+
+    return numpy.memmap(path, dtype=FRAME_DTYPE, mode="r", shape=(count,))
+
+
+def index_segment(path):
+    """Writes the index of a closed segment file"""
+
+    records = read_segment(path)
+    icao = numpy.asarray(records["icao"])
+    timestamps = numpy.asarray(records["timestamp"])
+
+    order = numpy.lexsort((timestamps, icao)).astype(numpy.uint32)
+    icaos, starts = numpy.unique(icao[order], return_index=True)
+
+    time_range = numpy.array([timestamps.min(), timestamps.max()]) \
+        if len(records) else numpy.array([numpy.inf, -numpy.inf])
+
+    numpy.savez(
+        path + INDEX_SUFFIX,
+        time_range=time_range,
+        icaos=icaos,
+        starts=numpy.append(starts, len(order)),
+        order=order
+    )
+
+
+class AdsbArchiveWriter:
+    """
+    Class appending frames to the segments of an archive directory. Writing
+    to an existing archive starts a new segment numbered after its last one,
+    indexing the last one first if it was left open. Old segments may be
+    deleted, with their index, to keep the archive to a retention period;
+    numbers are never reused.
+    """
+
+    def __init__(self, directory, segment_frames=SEGMENT_FRAMES):
+        self.directory = directory
+        self.segment_frames = segment_frames
+
+        os.makedirs(directory, exist_ok=True)
+
+        segments = segment_paths(directory)
+        for path in segments:
+            if not os.path.exists(path + INDEX_SUFFIX):
+                index_segment(path)
+
+        self.segment = segment_number(segments[-1]) + 1 if segments else 0
+        self.count = 0
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def path(self):
+        """Returns the path of the current segment"""
+        return os.path.join(
+            self.directory, SEGMENT_PATTERN.format(self.segment))
+
+    def close(self):
+        """Closes and indexes the current segment"""
+
+        if self.file is None:
+            return
+
+        self.file.close()
+        self.file = None
+        index_segment(self.path())
+
+        self.segment += 1
+        self.count = 0
+
+    def write(self, messages):
+        """Appends a batch of parser messages"""
+        self.write_records(to_records(messages))
+
+    def write_records(self, records):
+        """Appends FRAME_DTYPE records, closing every segment that fills up"""
+
+        offset = 0
+        while offset < len(records):
+            if self.file is None:
+                self.file = open(self.path(), "ab")
+
+            count = min(self.segment_frames - self.count, len(records) - offset)
+            self.file.write(records[offset:offset + count].tobytes())
+            self.count += count
+            offset += count
+
+            if self.count == self.segment_frames:
+                self.close()
+
+        if self.file is not None:
+            self.file.flush()
+
+
+class AdsbArchiveReader:
+    """Class querying the segments of an archive directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        """Returns the paths of the segment files, oldest first"""
+        return segment_paths(self.directory)
+
+    def query(self, icao=None, start=-numpy.inf, end=numpy.inf):
+        """
+        Returns the records between the start and end times, inclusive, of
+        the given ICAO address, or of every address when None, in time order
+        """
+
+        results = []
+
+        for path in self.segments():
+            if os.path.exists(path + INDEX_SUFFIX):
+                records = self.query_segment(path, icao, start, end)
+            else:
+                records = read_segment(path)
+                mask = (records["timestamp"] >= start) & (
+                    records["timestamp"] <= end)
+                if icao is not None:
+                    mask &= records["icao"] == icao
+                records = records[mask]
+
+            if records is not None and len(records):
+                results.append(numpy.asarray(records))
+
+        if not results:
+            return numpy.zeros(0, dtype=FRAME_DTYPE)
+
+        results = numpy.concatenate(results)
+        return results[numpy.argsort(results["timestamp"], kind="stable")]
+
+    @staticmethod
+    def query_segment(path, icao, start, end):
+        """
+        Returns the matching records of an indexed segment, None when the
+        index rules the segment out
+        """
+
+        with numpy.load(path + INDEX_SUFFIX) as index:
+            low, high = index["time_range"]
+            if high < start or low > end:
+                return None
+
+            if icao is None:
+                records = read_segment(path)
+                timestamps = records["timestamp"]
+                return records[(timestamps >= start) & (timestamps <= end)]
+
+            icaos = index["icaos"]
+            position = numpy.searchsorted(icaos, icao)
+            if position == len(icaos) or icaos[position] != icao:
+                return None
+
+            first, last = index["starts"][position:position + 2]
+            rows = index["order"][first:last]
+
+        records = read_segment(path)[rows]
+
+        # the rows of an address are in time order
+        timestamps = records["timestamp"]
+        return records[numpy.searchsorted(timestamps, start):
+                       numpy.searchsorted(timestamps, end, side="right")]
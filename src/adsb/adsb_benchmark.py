@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Benchmarks the ADS-B decoder against synthetic signals, so performance and
+sensitivity regressions can be caught on a machine without a dongle.
+
+Reports the decoding throughput in samples and messages per second, the time
+spent in every stage of the parser and the share of the generated frames that
+are decoded at every Signal to Noise Ratio (SNR).
+
+Above 2 Msps the oversampled demodulator is benchmarked, with the detection
+rate of the same frames sampled at 2 Msps alongside. A fixed phase starts
+every frame the same fraction of a sample late, 0.5 being the worst case at
+2 Msps.
+"""
+
+# Python Standard Libraries
+import argparse
+import sys
+import time
+
+import adsb_oversampled
+import adsb_parser
+import adsb_rtlsdr
+import adsb_signal
+import numpy
+
+SAMPLES = 4 * 1024 * 1024
+FRAMES_PER_SECOND = 1000
+SNRS = [6, 8, 10, 12, 15, 20, 25, 30]
+
+
+def make_capture(samples, frame_count, snr, args, seed,
+                 sample_rate=adsb_rtlsdr.SAMPLE_RATE):
+    """Returns the IQ bytes of a synthetic capture and the frames in it"""
+
+    rng = numpy.random.default_rng(seed)
+    frames = adsb_signal.random_frames(frame_count, rng)
+
+    signal, _ = adsb_signal.generate(
+        frames,
+        samples,
+        snr=snr,
+        frequency_offset=args.frequency_offset,
+        overlap=args.overlap,
+        sample_rate=sample_rate,
+        phase=args.phase,
+        seed=seed
+    )
+
+    return adsb_signal.iq_to_bytes(signal), frames
+
+
+def detection_rate(messages, frames):
+    """Returns the share of the generated frames that were decoded"""
+
+    decoded = {message[0] for message in messages}
+    found = sum(frame.hex().upper() in decoded for frame in frames)
+
+    return found / len(frames)
+
+
+def benchmark_stages(data, chunk_size, sample_rate=adsb_rtlsdr.SAMPLE_RATE):
+    """Returns the seconds spent in every stage of the parser"""
+
+    parser = adsb_oversampled.streaming_parser(sample_rate)
+    stages = dict.fromkeys(
+        ["magnitude", "threshold", "detect", "demodulate", "validate"], 0.0)
+
+    step = 2 * chunk_size
+    for start in range(0, len(data), step):
+        begin = time.perf_counter()
+        signal = adsb_rtlsdr.bytes_to_magnitude(data[start:start + step])
+        stages["magnitude"] += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        min_sig_amp = parser.min_signal_amplitude(signal)
+        stages["threshold"] += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        indexes = parser.detect_preambles(signal, min_sig_amp)
+        stages["detect"] += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        frames, lengths, _, positions = parser.demodulate_candidates(
+            signal, indexes)
+        stages["demodulate"] += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        parser.validate_frames(
+            frames, lengths, (start // 2 + positions) / sample_rate)
+        stages["validate"] += time.perf_counter() - begin
+
+    return stages
+
+
+def benchmark_throughput(data, chunk_size, sample_rate=adsb_rtlsdr.SAMPLE_RATE):
+    """Returns the seconds to decode the data and the decoded messages"""
+
+    parser = adsb_oversampled.streaming_parser(
+        sample_rate, chunk_size=chunk_size)
+
+    begin = time.perf_counter()
+    messages = list(parser.feed_bytes(data)) + list(parser.flush())
+
+    return time.perf_counter() - begin, messages
+
+
+def main() -> int:
+    """
+        Runs the benchmarks and prints the report
+    """
+
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--samples", type=int, default=SAMPLES)
+    arguments.add_argument(
+        "--frames-per-second", type=int, default=FRAMES_PER_SECOND)
+    arguments.add_argument("--snr", type=float, nargs="+", default=SNRS)
+    arguments.add_argument("--frequency-offset", type=float, default=0)
+    arguments.add_argument("--overlap", type=float, default=0)
+    arguments.add_argument(
+        "--chunk-size", type=int, default=adsb_parser.CHUNK_SIZE)
+    arguments.add_argument("--seed", type=int, default=0)
+    arguments.add_argument(
+        "--sample-rate", type=float, default=adsb_rtlsdr.SAMPLE_RATE)
+    arguments.add_argument("--phase", type=float, default=None)
+    args = arguments.parse_args()
+
+    rate = args.sample_rate
+    seconds = args.samples / rate
+    frame_count = max(1, int(seconds * args.frames_per_second))
+
+    data, frames = make_capture(
+        args.samples, frame_count, max(args.snr), args, args.seed, rate)
+
+    elapsed, messages = benchmark_throughput(data, args.chunk_size, rate)
+    speed = args.samples / elapsed
+    print(f"samples:  {args.samples} ({seconds:.2f} s at {rate / 1e6:g} Msps)")
+    print(f"decoded:  {len(messages)} of {frame_count} frames")
+    print(f"samples/s:  {speed:,.0f}"
+          f" ({speed / rate:.1f}x real time)")
+    print(f"messages/s: {len(messages) / elapsed:,.0f}")
+
+    print()
+    print("stage        seconds   share")
+    stages = benchmark_stages(data, args.chunk_size, rate)
+    total = sum(stages.values())
+    for stage, spent in stages.items():
+        print(f"{stage:<12} {spent:8.4f}  {spent / total:6.1%}")
+
+    print()
+    oversampled = rate != adsb_rtlsdr.SAMPLE_RATE
+    print("snr (dB)  detection rate" + ("  at 2 Msps" if oversampled else ""))
+    for snr in args.snr:
+        data, frames = make_capture(
+            args.samples, frame_count, snr, args, args.seed, rate)
+        _, messages = benchmark_throughput(data, args.chunk_size, rate)
+        line = f"{snr:8.1f}  {detection_rate(messages, frames):6.1%}"
+
+        if oversampled:
+            samples = int(args.samples * adsb_rtlsdr.SAMPLE_RATE / rate)
+            data, frames = make_capture(
+                samples, frame_count, snr, args, args.seed)
+            _, messages = benchmark_throughput(data, args.chunk_size)
+            line += f"          {detection_rate(messages, frames):6.1%}"
+
+        print(line)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
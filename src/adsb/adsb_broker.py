@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+In-memory stand-in for a Kafka broker, so producers and consumer groups can
+be run on a machine without Kafka.
+
+Only the part of the kafka-python API the receiver uses is covered: a
+producer sending records to partitioned topics and consumers sharing the
+partitions of a topic within a group, each partition read by a single
+member of the group. Members of a group may run on separate threads of the
+same process.
+
+https://kafka-python.readthedocs.io/en/master/
+"""
+
+import collections
+import itertools
+import threading
+
+# Number of partitions of every topic
+PARTITIONS = 4
+
+ConsumerRecord = collections.namedtuple(
+    "ConsumerRecord",
+    ["topic", "partition", "offset", "key", "value", "headers"]
+)
+
+
+class LocalFuture:
+    """Class for the result of a send, delivered as soon as it is sent"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def add_callback(self, function, *args):
+        function(*args, self.value)
+        return self
+
+    def add_errback(self, _, *__):
+        return self
+
+
+class LocalBroker:
+    """Class holding the topics and the consumer group offsets"""
+
+    def __init__(self, partitions=PARTITIONS):
+        self.partitions = partitions
+        self.lock = threading.Lock()
+
+        # records of every partition of every topic
+        self.topics = collections.defaultdict(
+            lambda: [[] for _ in range(self.partitions)])
+
+        # next offset of every (group, topic, partition) and the members of
+        # every (group, topic)
+        self.offsets = collections.defaultdict(int)
+        self.members = collections.defaultdict(list)
+
+        self.next_partition = itertools.count()
+
+    def producer(self):
+        """Returns a producer sending to this broker"""
+        return LocalProducer(self)
+
+    def consumer(self, topic, group_id):
+        """Returns a member of the consumer group reading a topic"""
+
+        consumer = LocalConsumer(self, topic, group_id)
+
+        with self.lock:
+            self.members[group_id, topic].append(consumer)
+
+        return consumer
+
+    def append(self, topic, key, value, headers):
+        """Appends a record to a partition, chosen by key or round robin"""
+
+        with self.lock:
+            if key is None:
+                partition = next(self.next_partition) % self.partitions
+            else:
+                partition = hash(key) % self.partitions
+
+            records = self.topics[topic][partition]
+            records.append((key, value, headers or []))
+
+            return topic, partition, len(records) - 1
+
+    def poll(self, consumer):
+        """Returns the next records of the partitions assigned to a member"""
+
+        with self.lock:
+            members = self.members[consumer.group_id, consumer.topic]
+            index = members.index(consumer)
+
+            records = []
+            for partition in range(index, self.partitions, len(members)):
+                position = consumer.group_id, consumer.topic, partition
+                offset = self.offsets[position]
+                log = self.topics[consumer.topic][partition]
+
+                records.extend(
+                    ConsumerRecord(consumer.topic, partition, number, *record)
+                    for number, record in enumerate(log[offset:], offset)
+                )
+                self.offsets[position] = len(log)
+
+            return records
+
+    def leave(self, consumer):
+        """Removes a member from its group, its partitions are reassigned"""
+
+        with self.lock:
+            self.members[consumer.group_id, consumer.topic].remove(consumer)
+
+
+class LocalProducer:
+    """Class with the producer interface of kafka.KafkaProducer"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def send(self, topic, value=None, key=None, headers=None):
+        return LocalFuture(self.broker.append(topic, key, value, headers))
+
+    def flush(self):
+        """Records are stored as soon as they are sent"""
+
+    def close(self):
+        """Nothing to release"""
+
+
+class LocalConsumer:
+    """
+    Class with the consumer interface of kafka.KafkaConsumer. Iterating
+    stops once the assigned partitions are read to the end, like a
+    KafkaConsumer with a consumer_timeout_ms.
+    """
+
+    def __init__(self, broker, topic, group_id):
+        self.broker = broker
+        self.topic = topic
+        self.group_id = group_id
+
+    def __iter__(self):
+        while True:
+            records = self.broker.poll(self)
+            if not records:
+                return
+            yield from records
+
+    def close(self):
+        self.broker.leave(self)
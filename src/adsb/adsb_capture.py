@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Reads and writes RTL-SDR captures as raw interleaved unsigned 8 bit IQ, the
+native sample format of the dongle. Every sample is two bytes, I followed by
+Q, centered on 127.5.
+
+A capture starts with a small header holding the sample rate and center
+frequency. Files without the header, like the ones written by the rtl_sdr
+command line tool, are read with the default ADS-B settings.
+
+https://osmocom.org/projects/rtl-sdr/wiki/Rtl-sdr
+"""
+
+import struct
+
+import adsb_oversampled
+import adsb_parser
+import adsb_rtlsdr
+import numpy
+
+# Header layout: magic, format version, sample rate and center frequency
+HEADER_FORMAT = "<4sIdd"
+HEADER_LENGTH = struct.calcsize(HEADER_FORMAT)
+HEADER_MAGIC = b"ADIQ"
+HEADER_VERSION = 1
+
+# Number of bytes holding a single IQ sample
+SAMPLE_BYTES = 2
+
+
+def bytes_to_iq(data):
+    """
+    Converts interleaved unsigned 8 bit IQ bytes into complex samples scaled
+    to [-1, 1], the same as pyrtlsdr does for read_samples.
+    """
+
+    iq = numpy.asarray(data, dtype=numpy.uint8).astype(numpy.float32)
+    iq = iq.view(numpy.complex64)
+    iq /= 127.5
+    iq -= 1 + 1j
+
+    return iq
+
+
+class AdsbCaptureWriter:
+    """Class for writing raw IQ bytes to a capture file"""
+
+    def __init__(
+        self,
+        path,
+        sample_rate=adsb_rtlsdr.SAMPLE_RATE,
+        center_frequency=adsb_rtlsdr.CENTER_FREQUENCY,
+        header=True
+    ):
+        self.file = open(path, "wb")
+
+        if header:
+            self.file.write(struct.pack(
+                HEADER_FORMAT,
+                HEADER_MAGIC,
+                HEADER_VERSION,
+                sample_rate,
+                center_frequency
+            ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def write(self, data):
+        """Appends interleaved unsigned 8 bit IQ bytes to the capture"""
+        self.file.write(numpy.asarray(data, dtype=numpy.uint8).tobytes())
+
+
+class AdsbCaptureReader:
+    """
+    Class for replaying a capture file.
+
+    The IQ bytes are memory-mapped rather than read, so opening a capture is
+    instant regardless of its size and only the chunk being decoded is ever
+    paged into memory.
+    """
+
+    def __init__(self, path):
+        self.sample_rate = adsb_rtlsdr.SAMPLE_RATE
+        self.center_frequency = adsb_rtlsdr.CENTER_FREQUENCY
+
+        with open(path, "rb") as file:
+            header = file.read(HEADER_LENGTH)
+            file.seek(0, 2)
+            size = file.tell()
+
+        offset = 0
+        if len(header) == HEADER_LENGTH and header[:4] == HEADER_MAGIC:
+            _, _, self.sample_rate, self.center_frequency = struct.unpack(
+                HEADER_FORMAT, header)
+            offset = HEADER_LENGTH
+
+        # drop a trailing I without its Q
+        length = (size - offset) // SAMPLE_BYTES * SAMPLE_BYTES
+
+        if length:
+            self.data = numpy.memmap(
+                path, dtype=numpy.uint8, mode="r", offset=offset, shape=(length,))
+        else:
+            self.data = numpy.zeros(0, dtype=numpy.uint8)
+
+    def __len__(self):
+        """Returns the number of IQ samples in the capture"""
+        return len(self.data) // SAMPLE_BYTES
+
+    def chunks(self, chunk_size=adsb_parser.CHUNK_SIZE):
+        """Yields the raw IQ bytes of the capture in chunks of samples"""
+
+        step = chunk_size * SAMPLE_BYTES
+        for start in range(0, len(self.data), step):
+            yield self.data[start:start + step]
+
+    def samples(self, chunk_size=adsb_parser.CHUNK_SIZE):
+        """Yields the capture as chunks of complex samples"""
+
+        for chunk in self.chunks(chunk_size):
+            yield bytes_to_iq(chunk)
+
+    def magnitudes(self, chunk_size=adsb_parser.CHUNK_SIZE):
+        """Yields the capture as chunks of float32 magnitudes"""
+
+        for chunk in self.chunks(chunk_size):
+            yield adsb_rtlsdr.bytes_to_magnitude(chunk)
+
+    def messages(self, chunk_size=adsb_parser.CHUNK_SIZE, start_time=0):
+        """
+        Decodes the capture and yields its ADS-B messages. Messages are
+        timestamped by their position in the capture, in seconds from
+        start_time.
+        """
+
+        parser = adsb_oversampled.streaming_parser(
+            self.sample_rate, chunk_size=chunk_size)
+        received = start_time
+
+        for chunk in self.chunks(chunk_size):
+            received += len(chunk) // SAMPLE_BYTES / self.sample_rate
+            yield from parser.feed_bytes(chunk, received)
+
+        yield from parser.flush()
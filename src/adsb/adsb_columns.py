@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+"""
+Decodes the fields of a whole batch of Mode S messages into NumPy columns.
+
+Every message is a row of a 2-D uint8 array of 14 bytes, the same layout the
+parser demodulates into. The parser hands its messages out as AdsbMessages
+batches, which keep that array as a column and only build hex messages for
+the code that reads them, so the columns of a batch are decoded without
+parsing the hex back. The bits of all the rows are unpacked at once and every
+field is read for all the messages of the type codes that carry it with
+vectorized bit operations, instead of calling pyModeS on one hex string at a
+time. Columns hold NaN, -1 or an empty string where a message does not carry
+the field.
+
+    bits    field
+    0-4     downlink format (DF)
+    8-31    ICAO address of DF11/17/18
+    32-36   ADS-B type code (TC)
+    32-87   ADS-B message (ME)
+
+https://mode-s.org/decode/content/ads-b/1-basics.html
+"""
+
+import collections.abc
+
+import adsb_crc
+import adsb_record
+import adsb_tracker
+import numpy
+
+# Characters of the 6 bit callsign alphabet, # marks an invalid character
+# https://mode-s.org/decode/content/ads-b/2-identification.html
+CALLSIGN_CHARACTERS = numpy.frombuffer(
+    b"#ABCDEFGHIJKLMNOPQRSTUVWXYZ#####_###############0123456789######",
+    dtype="S1"
+)
+CALLSIGN_LENGTH = 8
+
+# Speed types of the speed column
+GROUND_SPEED = 0
+INDICATED_AIRSPEED = 1
+TRUE_AIRSPEED = 2
+
+FEET_PER_METER = 3.28084
+
+# Type codes of airborne positions with barometric altitude, the higher ones
+# carry the GNSS height in meters
+BAROMETRIC_TYPECODES = range(9, 19)
+
+
+def bit_field(bits, start, count):
+    """Returns the unsigned integer of count bits from start of every row"""
+
+    weights = 1 << numpy.arange(count - 1, -1, -1, dtype=numpy.int64)
+    return bits[:, start:start + count].astype(numpy.int64) @ weights
+
+
+def message_lengths(frames):
+    """Returns the length in bits of every message from its downlink format"""
+
+    return numpy.where(
+        frames[:, 0] >> 3 >= 16,
+        adsb_crc.LONG_MESSAGE_BITS,
+        adsb_crc.SHORT_MESSAGE_BITS
+    )
+
+
+class AdsbMessages(collections.abc.Sequence):
+    """
+    Class for a batch of parser messages, held as columns:
+
+        frames      (N, 14) uint8 array of the message bytes
+        lengths     length of every message in bits
+        timestamps  time of every message
+        levels      signal level of every message
+        positions   fractional sample position of every message in the
+                    buffer it was decoded from, NaN when unknown
+        sources     source ID of every message or None
+
+    The batch is also the sequence of [message, timestamp, signal level]
+    lists the rest of the receiver takes, followed by the source ID once
+    tagged with one. Those lists and their hex messages are only built when
+    the batch is iterated or indexed, so the code that reads the columns
+    never pays for them.
+
+    A batch is never changed in place; select, tag and concatenate return
+    new batches.
+    """
+
+    def __init__(
+        self,
+        frames,
+        lengths,
+        timestamps,
+        levels,
+        positions=None,
+        sources=None
+    ):
+        self.frames = frames
+        self.lengths = numpy.asarray(lengths, dtype=numpy.intp)
+        self.timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+        self.levels = numpy.asarray(levels, dtype=numpy.float64)
+        self.positions = numpy.full(len(frames), numpy.nan) \
+            if positions is None else numpy.asarray(positions, numpy.float64)
+        self.sources = sources
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.select(numpy.arange(len(self))[index])
+
+        index = range(len(self))[index]
+        return self.row(
+            self.frames[index, :self.lengths[index] // 8].tobytes().hex()
+            .upper(),
+            index
+        )
+
+    def __iter__(self):
+        # the hex of the whole batch is built in one call and sliced
+        text = self.frames.tobytes().hex().upper()
+        width = 2 * self.frames.shape[1] if self.frames.ndim == 2 else 0
+
+        for index, digits in enumerate((self.lengths // 4).tolist()):
+            start = index * width
+            yield self.row(text[start:start + digits], index)
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"AdsbMessages({list(self)!r})"
+
+    def row(self, message, index):
+        """Returns the message list of the hex message at index"""
+
+        row = [
+            message,
+            float(self.timestamps[index]),
+            float(self.levels[index])
+        ]
+        if self.sources is not None:
+            row.append(self.sources[index])
+
+        return row
+
+    @classmethod
+    def empty(cls):
+        """Returns a batch without messages"""
+
+        return cls(
+            numpy.zeros((0, adsb_crc.MESSAGE_BYTES), dtype=numpy.uint8),
+            [], [], [])
+
+    @classmethod
+    def concatenate(cls, batches):
+        """Returns the messages of several batches as a single batch"""
+
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        sources = None
+        if all(batch.sources is not None for batch in batches):
+            sources = numpy.concatenate([batch.sources for batch in batches])
+
+        return cls(
+            numpy.concatenate([batch.frames for batch in batches]),
+            numpy.concatenate([batch.lengths for batch in batches]),
+            numpy.concatenate([batch.timestamps for batch in batches]),
+            numpy.concatenate([batch.levels for batch in batches]),
+            numpy.concatenate([batch.positions for batch in batches]),
+            sources
+        )
+
+    def select(self, indexes):
+        """Returns the messages at the given indexes or mask as a batch"""
+
+        indexes = numpy.asarray(indexes)
+        if indexes.dtype == bool:
+            indexes = numpy.flatnonzero(indexes)
+        indexes = indexes.astype(numpy.intp)
+
+        return AdsbMessages(
+            self.frames[indexes],
+            self.lengths[indexes],
+            self.timestamps[indexes],
+            self.levels[indexes],
+            self.positions[indexes],
+            None if self.sources is None else self.sources[indexes]
+        )
+
+    def tag(self, source_id):
+        """Returns the batch with the source ID appended to every message"""
+
+        sources = numpy.empty(len(self), dtype=object)
+        sources[:] = source_id
+
+        return AdsbMessages(
+            self.frames,
+            self.lengths,
+            self.timestamps,
+            self.levels,
+            self.positions,
+            sources
+        )
+
+
+def as_batch(messages):
+    """
+    Returns parser messages as an AdsbMessages batch, as they are when they
+    already are one. The hex messages of any other list are parsed, and the
+    source IDs kept when every message carries one.
+    """
+
+    if isinstance(messages, AdsbMessages):
+        return messages
+
+    frames = numpy.zeros((len(messages), adsb_crc.MESSAGE_BYTES), numpy.uint8)
+
+    for row, message in enumerate(messages):
+        data = bytes.fromhex(message[0])
+        frames[row, :len(data)] = numpy.frombuffer(data, dtype=numpy.uint8)
+
+    sources = None
+    if messages and all(len(message) > 3 for message in messages):
+        sources = numpy.empty(len(messages), dtype=object)
+        sources[:] = [message[3] for message in messages]
+
+    return AdsbMessages(
+        frames,
+        [len(message[0]) * 4 for message in messages],
+        [message[1] for message in messages],
+        [message[2] for message in messages],
+        sources=sources
+    )
+
+
+def frames_from_messages(messages):
+    """Returns the parser messages as an (N, 14) uint8 array"""
+    return as_batch(messages).frames
+
+
+def icao_addresses(frames, lengths=None):
+    """
+    Returns the ICAO address of every message. The address of formats that
+    overlay it on the parity is the syndrome, the same as
+    adsb_record.icao_address.
+    """
+
+    if lengths is None:
+        lengths = message_lengths(frames)
+
+    icao = (
+        (frames[:, 1].astype(numpy.uint32) << 16)
+        | (frames[:, 2].astype(numpy.uint32) << 8)
+        | frames[:, 3]
+    )
+
+    parity = ~numpy.isin(frames[:, 0] >> 3, adsb_record.ADDRESS_FORMATS)
+    icao[parity] = adsb_crc.syndromes(frames[parity], lengths[parity])
+
+    return icao
+
+
+def decode_altitude(bits, typecodes):
+    """Returns the altitude in feet of airborne position rows"""
+
+    altitude = numpy.full(len(bits), numpy.nan)
+    code = bit_field(bits, 40, 12)
+
+    # 25 ft increments when the Q bit is set, the 100 ft Gillham code of
+    # older transponders is left out
+    barometric = numpy.isin(typecodes, BAROMETRIC_TYPECODES) & (bits[:, 47] == 1)
+    increments = ((code >> 5) << 4) | (code & 0xF)
+    altitude[barometric] = increments[barometric] * 25 - 1000
+
+    gnss = (typecodes >= 20) & (typecodes <= 22)
+    altitude[gnss] = numpy.floor(code[gnss] * FEET_PER_METER)
+
+    altitude[code == 0] = numpy.nan
+
+    return altitude
+
+
+def decode_callsign(bits):
+    """
+    Returns the callsign of identification rows, without invalid characters
+    and trailing spaces
+    """
+
+    # numpy.char.replace fails on an empty array
+    if not len(bits):
+        return numpy.empty(0, dtype=f"U{CALLSIGN_LENGTH}")
+
+    codes = numpy.stack([
+        bit_field(bits, 40 + 6 * index, 6)
+        for index in range(CALLSIGN_LENGTH)
+    ], axis=1)
+
+    # one 8 byte string per row
+    callsigns = numpy.ascontiguousarray(CALLSIGN_CHARACTERS[codes]).view(
+        f"S{CALLSIGN_LENGTH}")[:, 0]
+
+    return numpy.char.rstrip(
+        numpy.char.replace(callsigns, b"#", b""), b"_").astype(
+            f"U{CALLSIGN_LENGTH}")
+
+
+def decode_velocity(bits):
+    """
+    Returns the speed in knots, heading or track in degrees, vertical rate in
+    ft/min and speed type of airborne velocity rows
+    """
+
+    # Subtypes 1 and 2 carry the ground speed, 3 and 4 the airspeed, 2 and 4
+    # in units of 4 knots for supersonic aircraft. The others are reserved.
+    subtype = bit_field(bits, 37, 3)
+    supersonic = numpy.where((subtype == 2) | (subtype == 4), 4, 1)
+    ground = (subtype == 1) | (subtype == 2)
+    airspeed = (subtype == 3) | (subtype == 4)
+
+    speed = numpy.full(len(bits), numpy.nan)
+    heading = numpy.full(len(bits), numpy.nan)
+
+    # Ground speed is sent as signed east-west and north-south components
+    east = bit_field(bits, 46, 10)
+    north = bit_field(bits, 57, 10)
+    valid = ground & (east > 0) & (north > 0)
+
+    east = numpy.where(bits[:, 45] == 1, -1, 1) * (east - 1) * supersonic
+    north = numpy.where(bits[:, 56] == 1, -1, 1) * (north - 1) * supersonic
+
+    speed[valid] = numpy.floor(numpy.hypot(east, north)[valid])
+    heading[valid] = numpy.degrees(numpy.arctan2(east, north)[valid]) % 360
+
+    # Airspeed is sent with the magnetic heading, if available
+    value = bit_field(bits, 57, 10)
+    speed = numpy.where(
+        airspeed & (value > 0), (value - 1) * supersonic, speed)
+    heading = numpy.where(
+        airspeed & (bits[:, 45] == 1),
+        bit_field(bits, 46, 10) / 1024 * 360,
+        heading
+    )
+
+    speed_type = numpy.select(
+        [ground, airspeed & (bits[:, 56] == 1), airspeed],
+        [GROUND_SPEED, TRUE_AIRSPEED, INDICATED_AIRSPEED],
+        -1
+    ).astype(numpy.int8)
+
+    rate = bit_field(bits, 69, 9)
+    vertical_rate = numpy.where(
+        rate > 0,
+        numpy.where(bits[:, 68] == 1, -1, 1) * (rate - 1) * 64.0,
+        numpy.nan
+    )
+
+    return speed, heading, vertical_rate, speed_type
+
+
+def decode(frames, lengths=None):
+    """
+    Returns a dict of columns of the fields of every message in frames. The
+    message lengths are computed from the downlink format when not given.
+    """
+
+    count = len(frames)
+    if lengths is None:
+        lengths = message_lengths(frames)
+
+    bits = numpy.unpackbits(frames, axis=1)
+    downlink_format = (frames[:, 0] >> 3).astype(numpy.int8)
+
+    adsb = numpy.isin(downlink_format, adsb_tracker.ADSB_DOWNLINK_FORMATS) & (
+        lengths == adsb_crc.LONG_MESSAGE_BITS)
+    typecode = numpy.where(adsb, frames[:, 4] >> 3, -1).astype(numpy.int8)
+
+    columns = {
+        "downlink_format": downlink_format,
+        "icao": icao_addresses(frames, lengths),
+        "typecode": typecode,
+        "altitude": numpy.full(count, numpy.nan),
+        "callsign": numpy.full(count, "", dtype=f"U{CALLSIGN_LENGTH}"),
+        "speed": numpy.full(count, numpy.nan),
+        "heading": numpy.full(count, numpy.nan),
+        "vertical_rate": numpy.full(count, numpy.nan),
+        "speed_type": numpy.full(count, -1, dtype=numpy.int8),
+        "cpr_odd": numpy.zeros(count, dtype=bool),
+        "cpr_latitude": numpy.full(count, -1, dtype=numpy.int32),
+        "cpr_longitude": numpy.full(count, -1, dtype=numpy.int32),
+    }
+
+    groups = group_by_typecode(typecode)
+
+    rows = rows_of(groups, adsb_tracker.IDENTIFICATION_TYPECODES)
+    columns["callsign"][rows] = decode_callsign(bits[rows])
+
+    rows = rows_of(groups, [adsb_tracker.VELOCITY_TYPECODE])
+    (
+        columns["speed"][rows],
+        columns["heading"][rows],
+        columns["vertical_rate"][rows],
+        columns["speed_type"][rows],
+    ) = decode_velocity(bits[rows])
+
+    rows = rows_of(groups, adsb_tracker.AIRBORNE_POSITION_TYPECODES)
+    columns["altitude"][rows] = decode_altitude(bits[rows], typecode[rows])
+
+    rows = numpy.concatenate([
+        rows,
+        rows_of(groups, adsb_tracker.SURFACE_POSITION_TYPECODES)
+    ])
+    columns["cpr_odd"][rows] = bits[rows, 53] == 1
+    columns["cpr_latitude"][rows] = bit_field(bits[rows], 54, 17)
+    columns["cpr_longitude"][rows] = bit_field(bits[rows], 71, 17)
+
+    return columns
+
+
+def group_by_typecode(typecodes):
+    """Returns the row indexes of every type code in the batch"""
+
+    order = numpy.argsort(typecodes, kind="stable")
+    values, starts = numpy.unique(typecodes[order], return_index=True)
+
+    return dict(zip(values.tolist(), numpy.split(order, starts[1:])))
+
+
+def rows_of(groups, typecodes):
+    """Returns the row indexes of the given type codes, in row order"""
+
+    rows = [groups[typecode] for typecode in typecodes if typecode in groups]
+    if not rows:
+        return numpy.empty(0, dtype=numpy.intp)
+
+    return numpy.sort(numpy.concatenate(rows))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+This Python script joins a Kafka consumer group reading the raw IQ blocks
+published by a producer in raw mode, decodes them and publishes the ADS-B
+messages to the same topic a decoding producer would. Every block is
+decoded on its own, so decoding scales out by starting more consumers, up
+to one per partition of the raw topic.
+
+Replies that overlay their parity with the ICAO address, DF0/4/5/16/20/21,
+are only accepted for aircraft the consumer has heard in a DF11/DF17 message
+of the blocks it decoded itself, so a consumer rejects them for the first
+few blocks and for aircraft whose extended squitters land on other members
+of the group.
+"""
+
+# Python Standard Libraries
+import os
+import sys
+
+import adsb_parser
+import adsb_producer
+import adsb_raw
+import kafka
+
+BOOTSTRAP_SERVERS = os.environ.get("ADSB_KAFKA_SERVERS")
+KAFKA_TOPIC = os.environ.get("ADSB_KAFKA_TOPIC")
+RAW_TOPIC = os.environ.get("ADSB_RAW_TOPIC")
+CONSUMER_GROUP = os.environ.get("ADSB_CONSUMER_GROUP", "adsb-decoder")
+
+# A block record is about 512 kB, above the default fetch size per partition
+MAX_PARTITION_FETCH_BYTES = 4 * 1024 * 1024
+
+
+class AdsbDecoderConsumer:
+    """Class decoding raw IQ block records into published messages"""
+
+    def __init__(self, consumer, producer):
+        self.consumer = consumer
+        self.producer = producer
+        self.parser = adsb_parser.AdsbParser()
+
+        # number of blocks decoded and messages published
+        self.blocks = 0
+        self.messages = 0
+
+    def decode(self, record):
+        """Returns the ADS-B messages of a block record"""
+        return adsb_raw.decode_messages(self.parser, record)
+
+    def run(self):
+        """Decodes the records of the consumer until it stops"""
+
+        try:
+            for record in self.consumer:
+                messages = self.decode(record.value)
+                self.blocks += 1
+
+                if messages:
+                    self.producer.publish(messages)
+                    self.messages += len(messages)
+        finally:
+            self.producer.producer.flush()
+            self.consumer.close()
+
+
+def main() -> int:
+    """
+        The main method to initiate application execution
+    """
+
+    consumer = kafka.KafkaConsumer(
+        RAW_TOPIC,
+        bootstrap_servers=BOOTSTRAP_SERVERS,
+        group_id=CONSUMER_GROUP,
+        max_partition_fetch_bytes=MAX_PARTITION_FETCH_BYTES
+    )
+
+    producer = adsb_producer.AdsbProducer()
+    producer.configure(BOOTSTRAP_SERVERS)
+    producer.set_topic(KAFKA_TOPIC)
+
+    try:
+        AdsbDecoderConsumer(consumer, producer).run()
+    except KeyboardInterrupt:
+        print('Aborted manually.', file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
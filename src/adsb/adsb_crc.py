@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+Mode S Cyclic Redundancy Check (CRC) for whole batches of messages.
+
+The last 24 bits of every Mode S message are parity bits computed with the
+generator polynomial 0x1FFF409 over the rest of the message. Recomputing the
+CRC over the data bits and combining it with the received parity gives the
+syndrome. For DF17 the syndrome of a correct message is 0. For DF4/5/20/21 the
+parity is overlaid with the ICAO address, so the syndrome is the address, and
+for DF11 it is the interrogator identifier.
+
+Every message of the batch is a row of a 2-D uint8 array of 14 bytes, short
+56 bit messages only use the first 7 bytes.
+
+https://mode-s.org/decode/content/ads-b/8-error-control.html
+"""
+
+import numpy
+
+# Mode S generator polynomial, the leading 25th bit included
+CRC_GENERATOR = 0x1FFF409
+
+CRC_BITS = 24
+CRC_BYTES = CRC_BITS // 8
+CRC_MASK = (1 << CRC_BITS) - 1
+
+LONG_MESSAGE_BITS = 112
+SHORT_MESSAGE_BITS = 56
+MESSAGE_BYTES = LONG_MESSAGE_BITS // 8
+
+# The downlink format is never corrected since a bit error there means the
+# message is not the format it claims to be.
+DOWNLINK_FORMAT_BITS = 5
+
+
+def build_crc_table():
+    """Returns the 24 bit CRC of every possible leading byte"""
+
+    table = numpy.zeros(256, dtype=numpy.uint32)
+
+    for byte in range(256):
+        crc = byte << (CRC_BITS - 8)
+        for _ in range(8):
+            crc <<= 1
+            if crc & (1 << CRC_BITS):
+                crc ^= CRC_GENERATOR
+        table[byte] = crc
+
+    return table
+
+
+CRC_TABLE = build_crc_table()
+CRC_LIST = CRC_TABLE.tolist()
+
+
+def checksum(frames, data_bytes):
+    """
+    Returns the CRC of the first data_bytes bytes of every row, processing a
+    byte of all the rows at a time through the CRC table.
+    """
+
+    crc = numpy.zeros(len(frames), dtype=numpy.uint32)
+
+    for column in range(data_bytes):
+        index = (crc >> (CRC_BITS - 8)) ^ frames[:, column]
+        crc = ((crc << 8) & CRC_MASK) ^ CRC_TABLE[index]
+
+    return crc
+
+
+def parity(frames, data_bytes):
+    """Returns the 24 parity bits that follow the data bytes of every row"""
+
+    parity_bytes = frames[:, data_bytes:data_bytes + CRC_BYTES].astype(
+        numpy.uint32)
+
+    return (
+        (parity_bytes[:, 0] << 16)
+        | (parity_bytes[:, 1] << 8)
+        | parity_bytes[:, 2]
+    )
+
+
+def syndromes(frames, lengths):
+    """
+    Returns the syndrome of every message given as a row of frames with its
+    length in bits. Rows with any other length than 56 or 112 bits are given
+    a syndrome of 0 and should be discarded by the caller.
+    """
+
+    result = numpy.zeros(len(frames), dtype=numpy.uint32)
+
+    for bits in (SHORT_MESSAGE_BITS, LONG_MESSAGE_BITS):
+        rows = lengths == bits
+        if not rows.any():
+            continue
+
+        data_bytes = bits // 8 - CRC_BYTES
+        selected = frames[rows]
+        result[rows] = checksum(selected, data_bytes) ^ parity(
+            selected, data_bytes)
+
+    return result
+
+
+def syndrome(frame):
+    """
+    Returns the syndrome of a single 7 or 14 byte message, without the
+    overhead of building an array.
+    """
+
+    data_bytes = len(frame) - CRC_BYTES
+    crc = 0
+
+    for byte in frame[:data_bytes]:
+        index = (crc >> (CRC_BITS - 8)) ^ byte
+        crc = ((crc << 8) & CRC_MASK) ^ CRC_LIST[index]
+
+    return crc ^ int.from_bytes(frame[data_bytes:], "big")
+
+
+def build_error_table():
+    """
+    Returns the syndromes of every correctable single bit error of a 112 bit
+    message, sorted, along with the position of the flipped bit.
+    """
+
+    positions = numpy.arange(DOWNLINK_FORMAT_BITS, LONG_MESSAGE_BITS)
+
+    errors = numpy.zeros((len(positions), LONG_MESSAGE_BITS), dtype=bool)
+    errors[numpy.arange(len(positions)), positions] = True
+
+    lengths = numpy.full(len(positions), LONG_MESSAGE_BITS)
+    error_syndromes = syndromes(numpy.packbits(errors, axis=1), lengths)
+
+    order = numpy.argsort(error_syndromes)
+    return error_syndromes[order], positions[order]
+
+
+ERROR_SYNDROMES, ERROR_POSITIONS = build_error_table()
+
+
+def correct_single_bit(frames, frame_syndromes, rows):
+    """
+    Fixes a single bit error in the selected 112 bit rows of frames in place,
+    using the syndrome to find the flipped bit.
+
+    Returns a mask of the rows that were corrected. Rows whose syndrome is
+    not the result of a single bit error are left untouched.
+    """
+
+    corrected = numpy.zeros(len(frames), dtype=bool)
+
+    candidates = numpy.flatnonzero(rows)
+    if not len(candidates):
+        return corrected
+
+    candidate_syndromes = frame_syndromes[candidates]
+    index = numpy.searchsorted(ERROR_SYNDROMES, candidate_syndromes)
+    index[index == len(ERROR_SYNDROMES)] = 0
+
+    found = ERROR_SYNDROMES[index] == candidate_syndromes
+    candidates = candidates[found]
+    positions = ERROR_POSITIONS[index[found]]
+
+    frames[candidates, positions >> 3] ^= (0x80 >> (positions & 7)).astype(
+        numpy.uint8)
+    frame_syndromes[candidates] = 0
+    corrected[candidates] = True
+
+    return corrected
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Suppresses duplicate messages before they are published.
+
+Aircraft repeat identical squitters and a reply can be decoded twice, so the
+same raw frame is often decoded more than once within a short time. A frame
+is only passed on when the same frame was not passed on within the window
+before it. The frames seen are kept in a fixed-size hash table, every frame
+overwriting the slot its hash points to, so memory stays constant however many
+aircraft are heard. A collision only forgets the older frame, which lets a
+duplicate through rather than suppressing a new frame.
+
+Optionally the ADS-B messages of every aircraft are rate limited by kind, for
+example one position per aircraft every 0.5 seconds, using a second table of
+the same kind keyed by ICAO address and kind. Positions are limited per CPR
+format, even and odd apart, since the tracker needs a recent frame of both
+to decode a global position. Limiting them together could keep passing the
+parity that happens to arrive first and never the other one.
+"""
+
+import itertools
+
+import adsb_columns
+import adsb_crc
+import adsb_tracker
+import numpy
+
+# Seconds within which a repeated frame is a duplicate
+WINDOW = 1.0
+
+# Number of slots of the hash tables, a few seconds of traffic at a busy site
+SLOTS = 4096
+
+IDENTIFICATION = "identification"
+SURFACE_POSITION = "surface-position"
+AIRBORNE_POSITION = "airborne-position"
+VELOCITY = "velocity"
+
+# Kind of every ADS-B type code
+KINDS = {
+    **dict.fromkeys(adsb_tracker.IDENTIFICATION_TYPECODES, IDENTIFICATION),
+    **dict.fromkeys(adsb_tracker.SURFACE_POSITION_TYPECODES, SURFACE_POSITION),
+    **dict.fromkeys(
+        adsb_tracker.AIRBORNE_POSITION_TYPECODES, AIRBORNE_POSITION),
+    adsb_tracker.VELOCITY_TYPECODE: VELOCITY,
+}
+
+# Example rate limit of one even and one odd position per aircraft every 0.5
+# seconds
+POSITION_RATE_LIMITS = {SURFACE_POSITION: 0.5, AIRBORNE_POSITION: 0.5}
+
+POSITION_KINDS = [SURFACE_POSITION, AIRBORNE_POSITION]
+
+
+def rate_keys(batch):
+    """
+    Returns the (ICAO address, kind, odd) key of every message of a batch
+    the rate limits apply to, None for the others. odd is the CPR format of
+    positions and None for the other kinds.
+    """
+
+    frames = batch.frames
+
+    adsb = numpy.isin(frames[:, 0] >> 3, adsb_tracker.ADSB_DOWNLINK_FORMATS) \
+        & (batch.lengths == adsb_crc.LONG_MESSAGE_BITS)
+
+    rows = zip(
+        adsb.tolist(),
+        adsb_columns.icao_addresses(frames, batch.lengths).tolist(),
+        (frames[:, 4] >> 3).tolist(),
+        (frames[:, 6] & 0x04 != 0).tolist()
+    )
+
+    keys = []
+    for is_adsb, icao, typecode, odd in rows:
+        kind = KINDS.get(typecode) if is_adsb else None
+
+        if kind is None:
+            keys.append(None)
+        else:
+            keys.append((icao, kind, odd if kind in POSITION_KINDS else None))
+
+    return keys
+
+
+class HashWindow:
+    """Class for a fixed-size table remembering when a key was last seen"""
+
+    def __init__(self, slots=SLOTS):
+        self.keys = [None] * slots
+        self.times = [0.0] * slots
+
+    def seen(self, key, timestamp, window):
+        """
+        Returns if the key was seen less than window seconds before the
+        timestamp, otherwise records it as seen at the timestamp.
+        """
+
+        slot = hash(key) % len(self.keys)
+
+        if self.keys[slot] == key and 0 <= timestamp - self.times[slot] < window:
+            return True
+
+        self.keys[slot] = key
+        self.times[slot] = timestamp
+
+        return False
+
+
+class AdsbDeduplicator:
+    """
+    Class filtering duplicate and rate limited messages out of batches of
+    parser messages.
+
+    rate_limits maps a message kind to the minimum seconds between two
+    messages of that kind from the same aircraft. A window of 0 passes
+    duplicates on, leaving only the rate limits.
+    """
+
+    def __init__(self, window=WINDOW, rate_limits=None, slots=SLOTS):
+        self.window = window
+        self.rate_limits = rate_limits or {}
+
+        self.frames = HashWindow(slots)
+        self.kinds = HashWindow(slots)
+
+        # number of messages suppressed as duplicates and by the rate limits
+        self.duplicates = 0
+        self.limited = 0
+
+    def is_limited(self, key, timestamp):
+        """Returns if a message exceeds the rate limit of its key"""
+
+        if key is None or key[1] not in self.rate_limits:
+            return False
+
+        return self.kinds.seen(key, timestamp, self.rate_limits[key[1]])
+
+    def filter(self, messages):
+        """
+        Returns the messages of a batch that are neither duplicates nor rate
+        limited, as a batch when given an adsb_columns.AdsbMessages batch.
+        Frames are compared by their bytes, read from the columns of the
+        batch.
+        """
+
+        batch = adsb_columns.as_batch(messages)
+
+        # the bytes of the whole batch are copied once and sliced
+        data = batch.frames.tobytes()
+        width = adsb_crc.MESSAGE_BYTES
+
+        keys = rate_keys(batch) if self.rate_limits \
+            else itertools.repeat(None)
+
+        passed = []
+
+        for index, (length, timestamp, key) in enumerate(zip(
+                (batch.lengths // 8).tolist(), batch.timestamps.tolist(),
+                keys)):
+            frame = data[index * width:index * width + length]
+
+            if self.frames.seen(frame, timestamp, self.window):
+                self.duplicates += 1
+            elif self.is_limited(key, timestamp):
+                self.limited += 1
+            else:
+                passed.append(index)
+
+        if isinstance(messages, adsb_columns.AdsbMessages):
+            return batch.select(passed)
+
+        return [messages[index] for index in passed]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+Optional diagnostic plots of the signal the decoder sees.
+
+Plots are rendered to PNG files by a background thread at a limited rate, one
+Power Spectral Density (PSD) plot every psd_interval seconds and one preamble
+pulse plot every pulse_interval seconds of signal, so the decoder can run
+with diagnostics on a headless receiver. matplotlib is only imported when
+the first plot is rendered; a parser without diagnostics never touches it.
+
+https://pysdr.org/content/frequency_domain.html
+"""
+
+import concurrent.futures
+import importlib
+import os
+
+import adsb_rtlsdr
+
+# The divisional value of a single microsecond .000001, also represented by the
+# symbol μs.
+MICROSECOND = 1e6
+
+# Seconds of signal between two plots of the same kind
+PSD_INTERVAL = 60
+PULSE_INTERVAL = 10
+
+DIRECTORY = "target/diagnostics"
+
+
+def pyplot():
+    """Imports matplotlib.pyplot on first use, for interactive plots"""
+    return importlib.import_module("matplotlib.pyplot")
+
+
+def plot_psd(samples):
+    """Use matplotlib to estimate and plot the PSD"""
+
+    pyplot().psd(
+        samples,
+        NFFT=1024,
+        Fs=adsb_rtlsdr.SAMPLE_RATE/MICROSECOND,
+        Fc=adsb_rtlsdr.CENTER_FREQUENCY/MICROSECOND
+    )
+    pyplot().xlabel('Frequency (MHz)')
+    pyplot().ylabel('Relative power (dB)')
+    pyplot().show()
+
+
+def render_psd(path, samples):
+    """Renders the PSD of the samples to a PNG file"""
+
+    figure = importlib.import_module("matplotlib.figure").Figure()
+    axes = figure.add_subplot()
+    axes.psd(
+        samples,
+        NFFT=1024,
+        Fs=adsb_rtlsdr.SAMPLE_RATE/MICROSECOND,
+        Fc=adsb_rtlsdr.CENTER_FREQUENCY/MICROSECOND
+    )
+    axes.set_xlabel('Frequency (MHz)')
+    axes.set_ylabel('Relative power (dB)')
+    figure.savefig(path)
+
+
+def render_pulses(path, samples):
+    """Renders the magnitudes of a preamble and its data to a PNG file"""
+
+    figure = importlib.import_module("matplotlib.figure").Figure()
+    axes = figure.add_subplot()
+    axes.plot(samples)
+    axes.set_xlabel('Sample')
+    axes.set_ylabel('Magnitude')
+    figure.savefig(path)
+
+
+class AdsbDiagnostics:
+    """
+    Class rendering sampled diagnostic plots off the decoding thread.
+
+    A plot is skipped rather than queued when the previous one is still
+    being rendered, so diagnostics never hold up decoding.
+    """
+
+    def __init__(
+        self,
+        directory=DIRECTORY,
+        psd_interval=PSD_INTERVAL,
+        pulse_interval=PULSE_INTERVAL
+    ):
+        self.directory = directory
+        self.psd_interval = psd_interval
+        self.pulse_interval = pulse_interval
+
+        os.makedirs(directory, exist_ok=True)
+
+        # time of the signal plotted last by each kind of plot
+        self.psd_time = None
+        self.pulse_time = None
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.rendering = None
+
+    def close(self):
+        """Waits for the plot being rendered"""
+        self.executor.shutdown()
+
+    def due(self, last, interval, timestamp):
+        """Returns if a plot is due and the renderer is free"""
+
+        if last is not None and timestamp - last < interval:
+            return False
+
+        return self.rendering is None or self.rendering.done()
+
+    def render(self, renderer, name, samples, timestamp):
+        """Renders a copy of the samples in the background"""
+
+        path = os.path.join(self.directory, f"{name}-{timestamp:.6f}.png")
+        self.rendering = self.executor.submit(
+            renderer, path, samples.copy())
+
+    def psd(self, samples, timestamp):
+        """Plots the PSD of the samples if one is due"""
+
+        if self.due(self.psd_time, self.psd_interval, timestamp):
+            self.psd_time = timestamp
+            self.render(render_psd, "psd", samples, timestamp)
+
+    def pulses(self, samples, timestamp):
+        """Plots the pulses of a preamble and its data if one is due"""
+
+        if self.due(self.pulse_time, self.pulse_interval, timestamp):
+            self.pulse_time = timestamp
+            self.render(render_pulses, "pulses", samples, timestamp)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+Serves the decoded messages to local clients over TCP in the two feed
+formats display, multilateration (MLAT) and feeder tools expect: the Beast
+binary format and the SBS-1 BaseStation text format.
+
+Every batch of messages is encoded once per format into a single buffer and
+the same buffer is written to every client of the format, so the cost per
+client is one write per batch. A client whose unsent data grows past the
+buffer limit is disconnected rather than slowing down the decoder.
+
+https://wiki.jetvision.de/wiki/Mode-S_Beast:Data_Output_Formats
+http://woodair.net/sbs/article/barebones42_socket_data.htm
+"""
+
+import asyncio
+import datetime
+
+import adsb_columns
+import adsb_tracker
+import pyModeS
+
+# Conventional ports of the feeds, the same as dump1090
+BEAST_PORT = 30005
+SBS_PORT = 30003
+
+# Bytes of unsent data a client may fall behind by before it is dropped
+CLIENT_BUFFER = 1024 * 1024
+
+# Beast frames start with an escape byte and the frame type, escape bytes in
+# the rest of the frame are doubled
+BEAST_ESCAPE = b"\x1a"
+BEAST_TYPES = {7: b"2", 14: b"3"}
+
+# Frequency of the 48 bit MLAT timestamp counter of a Beast frame
+BEAST_CLOCK = 12e6
+BEAST_CLOCK_MASK = (1 << 48) - 1
+
+# SBS-1 transmission types
+IDENTIFICATION = 1
+SURFACE_POSITION = 2
+AIRBORNE_POSITION = 3
+AIRBORNE_VELOCITY = 4
+SURVEILLANCE_ALTITUDE = 5
+SURVEILLANCE_IDENTITY = 6
+AIR_TO_AIR = 7
+ALL_CALL_REPLY = 8
+
+# SBS-1 transmission type of the short and long Mode S replies
+REPLY_TYPES = {
+    0: AIR_TO_AIR,
+    4: SURVEILLANCE_ALTITUDE,
+    5: SURVEILLANCE_IDENTITY,
+    11: ALL_CALL_REPLY,
+    16: AIR_TO_AIR,
+    20: SURVEILLANCE_ALTITUDE,
+    21: SURVEILLANCE_IDENTITY,
+}
+
+
+def beast_frame(frame, timestamp, signal_level):
+    """Returns the Beast binary frame of the bytes of a message"""
+
+    clock = int(timestamp * BEAST_CLOCK) & BEAST_CLOCK_MASK
+    level = min(max(int(signal_level * 255), 0), 255)
+
+    body = clock.to_bytes(6, "big") + bytes([level]) + frame
+
+    return BEAST_ESCAPE + BEAST_TYPES[len(frame)] + body.replace(
+        BEAST_ESCAPE, BEAST_ESCAPE * 2)
+
+
+def encode_beast(messages):
+    """Returns the Beast frames of a batch of messages as one buffer"""
+
+    batch = adsb_columns.as_batch(messages)
+
+    return b"".join(
+        beast_frame(frame[:length].tobytes(), timestamp, signal_level)
+        for frame, length, timestamp, signal_level in zip(
+            batch.frames,
+            (batch.lengths // 8).tolist(),
+            batch.timestamps.tolist(),
+            batch.levels.tolist()
+        )
+    )
+
+
+def sbs_value(value, digits=0):
+    """Returns a number as an SBS-1 field, empty when missing"""
+
+    if value is None or value != value:
+        return ""
+
+    return f"{value:.{digits}f}"
+
+
+def sbs_line(kind, icao, timestamp, **fields):
+    """Returns an SBS-1 MSG line of the given transmission type"""
+
+    time = datetime.datetime.fromtimestamp(timestamp)
+    date = time.strftime("%Y/%m/%d")
+    clock = time.strftime("%H:%M:%S.") + f"{time.microsecond // 1000:03d}"
+
+    return ",".join([
+        "MSG", str(kind), "1", "1", icao, "1",
+        date, clock, date, clock,
+        fields.get("callsign", ""),
+        fields.get("altitude", ""),
+        fields.get("speed", ""),
+        fields.get("track", ""),
+        fields.get("latitude", ""),
+        fields.get("longitude", ""),
+        fields.get("vertical_rate", ""),
+        fields.get("squawk", ""),
+        "", "", "",
+        fields.get("ground", ""),
+    ]) + "\r\n"
+
+
+def encode_sbs(messages, tracker):
+    """
+    Returns the SBS-1 lines of a batch of messages as one buffer. The fields
+    of the whole batch are decoded as columns and positions come from the
+    tracker, which decodes the CPR frames of every aircraft. An aircraft the
+    tracker already evicted again within the batch is reported from the
+    columns, without a position.
+    """
+
+    batch = adsb_columns.as_batch(messages)
+    columns = adsb_columns.decode(batch.frames, batch.lengths)
+    tracker.update_columns(batch, columns)
+
+    rows = zip(
+        range(len(batch)),
+        batch.timestamps.tolist(),
+        columns["downlink_format"].tolist(),
+        columns["icao"].tolist(),
+        columns["typecode"].tolist(),
+        columns["callsign"].tolist(),
+        columns["altitude"].tolist(),
+        columns["speed"].tolist(),
+        columns["heading"].tolist(),
+        columns["vertical_rate"].tolist(),
+    )
+
+    lines = []
+    for (
+        index, timestamp, downlink_format, icao, typecode, callsign,
+        altitude, speed, heading, vertical_rate
+    ) in rows:
+        icao = f"{icao:06X}"
+
+        if typecode in adsb_tracker.IDENTIFICATION_TYPECODES:
+            lines.append(sbs_line(
+                IDENTIFICATION, icao, timestamp, callsign=callsign))
+
+        elif typecode == adsb_tracker.VELOCITY_TYPECODE:
+            lines.append(sbs_line(
+                AIRBORNE_VELOCITY, icao, timestamp,
+                speed=sbs_value(speed),
+                track=sbs_value(heading, 1),
+                vertical_rate=sbs_value(vertical_rate)
+            ))
+
+        elif typecode in adsb_tracker.AIRBORNE_POSITION_TYPECODES or \
+                typecode in adsb_tracker.SURFACE_POSITION_TYPECODES:
+            lines.append(position_line(
+                icao, tracker.get(icao), typecode, timestamp, altitude))
+
+        elif downlink_format in REPLY_TYPES:
+            lines.append(reply_line(
+                REPLY_TYPES[downlink_format], icao, batch[index][0],
+                timestamp))
+
+    return "".join(lines).encode()
+
+
+def position_line(icao, aircraft, typecode, timestamp, altitude):
+    """
+    Returns the SBS-1 line of a position message of the given tracked
+    aircraft, or None when it is no longer tracked
+    """
+
+    fields = {"altitude": sbs_value(altitude), "ground": "0"}
+    kind = AIRBORNE_POSITION
+
+    if typecode in adsb_tracker.SURFACE_POSITION_TYPECODES:
+        fields = {"ground": "-1"}
+        kind = SURFACE_POSITION
+
+    # only a position decoded from this very message is reported
+    if aircraft is not None and aircraft.position_time == timestamp:
+        fields["latitude"] = sbs_value(aircraft.latitude, 5)
+        fields["longitude"] = sbs_value(aircraft.longitude, 5)
+
+    return sbs_line(kind, icao, timestamp, **fields)
+
+
+def reply_line(kind, icao, message, timestamp):
+    """Returns the SBS-1 line of a Mode S surveillance or all-call reply"""
+
+    fields = {}
+    if kind in (SURVEILLANCE_ALTITUDE, AIR_TO_AIR):
+        fields["altitude"] = sbs_value(pyModeS.altcode(message))
+    elif kind == SURVEILLANCE_IDENTITY:
+        fields["squawk"] = pyModeS.idcode(message)
+
+    return sbs_line(kind, icao, timestamp, **fields)
+
+
+class FeedProtocol(asyncio.Protocol):
+    """Protocol of a feed client, which only ever receives"""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.clients.add(transport)
+
+    def connection_lost(self, exc):
+        self.clients.discard(self.transport)
+
+    def data_received(self, data):
+        """Anything sent by the client is ignored"""
+
+
+class AdsbFeeds:
+    """
+    Class serving the Beast and SBS-1 feeds. A port of None disables its
+    feed. publish must be called from the event loop the servers run on.
+    """
+
+    def __init__(
+        self,
+        beast_port=BEAST_PORT,
+        sbs_port=SBS_PORT,
+        host="localhost",
+        client_buffer=CLIENT_BUFFER
+    ):
+        self.ports = {"beast": beast_port, "sbs": sbs_port}
+        self.host = host
+        self.client_buffer = client_buffer
+
+        # transports of the connected clients of every feed
+        self.clients = {"beast": set(), "sbs": set()}
+        self.servers = []
+
+        self.tracker = adsb_tracker.AircraftTracker()
+
+        # number of clients dropped for falling behind
+        self.dropped = 0
+
+    async def start(self):
+        """Starts listening on the ports of the feeds"""
+
+        loop = asyncio.get_running_loop()
+
+        for feed, port in self.ports.items():
+            if port is None:
+                continue
+
+            clients = self.clients[feed]
+            self.servers.append(await loop.create_server(
+                lambda clients=clients: FeedProtocol(clients),
+                self.host,
+                port
+            ))
+
+    def close(self):
+        """Stops listening and disconnects every client"""
+
+        for server in self.servers:
+            server.close()
+
+        for clients in self.clients.values():
+            for transport in list(clients):
+                transport.close()
+
+    def publish(self, messages):
+        """
+        Encodes a batch of messages once per feed and sends it to every
+        client of the feed
+        """
+
+        if self.clients["beast"]:
+            self.send(self.clients["beast"], encode_beast(messages))
+
+        # the tracker only follows the aircraft while someone listens
+        if self.clients["sbs"]:
+            self.send(self.clients["sbs"], encode_sbs(messages, self.tracker))
+
+    def send(self, clients, buffer):
+        """Writes the same buffer to every client, dropping slow clients"""
+
+        for transport in list(clients):
+            if transport.get_write_buffer_size() > self.client_buffer:
+                self.dropped += 1
+                clients.discard(transport)
+                transport.abort()
+            else:
+                transport.write(buffer)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+"""
+Counters and histograms of the receiver pipeline, served over HTTP in the
+Prometheus text exposition format so the bottleneck of every receiver can be
+found under real traffic.
+
+Metrics are updated once per chunk or batch rather than once per sample or
+message, so they cost a few additions per chunk when enabled and nothing when
+the parser and pipeline run without them. An optional profiler runs every
+timed stage under its own cProfile.Profile and serves the statistics of each
+stage at /profile.
+
+https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+import bisect
+import contextlib
+import cProfile
+import http.server
+import io
+import pstats
+import threading
+import time
+
+# Upper bounds of the latency histograms in seconds, a 256k sample chunk is
+# 131 ms of signal
+LATENCY_BUCKETS = [
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+    5, 10
+]
+
+# Port of the metrics endpoint, the conventional range of Prometheus exporters
+PORT = 9109
+
+# Number of functions listed for every stage at /profile
+PROFILE_LINES = 25
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """
+    Class for a monotonically increasing count, optionally by label. The
+    values are updated by the pipeline and the send callbacks and read by
+    the HTTP server thread, so they are only touched under a lock.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, label=None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.values = {}
+        self.lock = threading.Lock()
+
+        if label is None:
+            self.inc(0)
+
+    def inc(self, amount=1, value=None):
+        """Adds amount to the count of the given label value"""
+
+        with self.lock:
+            self.values[value] = self.values.get(value, 0) + amount
+
+    def labels(self, value, extra=None):
+        """Returns the label set of a sample for the given label value"""
+
+        labels = []
+        if self.label is not None:
+            labels.append(f'{self.label}="{value}"')
+        if extra is not None:
+            labels.append(extra)
+
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def samples(self):
+        """Yields the exposition lines of every label value"""
+
+        with self.lock:
+            values = sorted(self.values.items(), key=str)
+
+        for value, count in values:
+            yield f"{self.name}{self.labels(value)} {count}"
+
+    def render(self):
+        """Returns the metric in the text exposition format"""
+
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self.samples())
+
+        return "\n".join(lines)
+
+
+class Histogram(Counter):
+    """Class for a distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label=None, buckets=None):
+        super().__init__(name, documentation, label)
+        self.buckets = buckets or LATENCY_BUCKETS
+        self.values = {}
+
+    def observe(self, amount, value=None):
+        """Adds an observation to the distribution of the given label value"""
+
+        bucket = bisect.bisect_left(self.buckets, amount)
+
+        with self.lock:
+            counts = self.values.get(value)
+            if counts is None:
+                # one count per bucket, the +Inf bucket, then the sum
+                counts = self.values[value] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+
+            counts[bucket] += 1
+            counts[-1] += amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(
+                ((value, list(counts)) for value, counts in self.values.items()),
+                key=str)
+
+        for value, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                labels = self.labels(value, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+
+            yield f"{self.name}_sum{self.labels(value)} {counts[-1]}"
+            yield f"{self.name}_count{self.labels(value)} {cumulative}"
+
+
+class AdsbMetrics:
+    """
+    Class holding the metrics of a receiver.
+
+    Stages are timed with the stage context manager. With profile set every
+    stage also runs under its own profiler; stages must not be nested then,
+    since a thread can only run one profiler at a time.
+    """
+
+    def __init__(self, profile=False):
+        self.samples_read = Counter(
+            "adsb_samples_read_total", "IQ samples read from the source")
+        self.samples_dropped = Counter(
+            "adsb_samples_dropped_total",
+            "IQ samples dropped by a full pipeline queue")
+        self.messages_dropped = Counter(
+            "adsb_messages_dropped_total",
+            "Messages dropped by a full pipeline queue")
+        self.candidates = Counter(
+            "adsb_preamble_candidates_total", "Preambles detected")
+        self.frames = Counter(
+            "adsb_frames_total",
+            "Demodulated frames by parity check result",
+            "result"
+        )
+        self.messages = Counter(
+            "adsb_messages_total",
+            "Valid messages by downlink format",
+            "df"
+        )
+        self.suppressed = Counter(
+            "adsb_messages_suppressed_total",
+            "Messages not published by reason",
+            "reason"
+        )
+        self.stages = Histogram(
+            "adsb_stage_seconds", "Time spent in every stage", "stage")
+        self.sent = Counter(
+            "adsb_kafka_sent_total", "Records delivered to the brokers")
+        self.send_errors = Counter(
+            "adsb_kafka_send_errors_total", "Records rejected by the brokers")
+        self.send_latency = Histogram(
+            "adsb_kafka_send_seconds",
+            "Time from sending a record to its acknowledgement"
+        )
+
+        self.profiles = {} if profile else None
+
+    def metrics(self):
+        """Returns every metric"""
+        return [value for value in vars(self).values()
+                if isinstance(value, Counter)]
+
+    def render(self):
+        """Returns every metric in the text exposition format"""
+        return "\n".join(metric.render() for metric in self.metrics()) + "\n"
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Times the body of the with statement as the given stage"""
+
+        profile = None
+        if self.profiles is not None:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.observe(time.perf_counter() - begin, name)
+            if profile is not None:
+                profile.disable()
+
+    def render_profiles(self, lines=PROFILE_LINES):
+        """Returns the top functions of every profiled stage by total time"""
+
+        output = io.StringIO()
+        for name, profile in sorted((self.profiles or {}).items()):
+            output.write(f"stage: {name}\n")
+            pstats.Stats(profile, stream=output).sort_stats(
+                "tottime").print_stats(lines)
+
+        return output.getvalue()
+
+    def serve(self, port=PORT, host="localhost"):
+        """
+        Serves the metrics at /metrics and the profiles at /profile from a
+        daemon thread and returns the server
+        """
+
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            """Handler answering the metrics and profile requests"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path == "/metrics":
+                    body = metrics.render()
+                elif self.path == "/profile" and metrics.profiles is not None:
+                    body = metrics.render_profiles()
+                else:
+                    self.send_error(404)
+                    return
+
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                """Scrapes are not logged"""
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        return server
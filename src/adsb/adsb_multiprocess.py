@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+"""
+Decodes ADS-B samples on every core of the receiver.
+
+A single reader copies the raw IQ bytes of the dongle into a ring of fixed
+size blocks in shared memory and a pool of worker processes decodes the
+blocks with AdsbParser. Only the slot index of a block is sent to a worker,
+the samples themselves are never copied between processes. Every block starts
+with the tail of the block before it, so messages that straddle two blocks are
+not lost, and the decoded messages are handed back in the order the blocks
+were read.
+
+The carried over tail is twice the length of a message, its second half is
+owned by the next block. A preamble hit inside the message of a hit accepted
+before it is skipped, the same as in the streaming parser, so which hits of
+a block are accepted depends on the last hit accepted in the block before.
+Blocks are decoded at the same time, so a worker follows the skipping from
+every hit of its block it may start at, up to a message past the start of
+the owned samples, until it joins the hits already followed, and decodes
+only those hits. The messages are handed back with where the skipping goes
+after every hit, and the reader keeps the hits that follow on from the last
+hit it accepted in the block before, so every hit is accepted exactly once.
+
+Every worker validates the address parity of DF0/4/5/16/20/21 replies with
+the ICAO addresses its own parser has heard in DF11/DF17 messages. Workers
+do not share them, so a worker rejects such replies of an aircraft until it
+has decoded a DF11/DF17 message of the aircraft itself, for the first few
+blocks after the start and for as long as an aircraft is only heard in
+blocks decoded by the other workers.
+
+https://docs.python.org/3/library/multiprocessing.shared_memory.html
+"""
+
+import collections
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+import queue
+import time
+
+import adsb_parser
+import adsb_rtlsdr
+import numpy
+
+# Number of bytes holding a single IQ sample
+SAMPLE_BYTES = 2
+
+# Samples at the end of a block that are not checked for a preamble, they are
+# checked at the start of the next block
+OVERLAP = adsb_parser.MESSAGE_LENGTH - 1
+
+# Samples carried over from the end of a block to the start of the next one,
+# the unchecked tail preceded by as much context
+CARRY = 2 * OVERLAP
+
+# Number of ring slots per worker, a few so workers are never left idle
+# while the reader fills the next block
+SLOTS_PER_WORKER = 4
+
+# Seconds without results after which the workers are checked
+POLL_INTERVAL = 1.0
+
+
+def decode_block(
+    parser,
+    signal,
+    owned=0,
+    start_time=None,
+    sample_rate=adsb_rtlsdr.SAMPLE_RATE
+):
+    """
+    Returns the ADS-B messages in a block of magnitudes whose preamble starts
+    at or after the owned index. start_time is the time of the first sample
+    of the block. Overlapping preamble hits are skipped from the first sample
+    of the block on, without knowing the hits accepted in the block before,
+    unlike the blocks of AdsbDecodePool.
+    """
+
+    min_sig_amp = parser.min_signal_amplitude(signal)
+    indexes = parser.detect_preambles(signal, min_sig_amp)
+    return parser.decode_candidates(
+        signal, indexes[indexes >= owned], start_time, sample_rate)
+
+
+def skip_links(hits, owned):
+    """
+    Returns where the skipping of overlapping preamble hits goes after every
+    hit it may accept in a block, as a dict from a hit to the next hit
+    accepted after it or None. Skipping may start at any hit from owned up to
+    a message past it, depending on the hits of the previous block.
+    """
+
+    hits = hits[hits >= owned]
+    following = numpy.searchsorted(
+        hits, hits + adsb_parser.MESSAGE_LENGTH).tolist()
+    count = int(numpy.searchsorted(hits, owned + OVERLAP)) + 1
+    hits = hits.tolist()
+
+    links = {}
+    for position in range(min(count, len(hits))):
+        # the skipping from a later start joins the one of an earlier start
+        while position < len(hits) and hits[position] not in links:
+            after = following[position]
+            links[hits[position]] = hits[after] if after < len(hits) else None
+            position = after
+
+    return links
+
+
+def accepted_hits(links, start):
+    """Returns the hits accepted by skipping from the start index on"""
+
+    hit = min((hit for hit in links if hit >= start), default=None)
+
+    accepted = []
+    while hit is not None:
+        accepted.append(hit)
+        hit = links[hit]
+
+    return accepted
+
+
+def accept(messages, links, block_start, resume):
+    """
+    Returns the messages of the hits of a block accepted from the resume
+    sample number on, and the sample number the next block resumes from
+    """
+
+    accepted = accepted_hits(links, resume - block_start)
+    if accepted:
+        resume = block_start + accepted[-1] + adsb_parser.MESSAGE_LENGTH
+
+    return messages.select(numpy.isin(messages.positions, accepted)), resume
+
+
+def decode_worker(name, slot_bytes, sample_rate, tasks, results):
+    """
+    Worker process decoding ring slots until it receives None. Every task is
+    a (sequence, slot, length, owned, start_time) tuple and is answered with
+    a (sequence, slot, messages, links) tuple, the messages of every hit the
+    skipping may accept and the skip_links of the block.
+    """
+
+    memory = multiprocessing.shared_memory.SharedMemory(name=name)
+    ring = numpy.ndarray((memory.size,), dtype=numpy.uint8, buffer=memory.buf)
+    parser = adsb_parser.AdsbParser()
+
+    for sequence, slot, length, owned, start_time in iter(tasks.get, None):
+        start = slot * slot_bytes
+        signal = adsb_rtlsdr.bytes_to_magnitude(ring[start:start + length])
+
+        hits = parser.preamble_hits(
+            signal, parser.min_signal_amplitude(signal))
+        links = skip_links(hits, owned)
+        messages = parser.decode_candidates(
+            signal,
+            numpy.array(sorted(links), dtype=numpy.intp),
+            start_time,
+            sample_rate
+        )
+
+        results.put((sequence, slot, messages, links))
+
+    del ring
+    memory.close()
+
+
+class AdsbDecodePool:
+    """
+    Class for decoding raw IQ bytes with a pool of worker processes.
+
+    Blocks are decoded by AdsbParser, which expects one sample per chip, so
+    only the default 2 Msps sample rate is supported.
+    """
+
+    def __init__(
+        self,
+        workers=os.cpu_count(),
+        block_size=adsb_parser.CHUNK_SIZE,
+        slots=None,
+        sample_rate=adsb_rtlsdr.SAMPLE_RATE
+    ):
+        if sample_rate != adsb_rtlsdr.SAMPLE_RATE:
+            raise ValueError(f"Sample rate not supported by the pool: {sample_rate}")
+
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.slot_bytes = (CARRY + block_size) * SAMPLE_BYTES
+        self.slots = slots or workers * SLOTS_PER_WORKER
+
+        self.memory = multiprocessing.shared_memory.SharedMemory(
+            create=True, size=self.slots * self.slot_bytes)
+        self.ring = numpy.ndarray(
+            (self.slots * self.slot_bytes,),
+            dtype=numpy.uint8,
+            buffer=self.memory.buf
+        )
+
+        self.tasks = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.workers = [
+            multiprocessing.Process(
+                target=decode_worker,
+                args=(self.memory.name, self.slot_bytes, sample_rate,
+                      self.tasks, self.results),
+                daemon=True
+            )
+            for _ in range(workers)
+        ]
+
+        for worker in self.workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the workers and releases the shared memory"""
+
+        for worker in self.workers:
+            if worker.is_alive():
+                self.tasks.put(None)
+
+        for worker in self.workers:
+            worker.join()
+
+        self.workers = []
+
+        if self.ring is not None:
+            self.ring = None
+            self.memory.close()
+            self.memory.unlink()
+
+    def result(self):
+        """
+        Returns the next (sequence, slot, messages, links) result of the
+        workers, raising RuntimeError once a worker has died, since its block
+        would never be answered
+        """
+
+        while True:
+            try:
+                return self.results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                for worker in self.workers:
+                    if not worker.is_alive():
+                        raise RuntimeError(
+                            f"Decode worker died with exit code {worker.exitcode}"
+                        ) from None
+
+    def decode(self, chunks):
+        """
+        Copies an iterable of (data, received) raw IQ byte chunks into the
+        ring and yields the ADS-B messages of every block, in the order the
+        blocks were read. The reader blocks while every slot is being decoded.
+
+        Messages are timestamped from the sample count, anchored to the time
+        the last chunk was received.
+        """
+
+        free = collections.deque(range(self.slots))
+        pending = {}
+        sequence = 0
+        next_sequence = 0
+
+        # sample number of the first sample of every block being decoded and
+        # of the first sample a preamble may start at after the hits accepted
+        # so far
+        block_starts = {}
+        resume = 0
+
+        slot = free.popleft()
+        length = 0
+        owned = 0
+
+        # sample number of the first sample of the current block, and the
+        # number of samples read up to the last wall clock reading
+        block_start = 0
+        samples_read = 0
+
+        for data, received in chunks:
+            data = numpy.frombuffer(data, dtype=numpy.uint8)
+            offset = 0
+
+            samples_read += len(data) // SAMPLE_BYTES
+
+            while offset < len(data):
+                start = slot * self.slot_bytes
+                count = min(self.slot_bytes - length, len(data) - offset)
+                self.ring[start + length:start + length + count] = \
+                    data[offset:offset + count]
+                length += count
+                offset += count
+
+                if length < self.slot_bytes:
+                    continue
+
+                start_time = received - (
+                    samples_read - block_start) / self.sample_rate
+                self.tasks.put((sequence, slot, length, owned, start_time))
+                block_starts[sequence] = block_start
+                sequence += 1
+
+                # Collect results until a slot is free for the next block
+                while not free:
+                    done, done_slot, *result = self.result()
+                    pending[done] = result
+                    free.append(done_slot)
+
+                    while next_sequence in pending:
+                        messages, resume = accept(
+                            *pending.pop(next_sequence),
+                            block_starts.pop(next_sequence),
+                            resume
+                        )
+                        yield messages
+                        next_sequence += 1
+
+                # The next block starts with the unchecked tail of this one
+                tail = start + self.slot_bytes - CARRY * SAMPLE_BYTES
+                slot = free.popleft()
+                start = slot * self.slot_bytes
+                length = CARRY * SAMPLE_BYTES
+                owned = OVERLAP
+                block_start += self.slot_bytes // SAMPLE_BYTES - CARRY
+                self.ring[start:start + length] = \
+                    self.ring[tail:tail + length]
+
+        if length >= (owned + adsb_parser.MESSAGE_LENGTH) * SAMPLE_BYTES:
+            start_time = received - (
+                samples_read - block_start) / self.sample_rate
+            self.tasks.put((sequence, slot, length, owned, start_time))
+            block_starts[sequence] = block_start
+            sequence += 1
+
+        while next_sequence < sequence:
+            done, _, *result = self.result()
+            pending[done] = result
+
+            while next_sequence in pending:
+                messages, resume = accept(
+                    *pending.pop(next_sequence),
+                    block_starts.pop(next_sequence),
+                    resume
+                )
+                yield messages
+                next_sequence += 1
+
+    def messages(self, chunks):
+        """
+        Yields the ADS-B messages of an iterable of raw IQ byte chunks, each
+        received when it is read
+        """
+
+        for messages in self.decode((data, time.time()) for data in chunks):
+            yield from messages
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Tracks the noise floor of the receiver across sample chunks.
+
+The noise floor is estimated from the mean magnitude of short windows of
+samples. Replies only take up a small part of the time, so the quietest
+windows hold noise alone and a low percentile of the window means is a robust
+estimate of the noise. Only a fixed number of windows spread over each chunk
+are measured, which keeps the cost per chunk constant whatever its size, and
+the estimates of consecutive chunks are smoothed with an Exponentially
+Weighted Moving Average (EWMA) so the threshold does not jump at chunk
+boundaries.
+
+https://dsp.stackexchange.com/questions/70779/how-is-signal-to-noise-ratio-actually-measured-by-receiver-equipment
+"""
+
+import adsb_rtlsdr
+import numpy
+
+# The divisional value of a single microsecond .000001, also represented by the
+# symbol μs.
+MICROSECOND = 1e6
+
+# Samples in a window of 100 μs
+WINDOW = int(adsb_rtlsdr.SAMPLE_RATE / MICROSECOND) * 100
+
+# Number of windows measured in every chunk
+WINDOWS = 64
+
+# Share of the quietest window means the noise floor is taken from
+PERCENTILE = 0.1
+
+# Weight of the latest chunk in the moving average
+ALPHA = 0.25
+
+# Minimum Signal to Noise Ratio (SNR) of a reply, 10 dB is an amplitude
+# ratio of 3.162.
+# https://www.electronics-tutorials.ws/filter/decibels.html
+SNR_DB = 10
+
+
+class NoiseFloorEstimator:
+    """Class for a streaming estimate of the noise floor"""
+
+    def __init__(
+        self,
+        snr_db=SNR_DB,
+        window=WINDOW,
+        windows=WINDOWS,
+        percentile=PERCENTILE,
+        alpha=ALPHA
+    ):
+        self.snr = 10 ** (snr_db / 20)
+        self.window = window
+        self.windows = windows
+        self.percentile = percentile
+        self.alpha = alpha
+
+        self.floor = None
+        self.offsets = numpy.arange(window)
+
+    @property
+    def threshold(self):
+        """
+        Returns the minimum amplitude of a reply above the noise floor, None
+        until a sample has been seen
+        """
+
+        if self.floor is None:
+            return None
+
+        return self.snr * self.floor
+
+    def update(self, signal):
+        """Updates the estimate with a chunk of magnitudes and returns it"""
+
+        count = len(signal) // self.window
+
+        if not count:
+            if self.floor is None and len(signal):
+                self.floor = float(numpy.mean(signal))
+            return self.floor
+
+        starts = numpy.linspace(
+            0, count - 1, min(count, self.windows)).astype(int) * self.window
+        means = signal[starts[:, None] + self.offsets].mean(axis=1)
+
+        rank = int(len(means) * self.percentile)
+        estimate = float(numpy.partition(means, rank)[rank])
+
+        if self.floor is None:
+            self.floor = estimate
+        else:
+            self.floor += self.alpha * (estimate - self.floor)
+
+        return self.floor
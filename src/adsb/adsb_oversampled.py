@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""
+Demodulates ADS-B sampled faster than the 2 MHz chip rate, at 2.4 or
+2.56 Msps, with frames starting anywhere between two samples.
+
+At 2 Msps every chip of a frame is expected to fill exactly one sample, so a
+frame starting half way between two samples smears every pulse over two
+samples and is often lost. Above the chip rate a chip no longer lines up
+with the samples at all, so instead every chip is measured as the mean
+magnitude between its edges, for PHASES hypotheses per sample of where the
+frame starts:
+
+    1. preambles are screened on the samples every pulse and gap of the
+       preamble overlaps whatever the phase,
+    2. the preamble chips of the candidates left are measured for every
+       phase over SPAN samples, candidates whose gaps are not quiet at any
+       phase are dropped and a cluster of candidates next to each other is
+       reduced to the one with the strongest preamble,
+    3. all the chips of every candidate are measured and demodulated for
+       every phase at once, and the phase whose frame passes the parity
+       check with the widest pulse position margin wins. The parity is then
+       checked again as for any other frame.
+
+https://mode-s.org/decode/content/ads-b/1-basics.html
+"""
+
+import math
+
+import adsb_crc
+import adsb_noise
+import adsb_parser
+import adsb_rtlsdr
+import adsb_signal
+import numpy
+
+# Sample rates the dongle runs at without dropping samples, above the chip
+# rate
+OVERSAMPLED_RATES = [2.4e6, 2.56e6]
+
+# Hypotheses of the start of a frame per sample, a fifth of a sample apart
+PHASES = 5
+
+# Samples the start of a frame is searched over, from the sample before the
+# one its preamble is screened at, as a noisy preamble is easily screened a
+# sample off
+SPAN = 2
+
+# Number of chips of a frame, the preamble followed by two chips per bit
+CHIPS = adsb_parser.PREAMBLE_LENGTH + adsb_parser.DATA_LENGTH
+
+# The samples inside the gaps of a preamble are quiet when their mean
+# magnitude is below this ratio of the mean of its pulses
+SCREEN_RATIO = 0.4
+
+# Chips inside the gaps of the preamble, away from the pulses that leak into
+# the samples next to them. Data can not imitate them, it has at most two
+# quiet chips in a row.
+QUIET_CHIPS = [4, 5, 11, 12, 13, 14]
+
+# The chips inside the gaps of a preamble are quiet when their mean magnitude
+# is below this ratio of its weakest pulse
+QUIET_RATIO = 0.5
+
+# Preamble candidates at most this many samples apart from the previous one
+# belong to the same frame
+CLUSTER = 2
+
+
+def streaming_parser(sample_rate=adsb_rtlsdr.SAMPLE_RATE, **kwargs):
+    """Returns a streaming parser for samples at the given sample rate"""
+
+    if sample_rate == adsb_rtlsdr.SAMPLE_RATE:
+        return adsb_parser.StreamingAdsbParser(sample_rate=sample_rate, **kwargs)
+
+    return OversampledAdsbParser(sample_rate=sample_rate, **kwargs)
+
+
+def chip_edges(samples_per_chip, phases=PHASES, span=SPAN):
+    """
+    Returns the edges of the chips of a frame for every phase, in samples
+    from the sample of a candidate, as (phases * span, chips + 1) arrays of
+    the sample every edge falls in and of the fraction of the sample before
+    the edge
+    """
+
+    edges = numpy.arange(phases * span)[:, None] / phases + \
+        numpy.arange(CHIPS + 1)[None, :] * samples_per_chip
+
+    offsets = numpy.floor(edges).astype(numpy.intp)
+
+    return offsets, edges - offsets
+
+
+def integral(signal):
+    """Returns the running sum of a signal, starting with 0"""
+
+    cumulative = numpy.zeros(len(signal) + 1)
+    numpy.cumsum(signal, out=cumulative[1:])
+
+    return cumulative
+
+
+def screen_offsets(samples_per_chip):
+    """
+    Returns the sample offsets overlapping every preamble pulse, one list per
+    pulse, and the offsets of the samples inside a preamble gap whatever the
+    phase
+    """
+
+    pulses = [
+        list(range(
+            math.floor(chip * samples_per_chip),
+            math.floor((chip + 1) * samples_per_chip) + 2))
+        for chip in adsb_parser.PREAMBLE_PULSES.tolist()
+    ]
+
+    # a sample is inside a gap of chips [first, last) for any phase when it
+    # starts a whole sample after the gap and ends before it does
+    quiet = []
+    for first, last in [(3, 7), (10, adsb_parser.PREAMBLE_LENGTH)]:
+        quiet.extend(range(
+            math.ceil(first * samples_per_chip + 1),
+            math.floor(last * samples_per_chip)))
+
+    return pulses, quiet
+
+
+class OversampledAdsbParser(adsb_parser.StreamingAdsbParser):
+    """
+    Class for parsing a continuous stream of ADS-B samples taken above the
+    2 MHz chip rate, trying several fractional phases per frame.
+    """
+
+    def __init__(
+        self,
+        chunk_size=adsb_parser.CHUNK_SIZE,
+        sample_rate=OVERSAMPLED_RATES[0],
+        snr_db=adsb_noise.SNR_DB,
+        diagnostics=None,
+        metrics=None,
+        phases=PHASES
+    ):
+        self.samples_per_chip = sample_rate / adsb_signal.CHIP_RATE
+        if self.samples_per_chip <= 1:
+            raise ValueError(f"Sample rate not above the chip rate: {sample_rate}")
+
+        self.phases = phases
+        self.offsets, self.fractions = chip_edges(self.samples_per_chip, phases)
+        self.pulse_offsets, self.quiet_offsets = screen_offsets(
+            self.samples_per_chip)
+
+        self.message_length = int(self.offsets.max()) + 1
+
+        super().__init__(chunk_size, sample_rate, snr_db, diagnostics, metrics)
+
+    def chip_values(self, signal, cumulative, indexes, chips=CHIPS):
+        """
+        Returns the mean magnitudes of the first chips of the frames starting
+        at the given indexes for every phase, as a (candidates, phases, chips)
+        array, from the running sum of the signal
+        """
+
+        samples = indexes[:, None, None] + self.offsets[:, :chips + 1]
+        areas = cumulative[samples] + self.fractions[:, :chips + 1] * \
+            signal[samples]
+
+        return numpy.diff(areas, axis=-1) / self.samples_per_chip
+
+    def detect_preambles(self, signal, min_sig_amp, start=0):
+        """
+        Returns the start index of every preamble candidate in the given
+        magnitude signal, the sample each frame starts in or the one before
+        """
+
+        count = len(signal) - self.message_length + 1
+        if count <= start or min_sig_amp is None:
+            return numpy.empty(0, dtype=numpy.intp)
+
+        # the strongest sample of every pulse
+        pulses = numpy.zeros((len(self.pulse_offsets), count), dtype=numpy.float32)
+        for pulse, offsets in zip(pulses, self.pulse_offsets):
+            for offset in offsets:
+                numpy.maximum(pulse, signal[offset:offset + count], out=pulse)
+
+        quiet = numpy.zeros(count, dtype=numpy.float32)
+        for offset in self.quiet_offsets:
+            quiet += signal[offset:offset + count]
+        quiet /= len(self.quiet_offsets)
+
+        level = pulses.mean(axis=0)
+        candidates = (level >= min_sig_amp) & (quiet < SCREEN_RATIO * level) & (
+            pulses.min(axis=0) > quiet)
+
+        # the frame may start in the sample before
+        indexes = numpy.maximum(numpy.flatnonzero(candidates) - 1, 0)
+        indexes = numpy.unique(indexes[indexes >= start])
+        if not len(indexes):
+            return indexes
+
+        # strength of the best phase of every preamble, the margin of its gap
+        # chips below the quiet ratio of its weakest pulse
+        chips = self.chip_values(
+            signal, integral(signal), indexes, adsb_parser.PREAMBLE_LENGTH)
+        strengths = (
+            QUIET_RATIO * chips[..., adsb_parser.PREAMBLE_PULSES].min(axis=-1)
+            - chips[..., QUIET_CHIPS].mean(axis=-1)
+        ).max(axis=1)
+
+        indexes = indexes[strengths > 0]
+        strengths = strengths[strengths > 0].tolist()
+
+        # Candidates are sparse, so walking the clusters is cheap
+        selected = []
+        indexes = indexes.tolist()
+        position = 0
+        while position < len(indexes):
+            end = position + 1
+            while end < len(indexes) and \
+                    indexes[end] - indexes[end - 1] <= CLUSTER:
+                end += 1
+
+            best = max(range(position, end), key=strengths.__getitem__)
+            selected.append(indexes[best])
+            position = end
+
+        return numpy.array(selected, dtype=numpy.intp)
+
+    def demodulate_candidates(self, signal_buffer, indexes):
+        """
+        Returns the message bytes, lengths, signal levels and fractional
+        sample positions of the preamble candidates at the given indexes,
+        demodulated at the best phase of every candidate
+        """
+
+        chips = self.chip_values(
+            signal_buffer, integral(signal_buffer), indexes)
+        data = chips[..., adsb_parser.PREAMBLE_LENGTH:]
+        frames, lengths = self.demodulate_windows(data)
+
+        # phases whose frame passes the parity check come first, then the
+        # ones with the widest margin between the chips of every bit
+        margins = numpy.abs(data[..., 0::2] - data[..., 1::2]).mean(axis=-1)
+        passed = self.check_parity(frames, lengths)
+        best = numpy.argmax(passed * (margins.max(initial=0) + 1) + margins, axis=1)
+
+        rows = numpy.arange(len(indexes))
+        levels = chips[rows, best][:, adsb_parser.PREAMBLE_PULSES].mean(axis=1)
+
+        return (
+            frames[rows, best],
+            lengths[rows, best],
+            levels,
+            indexes + best / self.phases
+        )
+
+    def check_parity(self, frames, lengths):
+        """
+        Returns a mask of the frames that pass the parity check, the same as
+        validate_frames but without correcting bits or remembering addresses
+        """
+
+        shape = lengths.shape
+        frames = frames.reshape(-1, adsb_crc.MESSAGE_BYTES)
+        lengths = lengths.reshape(-1)
+
+        downlink_format = frames[:, 0] >> 3
+        syndromes = adsb_crc.syndromes(frames, lengths)
+
+        passed = (lengths > 0) & (syndromes == 0)
+        passed |= (
+            (downlink_format == adsb_parser.ALL_CALL_FORMAT)
+            & (lengths == adsb_parser.SHORT_MESSAGE_BITS)
+            & ((syndromes & ~numpy.uint32(adsb_parser.INTERROGATOR_MASK)) == 0)
+        )
+        if self.addresses:
+            passed |= (
+                numpy.isin(downlink_format, adsb_parser.ADDRESS_PARITY_FORMATS)
+                & (lengths > 0)
+                & numpy.isin(syndromes, list(self.addresses))
+            )
+
+        return passed.reshape(shape)
@@ -12,12 +12,15 @@ number of years.
 https://mode-s.org/decode/content/ads-b/1-basics.html
 """
 
+import collections
+import contextlib
 import time
 
+import adsb_columns
+import adsb_crc
+import adsb_noise
 import adsb_rtlsdr
-import matplotlib.pyplot
 import numpy
-import pyModeS
 
 # Mode-S ADS-B technology has two types of squitter, a short, 56 bit,
 # acquisition squitter which can contain Downlink Formats (DF) 0, 4, 5 and 11
@@ -25,73 +28,133 @@ import pyModeS
 # https://cdn.knmi.nl/knmi/pdf/bibliotheek/knmipubTR/TR336.pdf
 DATA_LENGTH = 224
 
-# The divisional value of a single microsecond .000001, also represented by the
-# symbol μs.
-MICROSECOND = 1e6
-
 # The preamble is 8 μs and each bit is represented by a 0.5 μs pulse equaling
 # 16 total bits. The preamble indicates the start of an ADS-B data message.
 PREAMBLE = [1, 0, 1, 0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0, 0]
 
 PREAMBLE_LENGTH = len(PREAMBLE)
 
+# Positions of the four preamble pulses, averaged for the signal level
+PREAMBLE_PULSES = numpy.flatnonzero(PREAMBLE)
+
 # signal amplitude threshold difference between 0 and 1 bit
 AMPLITUDE_THRESHOLD = 0.8
 
 MESSAGE_LENGTH = PREAMBLE_LENGTH + DATA_LENGTH + 1
 
+# Every data bit is carried by a pair of 0.5 μs samples, so the 224 samples of
+# data hold at most a 112 bit extended squitter. Downlink formats 16 and above
+# are 112 bits long, everything below is a 56 bit short squitter.
+# https://mode-s.org/decode/content/mode-s/1-basics.html
+LONG_MESSAGE_BITS = DATA_LENGTH // 2
+SHORT_MESSAGE_BITS = LONG_MESSAGE_BITS // 2
+LONG_DOWNLINK_FORMAT = 16
+
+# Number of samples of data following the preamble, read as pulse pairs
+DATA_OFFSETS = numpy.arange(PREAMBLE_LENGTH, PREAMBLE_LENGTH + DATA_LENGTH)
+
+# Number of new samples the streaming parser collects before parsing them
+CHUNK_SIZE = 256 * 1024
+
+# DF11 all-call replies overlay the parity with a 7 bit interrogator
+# identifier, DF0/4/5/16/20/21 replies overlay it with the ICAO address.
+# https://mode-s.org/decode/content/ads-b/8-error-control.html
+ALL_CALL_FORMAT = 11
+EXTENDED_SQUITTER_FORMAT = 17
+INTERROGATOR_MASK = 0x7F
+ADDRESS_PARITY_FORMATS = [0, 4, 5, 16, 20, 21]
+
+# Seconds of message time an ICAO address seen in a DF11/DF17 message is
+# trusted to validate the address parity of other downlink formats
+ADDRESS_TTL = 60
+
 
 class AdsbParser:
     """Class for streaming samples of ADS-B"""
 
-    @staticmethod
-    def calculate_noise_floor(samples):
-        """Configure
-        sample_rate is samples per second
-        Returns minimum calculated noise or default to 1 microsecond
+    # number of samples a candidate message spans from its preamble on
+    message_length = MESSAGE_LENGTH
 
-        """
+    def __init__(self, snr_db=adsb_noise.SNR_DB, diagnostics=None, metrics=None):
+        # optional adsb_diagnostics.AdsbDiagnostics plotting the signal
+        self.diagnostics = diagnostics
 
-        # Calculate noise floor
-        window = int(adsb_rtlsdr.SAMPLE_RATE / MICROSECOND) * 100
-        length = len(samples)
+        # optional adsb_metrics.AdsbMetrics counting and timing every stage
+        self.metrics = metrics
 
-        # // = the integer division operator
-        # no idea what this is doing
-        means = (
-            numpy.array(samples[: length // window * window])
-            .reshape(-1, window)
-            .mean(axis=1)
-        )
+        # noise floor carried from one buffer to the next
+        self.noise_floor = adsb_noise.NoiseFloorEstimator(snr_db)
 
-        calculated = min(means)
-        return min(calculated, MICROSECOND)
+        # ICAO addresses of aircraft recently heard in DF11/DF17 messages and
+        # the message time they were last heard, least recently heard first.
+        # Every parser learns them from the messages it decodes itself.
+        self.addresses = collections.OrderedDict()
 
-    @staticmethod
-    def is_adsb_squitter(samples):
+    def stage(self, name):
+        """Returns a context manager timing a stage when metrics are enabled"""
+
+        if self.metrics is None:
+            return contextlib.nullcontext()
+
+        return self.metrics.stage(name)
+
+    @classmethod
+    def detect_preambles(cls, signal, min_sig_amp, start=0):
         """
-        Returns if the given message is of type ADS-B.
+        Returns the start index of every preamble candidate in the given
+        magnitude signal as a numpy index array, none without a minimum
+        signal amplitude.
+
+        Candidates that start inside the message of an earlier candidate, or
+        before start, are dropped: the search resumes MESSAGE_LENGTH samples
+        after a hit. The loop this replaced resumed 15 samples earlier, the
+        sample after the data it had read, where a hit can only come from the
+        last data chips of the message and hides the frame that follows.
+        """
+
+        return cls.skip_overlapping(
+            cls.preamble_hits(signal, min_sig_amp), start)
 
-        Mode-S ADS-B technology has two types of squitter, a short, 56 bit,
-        acquisition squitter which can contain Downlink Formats (DF) 0, 4, 5
-        and 11 (DF0/4/5/11) and the 112 bit extended squitter (ES) which can
-        contain DF17.
+    @staticmethod
+    def preamble_hits(signal, min_sig_amp):
+        """
+        Returns the index of every sample the PREAMBLE pattern matches at,
+        including the ones inside the message of an earlier match.
 
-        https://cdn.knmi.nl/knmi/pdf/bibliotheek/knmipubTR/TR336.pdf
+        Every position is checked against the PREAMBLE pattern at once, one
+        vectorized comparison per preamble pulse, instead of slicing the
+        buffer one sample at a time.
         """
 
-        downlink_format = pyModeS.df(samples)
-        length = len(samples)
+        count = len(signal) - MESSAGE_LENGTH + 1
+        if count <= 0 or min_sig_amp is None:
+            return numpy.empty(0, dtype=numpy.intp)
+
+        # Anything that is below the minimum signal amplitude can be skipped
+        candidates = signal[:count] >= min_sig_amp
+
+        for offset, pulse in enumerate(PREAMBLE):
+            window = signal[offset:offset + count]
+            candidates &= numpy.abs(window - pulse) <= AMPLITUDE_THRESHOLD
+
+        return numpy.flatnonzero(candidates)
 
-        if downlink_format == 17 and length == 28:
-            if pyModeS.crc(samples) == 0:
-                return True
-        elif downlink_format in [20, 21] and length == 28:
-            return True
-        elif downlink_format in [4, 5, 11] and length == 14:
-            return True
+    @staticmethod
+    def skip_overlapping(hits, start=0):
+        """
+        Returns the preamble hits from start on that do not start inside the
+        message of an earlier one
+        """
+
+        # Hits are sparse, so stepping over the overlapping ones is cheap
+        indexes = []
+        next_index = start
+        for index in hits.tolist():
+            if index >= next_index:
+                indexes.append(index)
+                next_index = index + MESSAGE_LENGTH
 
-        return False
+        return numpy.array(indexes, dtype=numpy.intp)
 
     @staticmethod
     def is_preamble(samples):
@@ -110,32 +173,31 @@ class AdsbParser:
         return True
 
     @staticmethod
-    def plot(samples):
-        """Plot an array of samples"""
-        matplotlib.pyplot.plot(samples)
-        matplotlib.pyplot.ylabel('some numbers')
-        matplotlib.pyplot.show()
+    def demodulate(signal, indexes):
+        """
+        Slices the data of every preamble candidate into Mode S message bytes
+        in a single batch.
 
-    @staticmethod
-    def plot_psd(samples):
-        """Use matplotlib to estimate and plot the PSD"""
-
-        matplotlib.pyplot.psd(
-            samples,
-            NFFT=1024,
-            Fs=adsb_rtlsdr.SAMPLE_RATE/MICROSECOND,
-            Fc=adsb_rtlsdr.CENTER_FREQUENCY/MICROSECOND
-        )
-        matplotlib.pyplot.xlabel('Frequency (MHz)')
-        matplotlib.pyplot.ylabel('Relative power (dB)')
-        matplotlib.pyplot.show()
+        Returns a tuple of an (N, 14) uint8 array of message bytes and an
+        array of message lengths in bits, 56 or 112 depending on the downlink
+        format. A length of 0 means the signal faded out before the end of
+        the message and the candidate should be discarded.
+        """
+
+        # one row of data samples per candidate
+        return AdsbParser.demodulate_windows(
+            signal[numpy.asarray(indexes)[:, None] + DATA_OFFSETS])
 
     @staticmethod
-    def signal_to_binary(samples):
+    def demodulate_windows(windows):
+        """
+        Returns the message bytes and lengths of the data chips of candidates,
+        the last axis of windows holds the 224 chips of a candidate
+        """
 
         # TODO not sure why they set a noise floor and then still had to set this
         # threshold value to avoid noise from becoming bits.
-        threshold = max(samples) * 0.25
+        threshold = windows.max(axis=-1, initial=0, keepdims=True) * 0.25
 
         # The information contained in the data block is modulated using
         #  the Pulse Position Modulation (PPM), which is a type of
@@ -143,84 +205,355 @@ class AdsbParser:
         # of pulse followed by a 0.5 μs flat signal. The 0 bit is reversed
         # compared to the 1 bit, which is represented by a 0.5 μs flat
         # signal and followed by a 0.5 μs pulse.
+        first = windows[..., 0::2]
+        second = windows[..., 1::2]
+
+        frames = numpy.packbits(first >= second, axis=-1)
+
+        # The message ends at the first pulse pair where both halves are flat
+        silent = (first < threshold) & (second < threshold)
+        received = numpy.where(
+            silent.any(axis=-1), silent.argmax(axis=-1), LONG_MESSAGE_BITS)
+
+        downlink_format = frames[..., 0] >> 3
+        lengths = numpy.where(
+            downlink_format >= LONG_DOWNLINK_FORMAT,
+            LONG_MESSAGE_BITS,
+            SHORT_MESSAGE_BITS
+        )
+        lengths[received < lengths] = 0
+
+        return frames, lengths
+
+    def demodulate_candidates(self, signal_buffer, indexes):
+        """
+        Returns the message bytes, lengths, signal levels and sample positions
+        of the preamble candidates at the given indexes
+        """
+
+        frames, lengths = self.demodulate(signal_buffer, indexes)
+        levels = signal_buffer[indexes[:, None] + PREAMBLE_PULSES].mean(axis=1)
+
+        return frames, lengths, levels, indexes
+
+    def decode_candidates(
+        self,
+        signal_buffer,
+        indexes,
+        start_time=None,
+        sample_rate=adsb_rtlsdr.SAMPLE_RATE
+    ):
+        """
+        Demodulates the preamble candidates at the given indexes and returns
+        the ADS-B messages among them as an adsb_columns.AdsbMessages batch
+        of [message, timestamp, signal level] lists. The signal level is the
+        mean magnitude of the preamble pulses.
+
+        Messages are timestamped from their sample position, counted from the
+        start_time of the first sample of the buffer, which defaults to the
+        current time.
+        """
+
+        if start_time is None:
+            start_time = time.time()
+
+        indexes = numpy.asarray(indexes)
+
+        with self.stage("demodulate"):
+            frames, lengths, levels, positions = self.demodulate_candidates(
+                signal_buffer, indexes)
+
+        timestamps = start_time + positions / sample_rate
+
+        with self.stage("validate"):
+            valid = self.validate_frames(frames, lengths, timestamps)
+
+        if self.diagnostics is not None and len(indexes):
+            self.diagnostics.pulses(
+                signal_buffer[indexes[0]:indexes[0] + self.message_length],
+                timestamps[0]
+            )
+
+        return adsb_columns.AdsbMessages(
+            frames[valid],
+            lengths[valid],
+            timestamps[valid],
+            levels[valid],
+            positions[valid]
+        )
+
+    def validate_frames(self, frames, lengths, timestamps):
+        """
+        Checks the parity of a batch of demodulated messages received at the
+        given timestamps and returns a mask of the valid ones.
+
+        DF17 messages must have a syndrome of 0, single bit errors are
+        corrected in place. DF11 messages may only carry an interrogator
+        identifier in their parity. The address parity of the other formats
+        must match the ICAO address of an aircraft heard in a valid DF11/DF17
+        message within ADDRESS_TTL seconds of message time.
+        """
+
+        downlink_format = frames[:, 0] >> 3
+        syndromes = adsb_crc.syndromes(frames, lengths)
+
+        extended = (downlink_format == EXTENDED_SQUITTER_FORMAT) & (
+            lengths == LONG_MESSAGE_BITS)
+        corrected = adsb_crc.correct_single_bit(
+            frames, syndromes, extended & (syndromes != 0))
+
+        valid = extended & ((syndromes == 0) | corrected)
+        valid |= (
+            (downlink_format == ALL_CALL_FORMAT)
+            & (lengths == SHORT_MESSAGE_BITS)
+            & ((syndromes & ~numpy.uint32(INTERROGATOR_MASK)) == 0)
+        )
+
+        # Remember the address of every aircraft heard so far
+        heard = frames[valid, 1:4].astype(numpy.uint32)
+        heard = (heard[:, 0] << 16) | (heard[:, 1] << 8) | heard[:, 2]
+        for address, timestamp in zip(
+                heard.tolist(), timestamps[valid].tolist()):
+            self.addresses[address] = timestamp
+            self.addresses.move_to_end(address)
+
+        if len(timestamps):
+            self.forget_addresses(float(timestamps.max()))
 
-        message = []
-        for i in range(0, len(samples), 2):
-            pulse = samples[i: i + 2]
+        address_parity = numpy.isin(downlink_format, ADDRESS_PARITY_FORMATS)
+        if address_parity.any() and self.addresses:
+            valid |= (
+                address_parity
+                & (lengths > 0)
+                & numpy.isin(syndromes, list(self.addresses))
+            )
 
-            if pulse[0] < threshold and pulse[1] < threshold:
+        if self.metrics is not None:
+            self.count_frames(downlink_format, valid, corrected)
+
+        return valid
+
+    def forget_addresses(self, now):
+        """Forgets the addresses not heard for ADDRESS_TTL seconds"""
+
+        while self.addresses:
+            address, last_heard = next(iter(self.addresses.items()))
+            if now - last_heard <= ADDRESS_TTL:
                 break
+            del self.addresses[address]
+
+    def count_frames(self, downlink_format, valid, corrected):
+        """Counts the parity check results and valid downlink formats"""
+
+        corrected_count = int(numpy.count_nonzero(valid & corrected))
+        valid_count = int(numpy.count_nonzero(valid))
+
+        self.metrics.candidates.inc(len(valid))
+        self.metrics.frames.inc(valid_count - corrected_count, "pass")
+        self.metrics.frames.inc(corrected_count, "corrected")
+        self.metrics.frames.inc(len(valid) - valid_count, "fail")
+
+        counts = numpy.bincount(downlink_format[valid], minlength=32)
+        for value in numpy.flatnonzero(counts).tolist():
+            self.metrics.messages.inc(int(counts[value]), value)
 
-            if pulse[0] >= pulse[1]:
-                message.append("1")
-            else:
-                message.append("0")
+    def min_signal_amplitude(self, signal_buffer):
+        """
+        Updates the noise floor with the given samples and returns the
+        amplitude a preamble has to reach to be decoded, snr_db above the
+        noise floor, or None while no sample has been seen.
+        """
 
-        return message
+        self.noise_floor.update(signal_buffer)
+        return self.noise_floor.threshold
 
-    def parse_samples(self, samples):
 
-        signal_buffer = []
-        messages = []
+class StreamingAdsbParser(AdsbParser):
+    """
+    Class for parsing a continuous stream of ADS-B samples one chunk at a
+    time.
 
-        # removing "negative frequencies" (based on numpy, I think this makes it scalar
-        # - remember 'j' is imaginary number)
-        # original complex128 type = (-0.0039215686274509665-0.0039215686274509665j)
-        # resulting signal_buffer = 0.005545935538718
-        #
-        # https://pysdr.org/content/frequency_domain.html
-        # https://numpy.org/doc/stable/reference/generated/numpy.absolute.html
-        amp = numpy.absolute(samples)
-        signal_buffer.extend(amp.tolist())
+    Samples are converted into a single preallocated magnitude buffer. Once
+    the buffer is full it is parsed and only the tail that could still hold
+    the start of a message is carried over in front of the next chunk, so
+    messages that straddle two chunks are not lost and memory stays flat
+    however long the stream runs.
 
-        # To see what the resulting plot looks like, uncomment these lines
-        # -----------------------------------------------------------------------------
-        self.plot_psd(signal_buffer)
-        # -----------------------------------------------------------------------------
+    Messages are timestamped from a running count of the samples fed to the
+    parser. The clock is anchored to a single wall clock reading per chunk,
+    taken when the chunk is received, so timestamps reflect when a message
+    was received rather than when it was decoded.
 
-        noise_floor = self.calculate_noise_floor(signal_buffer)
+    feed_bytes_batch and flush_batch return the messages of a chunk as one
+    adsb_columns.AdsbMessages batch, for the code that handles whole batches.
+    """
 
-        # set minimum signal amplitude
-        # 10 dB SNR
-        # SNR = Signal to Noise Ratio = 3.162
-        #
-        # I don't understand why they are using a constant instead of calculating the value
-        #
-        # https://www.electronics-tutorials.ws/filter/decibels.html
-        # https://dsp.stackexchange.com/questions/70779/how-is-signal-to-noise-ratio-actually-measured-by-receiver-equipment
-        # https://documentation.meraki.com/MR/WiFi_Basics_and_Best_Practices/Signal-to-Noise_Ratio_(SNR)_and_Wireless_Signal_Strength
-        min_sig_amp = 3.162 * noise_floor
+    def __init__(
+        self,
+        chunk_size=CHUNK_SIZE,
+        sample_rate=adsb_rtlsdr.SAMPLE_RATE,
+        snr_db=adsb_noise.SNR_DB,
+        diagnostics=None,
+        metrics=None
+    ):
+        super().__init__(snr_db, diagnostics, metrics)
 
-        buffer_length = len(signal_buffer)
+        self.sample_rate = sample_rate
 
-        i = 0
-        while i <= (buffer_length - MESSAGE_LENGTH):
+        # number of samples fed so far and the sample number of the first
+        # sample in the signal buffer
+        self.samples_read = 0
+        self.buffer_start = 0
 
-            # Anything that is below the minimum signal amplitude can be skipped
-            if signal_buffer[i] >= min_sig_amp:
+        # time the last chunk was received, at the end of its last sample
+        self.anchor_time = None
+        self.anchor_sample = 0
 
-                pulses = signal_buffer[i: i + PREAMBLE_LENGTH]
+        # Every position up to message_length before the end of the buffer is
+        # checked for a preamble, the rest is carried over.
+        self.carry_length = self.message_length - 1
+        self.signal_buffer = numpy.zeros(
+            self.carry_length + chunk_size, dtype=numpy.float32)
 
-                if self.is_preamble(pulses):
-                    data_start = i + PREAMBLE_LENGTH
-                    data_end = i + MESSAGE_LENGTH
-                    data = signal_buffer[data_start:data_end]
+        # number of samples currently held in the signal buffer
+        self.length = 0
 
-                    self.plot(data)
+        # first index a preamble may start at, past the last message read
+        self.start = 0
 
-                    message_binary = self.signal_to_binary(data)
-                    message = pyModeS.bin2hex(
-                        "".join([str(i) for i in message_binary]))
+    def feed(self, samples, received=None):
+        """
+        Adds a chunk of complex samples to the stream and yields the ADS-B
+        messages that could be completed with it. received is the time the
+        chunk was received, it defaults to now.
+        """
+
+        for messages in self.fill(samples, numpy.absolute, received):
+            yield from messages
+
+    def feed_bytes(self, data, received=None):
+        """
+        Adds a chunk of raw interleaved IQ bytes to the stream and yields the
+        ADS-B messages that could be completed with it. The magnitudes are
+        looked up straight from the bytes without converting them to complex
+        samples first.
+        """
 
-                    if self.is_adsb_squitter(message):
-                        messages.append([message, time.time()])
+        yield from self.feed_bytes_batch(data, received)
 
-                    # advance i past the data it just read
-                    i += len(data)
+    def feed_bytes_batch(self, data, received=None):
+        """
+        Adds a chunk of raw interleaved IQ bytes to the stream and returns
+        the ADS-B messages that could be completed with it as a single batch
+        """
 
-            i += 1
+        return adsb_columns.AdsbMessages.concatenate(self.fill(
+            adsb_rtlsdr.iq_pairs(data), adsb_rtlsdr.lookup_magnitude, received))
 
-        print(messages)
-        pyModeS.tell(messages[0][0])
+    def fill(self, samples, convert, received=None):
+        """
+        Converts samples into the signal buffer with convert(samples, out),
+        parsing the buffer every time it fills up, and yields the batch of
+        messages of every parse.
+        """
+
+        self.samples_read += len(samples)
+        self.anchor_sample = self.samples_read
+        self.anchor_time = time.time() if received is None else received
+
+        offset = 0
+        while offset < len(samples):
+            count = min(
+                len(self.signal_buffer) - self.length,
+                len(samples) - offset
+            )
+
+            with self.stage("magnitude"):
+                convert(
+                    samples[offset:offset + count],
+                    self.signal_buffer[self.length:self.length + count]
+                )
+            self.length += count
+            offset += count
+
+            if self.length == len(self.signal_buffer):
+                yield self.parse_buffer()
+
+    @property
+    def watermark(self):
+        """
+        Returns the time of the first sample that has not been parsed yet, no
+        message yielded later is older
+        """
+
+        return self.anchor_time - (
+            self.anchor_sample - self.buffer_start - self.start
+        ) / self.sample_rate
+
+    def flush(self):
+        """
+        Yields the ADS-B messages left in a partially filled buffer at the end
+        of the stream and resets the parser.
+        """
+
+        yield from self.flush_batch()
+
+    def flush_batch(self):
+        """
+        Returns the ADS-B messages left in a partially filled buffer at the
+        end of the stream as a single batch and resets the parser.
+        """
+
+        messages = adsb_columns.AdsbMessages.empty()
+        if self.length >= self.message_length:
+            messages = self.parse_buffer()
+
+        self.length = 0
+        self.start = 0
+        self.buffer_start = self.samples_read
 
         return messages
+
+    def parse_buffer(self):
+        """
+        Parses the samples currently in the signal buffer, then moves the
+        unchecked tail to the front of the buffer, and returns the batch of
+        messages found.
+        """
+
+        signal_buffer = self.signal_buffer[:self.length]
+
+        start_time = self.anchor_time - (
+            self.anchor_sample - self.buffer_start) / self.sample_rate
+
+        if self.diagnostics is not None:
+            self.diagnostics.psd(signal_buffer, start_time)
+
+        with self.stage("threshold"):
+            min_sig_amp = self.min_signal_amplitude(signal_buffer)
+
+        with self.stage("detect"):
+            indexes = self.detect_preambles(
+                signal_buffer, min_sig_amp, self.start)
+        messages = self.decode_candidates(
+            signal_buffer, indexes, start_time, self.sample_rate)
+
+        tail = self.length - self.carry_length
+        self.buffer_start += tail
+
+        self.start = 0
+        if len(indexes):
+            self.start = max(indexes[-1] + self.message_length - tail, 0)
+
+        self.signal_buffer[:self.carry_length] = signal_buffer[tail:]
+        self.length = self.carry_length
+
+        return messages
+
+    def stream(self, chunks):
+        """Yields the ADS-B messages of an iterable of sample chunks"""
+
+        for samples in chunks:
+            yield from self.feed(samples)
+
+        yield from self.flush()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Asyncio pipeline streaming raw IQ bytes from the dongle, decoding them into
+ADS-B messages and publishing the messages.
+
+    source -> samples queue -> decode (executor) -> messages queue -> publish
+
+The stages are linked by bounded queues. When a queue is full its overflow
+policy decides what happens: block waits for room, which stalls the stages
+before it, drop-oldest discards the oldest queued item and drop-newest
+discards the item being added. Dropping keeps the dongle streaming through
+load spikes at the cost of losing the dropped chunks.
+
+Given an adsb_multiprocess.AdsbDecodePool, the decode stage hands the chunks
+to the pool instead of the streaming parser, from an executor thread that
+reads the samples queue and fills the messages queue through the event loop.
+
+https://docs.python.org/3/library/asyncio-queue.html
+"""
+
+import asyncio
+import concurrent.futures
+import time
+
+import adsb_oversampled
+import adsb_rtlsdr
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+
+POLICIES = [BLOCK, DROP_OLDEST, DROP_NEWEST]
+
+# Number of chunks or message batches a queue holds before it overflows
+QUEUE_SIZE = 16
+
+
+class PipelineQueue:
+    """Class for a bounded asyncio queue with an overflow policy"""
+
+    def __init__(self, maxsize=QUEUE_SIZE, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+
+        self.queue = asyncio.Queue(maxsize)
+        self.policy = policy
+
+        # number of items discarded by the overflow policy
+        self.dropped = 0
+
+    @property
+    def depth(self):
+        """Returns the number of items waiting in the queue"""
+        return self.queue.qsize()
+
+    async def put(self, item):
+        """
+        Adds an item to the queue, applying the overflow policy when full.
+        Returns the item dropped to make room, if any.
+        """
+
+        if self.policy == BLOCK or not self.queue.full():
+            await self.queue.put(item)
+            return None
+
+        self.dropped += 1
+        if self.policy == DROP_NEWEST:
+            return item
+
+        dropped = self.queue.get_nowait()
+        self.queue.put_nowait(item)
+        return dropped
+
+    async def get(self):
+        """Removes and returns the next item of the queue"""
+        return await self.queue.get()
+
+    async def close(self):
+        """Marks the end of the stream, this is never dropped"""
+        await self.queue.put(None)
+
+
+class AdsbPipeline:
+    """
+    Class running the stream, decode and publish stages of the receiver
+    concurrently.
+
+    The source is an async iterable of raw IQ byte chunks and publish is
+    called with the list of messages decoded from every chunk, it may be a
+    coroutine function. Decoding runs in an executor so it never blocks the
+    event loop; the default is a single thread since the streaming parser
+    carries state from one chunk to the next. With a decode pool the
+    executor thread only copies the chunks into the ring of the pool.
+    """
+
+    def __init__(
+        self,
+        source,
+        publish,
+        queue_size=QUEUE_SIZE,
+        policy=BLOCK,
+        executor=None,
+        diagnostics=None,
+        metrics=None,
+        dedup=None,
+        sample_rate=adsb_rtlsdr.SAMPLE_RATE,
+        pool=None
+    ):
+        self.source = source
+        self.publish = publish
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=1)
+
+        self.metrics = metrics
+
+        # optional adsb_dedup.AdsbDeduplicator filtering the messages
+        self.dedup = dedup
+
+        # optional adsb_multiprocess.AdsbDecodePool decoding the chunks
+        # instead of the streaming parser
+        self.pool = pool
+        self.parser = None
+        if pool is None:
+            self.parser = adsb_oversampled.streaming_parser(
+                sample_rate, diagnostics=diagnostics, metrics=metrics)
+
+        self.samples = PipelineQueue(queue_size, policy)
+        self.messages = PipelineQueue(queue_size, policy)
+
+    def depths(self):
+        """Returns the number of items waiting in each queue"""
+
+        return {
+            "samples": self.samples.depth,
+            "messages": self.messages.depth,
+        }
+
+    def dropped(self):
+        """Returns the number of items dropped by each queue"""
+
+        return {
+            "samples": self.samples.dropped,
+            "messages": self.messages.dropped,
+        }
+
+    def decode_chunk(self, data, received):
+        """Returns the ADS-B messages completed by a chunk of raw IQ bytes"""
+        return self.parser.feed_bytes_batch(data, received)
+
+    async def stream(self):
+        """Stage reading the source into the samples queue"""
+
+        try:
+            async for data in self.source:
+                # the chunk is timestamped on arrival, not once decoded
+                dropped = await self.samples.put((data, time.time()))
+
+                if self.metrics is not None:
+                    self.metrics.samples_read.inc(len(data) // 2)
+                    if dropped is not None:
+                        self.metrics.samples_dropped.inc(len(dropped[0]) // 2)
+        finally:
+            await self.samples.close()
+
+    async def decode(self):
+        """Stage decoding the samples queue into the messages queue"""
+
+        loop = asyncio.get_running_loop()
+
+        try:
+            if self.pool is not None:
+                await loop.run_in_executor(
+                    self.executor, self.decode_blocks, loop)
+                return
+
+            while True:
+                chunk = await self.samples.get()
+                if chunk is None:
+                    break
+
+                self.observe_queue(chunk)
+
+                messages = await loop.run_in_executor(
+                    self.executor, self.decode_chunk, *chunk)
+
+                if messages:
+                    await self.put_messages(messages)
+
+            messages = await loop.run_in_executor(
+                self.executor, self.parser.flush_batch)
+
+            if messages:
+                await self.put_messages(messages)
+        finally:
+            await self.messages.close()
+
+    def decode_blocks(self, loop):
+        """
+        Decodes the samples queue with the pool into the messages queue. The
+        pool reads the chunks from a blocking iterator, so this runs in the
+        executor and waits for the queues of the event loop.
+        """
+
+        def chunks():
+            while True:
+                chunk = asyncio.run_coroutine_threadsafe(
+                    self.samples.get(), loop).result()
+                if chunk is None:
+                    return
+
+                self.observe_queue(chunk)
+                yield chunk
+
+        for messages in self.pool.decode(chunks()):
+            if messages:
+                asyncio.run_coroutine_threadsafe(
+                    self.put_messages(messages), loop).result()
+
+    def observe_queue(self, chunk):
+        """Records the time a (data, received) chunk waited in the queue"""
+
+        if self.metrics is not None:
+            self.metrics.stages.observe(time.time() - chunk[1], "queue")
+
+    async def put_messages(self, messages):
+        """Adds a batch of messages to the messages queue"""
+
+        dropped = await self.messages.put(messages)
+
+        if self.metrics is not None and dropped is not None:
+            self.metrics.messages_dropped.inc(len(dropped))
+
+    def filter_messages(self, messages):
+        """Returns the messages that are not suppressed by the dedup stage"""
+
+        duplicates = self.dedup.duplicates
+        limited = self.dedup.limited
+
+        messages = self.dedup.filter(messages)
+
+        if self.metrics is not None:
+            self.metrics.suppressed.inc(
+                self.dedup.duplicates - duplicates, "duplicate")
+            self.metrics.suppressed.inc(
+                self.dedup.limited - limited, "rate-limit")
+
+        return messages
+
+    async def send(self):
+        """Stage publishing the messages queue"""
+
+        while True:
+            messages = await self.messages.get()
+            if messages is None:
+                break
+
+            if self.dedup is not None:
+                messages = self.filter_messages(messages)
+                if not messages:
+                    continue
+
+            begin = time.perf_counter()
+
+            result = self.publish(messages)
+            if asyncio.iscoroutine(result):
+                await result
+
+            if self.metrics is not None:
+                self.metrics.stages.observe(
+                    time.perf_counter() - begin, "publish")
+
+    async def run(self):
+        """Runs every stage until the source is exhausted"""
+
+        await asyncio.gather(self.stream(), self.decode(), self.send())
@@ -1,36 +1,340 @@
 #!/usr/bin/env python
 """
 This Python script uses RTL-SDR to retrieve radio samples for the ADS-B frequency of 1090 and
-publishes those samples to a Kafka topic.
+publishes the messages decoded from those samples to a Kafka topic. In raw
+mode it publishes the samples themselves, as compressed IQ blocks, for
+adsb_consumer to decode on other hosts.
 """
 
+import asyncio
+import concurrent.futures
+import logging
+import time
+
+import adsb_archive
+import adsb_columns
+import adsb_dedup
+import adsb_diagnostics
+import adsb_feeds
+import adsb_metrics
+import adsb_multiprocess
+import adsb_pipeline
+import adsb_raw
+import adsb_receivers
+import adsb_record
 import adsb_rtlsdr
 import kafka
 
+# Every message is a small record, so the producer waits up to LINGER_MS to
+# fill batches of up to BATCH_SIZE bytes per partition and compresses every
+# batch as a whole.
+# https://kafka-python.readthedocs.io/en/master/apidoc/KafkaProducer.html
+LINGER_MS = 20
+BATCH_SIZE = 256 * 1024
+COMPRESSION_TYPE = "gzip"
+
+LOGGER = logging.getLogger(__name__)
+
 
 class AdsbProducer:
-    """Class for streaming samples of ADS-B (frequency 1090)"""
+    """
+    Class for streaming samples of ADS-B (frequency 1090). The samples come
+    from the dongle, opened when the producer runs, unless another source
+    with the streaming interface of AdsbRtlSdr, like adsb_replay.AdsbReplay,
+    is given. Given a list of source specs, see adsb_receivers, every source
+    is received in its own process instead.
+
+    The producer publishes the decoded messages or, with a raw topic set,
+    the raw IQ blocks of the source for adsb_consumer to decode.
+    """
 
-    def __init__(self):
-        self.sdr = adsb_rtlsdr.AdsbRtlSdr()
+    def __init__(self, sdr=None, sources=None):
+        self.sdr = sdr
+        self.sample_rate = adsb_rtlsdr.SAMPLE_RATE
+
+        # several sources decoded in worker processes, replacing sdr
+        self.receivers = None
+        if sources:
+            self.receivers = adsb_receivers.AdsbReceivers(sources)
+
+        self.raw_topic = None
 
         self.topic = ""
         self.producer = None
 
-    def configure(self, bootstrap_servers):
+        # number of records delivered to and rejected by the brokers
+        self.sent = 0
+        self.failed = 0
+
+        self.queue_size = adsb_pipeline.QUEUE_SIZE
+        self.queue_policy = adsb_pipeline.BLOCK
+        self.pipeline = None
+
+        # number of worker processes decoding the samples, none decodes them
+        # in the pipeline itself
+        self.decode_workers = None
+
+        self.diagnostics = None
+        self.metrics = None
+        self.dedup = None
+        self.feeds = None
+        self.archive = None
+
+        # single thread writing the archive in publish order
+        self.archiver = None
+
+    def configure(self, bootstrap_servers, compression_type=COMPRESSION_TYPE):
         """Configure the Kafka producer and topic"""
         self.producer = kafka.KafkaProducer(
-            bootstrap_servers=bootstrap_servers)
+            bootstrap_servers=bootstrap_servers,
+            linger_ms=LINGER_MS,
+            batch_size=BATCH_SIZE,
+            compression_type=compression_type
+        )
+
+    def on_send_success(self, sent_at, _):
+        self.sent += 1
+
+        if self.metrics is not None:
+            self.metrics.sent.inc()
+            self.metrics.send_latency.observe(time.monotonic() - sent_at)
+
+    def on_send_error(self, _, __):
+        self.failed += 1
 
-    def run(self):
+        if self.metrics is not None:
+            self.metrics.send_errors.inc()
+
+    @staticmethod
+    def on_archive_done(future):
+        if future.exception() is not None:
+            LOGGER.error("Archive write failed", exc_info=future.exception())
+
+    def publish(self, messages):
+        """
+        Publishes a batch of decoded messages into the kafka topic as binary
+        records keyed by ICAO address. Messages of multiple sources carry
+        their source ID as a record header. Delivery is reported
+        asynchronously through the send callbacks. A batch the feeds fail on
+        is logged and still published.
+        """
+
+        # the feeds, the archive and the keys all read the frames of the
+        # batch rather than the hex messages
+        messages = adsb_columns.as_batch(messages)
+
+        if self.feeds is not None:
+            try:
+                self.feeds.publish(messages)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Feeds failed on a batch of %d messages",
+                                 len(messages))
+
+        if self.archive is not None:
+            self.archiver.submit(self.archive.write, messages) \
+                .add_done_callback(self.on_archive_done)
+
+        sent_at = time.monotonic()
+
+        # the keys of the whole batch are computed at once
+        addresses = adsb_columns.icao_addresses(
+            messages.frames, messages.lengths).tolist()
+
+        sources = [None] * len(messages) if messages.sources is None \
+            else messages.sources.tolist()
+
+        for row, length, timestamp, signal_level, source, icao in zip(
+                messages.frames,
+                (messages.lengths // 8).tolist(),
+                messages.timestamps.tolist(),
+                messages.levels.tolist(),
+                sources,
+                addresses):
+            frame = row[:length].tobytes()
+
+            future = self.producer.send(
+                self.topic,
+                value=adsb_record.encode(frame, timestamp, signal_level),
+                key=icao.to_bytes(3, "big"),
+                headers=None if source is None
+                else [("source", source.encode())]
+            )
+            future.add_callback(self.on_send_success, sent_at)
+            future.add_errback(self.on_send_error, sent_at)
+
+    async def run(self):
         """Method for publishing samples into kafka topic using Python event loops."""
 
-        for messages in self.sdr.get_messages():
-            # Instead of stream, change the method to retrieve adsb messages
-            # this will encapsulate the rtlsdr
-            self.producer.send(self.topic, str(len(messages)))
+        if self.feeds is not None:
+            await self.feeds.start()
+
+        try:
+            await self.run_source()
+        finally:
+            if self.feeds is not None:
+                self.feeds.close()
+
+            if self.archive is not None:
+                # after the writes still queued
+                await asyncio.get_running_loop().run_in_executor(
+                    self.archiver, self.archive.close)
+                self.archiver.shutdown()
+
+            if self.diagnostics is not None:
+                self.diagnostics.close()
+
+    async def run_source(self):
+        """Publishes the messages or raw IQ blocks of the sources"""
+
+        if self.receivers is not None:
+            await self.run_receivers()
+            return
+
+        if self.sdr is None:
+            self.sdr = adsb_rtlsdr.AdsbRtlSdr(sample_rate=self.sample_rate)
+
+        if self.raw_topic is not None:
+            await self.run_raw()
+            return
+
+        sample_rate = getattr(self.sdr, "sample_rate", adsb_rtlsdr.SAMPLE_RATE)
+
+        pool = None
+        if self.decode_workers:
+            pool = adsb_multiprocess.AdsbDecodePool(
+                self.decode_workers, sample_rate=sample_rate)
+
+        self.pipeline = adsb_pipeline.AdsbPipeline(
+            self.sdr.stream_bytes(),
+            self.publish,
+            queue_size=self.queue_size,
+            policy=self.queue_policy,
+            diagnostics=self.diagnostics,
+            metrics=self.metrics,
+            dedup=self.dedup,
+            sample_rate=sample_rate,
+            pool=pool
+        )
+
+        try:
+            await self.pipeline.run()
+        finally:
+            if pool is not None:
+                pool.close()
+
+            self.producer.flush()
+            self.sdr.close()
+
+    async def run_raw(self):
+        """Publishes the raw IQ blocks of the source into the raw topic"""
+
+        blocker = adsb_raw.AdsbBlocker(
+            sample_rate=getattr(self.sdr, "sample_rate", adsb_rtlsdr.SAMPLE_RATE))
+
+        try:
+            async for data in self.sdr.stream_bytes():
+                for record in blocker.add(data, time.time()):
+                    self.publish_block(record)
+
+            for record in blocker.flush():
+                self.publish_block(record)
+        finally:
+            self.producer.flush()
+            self.sdr.close()
+
+    def publish_block(self, record):
+        """
+        Publishes a raw IQ block record without a key, so the blocks are
+        spread over the partitions and decoded by the whole consumer group
+        """
+
+        future = self.producer.send(self.raw_topic, value=record)
+        future.add_callback(self.on_send_success, time.monotonic())
+        future.add_errback(self.on_send_error, time.monotonic())
+
+    async def run_receivers(self):
+        """Publishes the merged messages of several sources"""
+
+        try:
+            async for messages in self.receivers.get_messages():
+                if self.dedup is not None:
+                    messages = self.dedup.filter(messages)
+
+                if messages:
+                    self.publish(messages)
+        finally:
+            self.producer.flush()
+
+    def set_archive(self, directory, segment_frames=adsb_archive.SEGMENT_FRAMES):
+        """
+        Also appends the decoded messages to an archive directory, from a
+        thread of its own so the disk never holds up the event loop
+        """
+        self.archive = adsb_archive.AdsbArchiveWriter(directory, segment_frames)
+        self.archiver = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def set_feeds(
+        self,
+        beast_port=adsb_feeds.BEAST_PORT,
+        sbs_port=adsb_feeds.SBS_PORT
+    ):
+        """
+        Also serves the decoded messages to local clients as Beast and SBS-1
+        feeds, a port of None disables its feed
+        """
+        self.feeds = adsb_feeds.AdsbFeeds(beast_port, sbs_port)
+
+    def set_raw_topic(self, topic):
+        """Publishes raw IQ blocks into the given topic instead of messages"""
+        self.raw_topic = topic
+
+    def set_dedup(self, window=adsb_dedup.WINDOW, rate_limits=None):
+        """
+        Suppresses repeated frames within window seconds, none when 0, and,
+        optionally, the messages of an aircraft exceeding the rate limit of
+        their kind
+        """
+        self.dedup = adsb_dedup.AdsbDeduplicator(window, rate_limits)
+
+    def set_decode_workers(self, workers):
+        """
+        Decodes the samples with a pool of worker processes, see
+        adsb_multiprocess, at the default 2 Msps sample rate only
+        """
+        self.decode_workers = workers
+
+    def set_diagnostics(
+        self,
+        directory,
+        psd_interval=adsb_diagnostics.PSD_INTERVAL,
+        pulse_interval=adsb_diagnostics.PULSE_INTERVAL
+    ):
+        """
+        Enables diagnostic plots of the signal, rendered to directory, one of
+        each kind every interval seconds of signal
+        """
+        self.diagnostics = adsb_diagnostics.AdsbDiagnostics(
+            directory, psd_interval, pulse_interval)
+
+    def set_metrics(self, port=adsb_metrics.PORT, profile=False):
+        """
+        Enables the pipeline metrics, served on the given local port, and
+        optionally profiles every stage
+        """
+        self.metrics = adsb_metrics.AdsbMetrics(profile)
+        self.metrics.serve(port)
+
+    def set_queue_policy(self, policy, size=adsb_pipeline.QUEUE_SIZE):
+        """Sets what the pipeline queues do when they are full"""
+        self.queue_policy = policy
+        self.queue_size = size
 
-        self.sdr.close()
+    def set_sample_rate(self, sample_rate):
+        """
+        Reads the dongle at the given sample rate, above 2 Msps the samples
+        are decoded by adsb_oversampled
+        """
+        self.sample_rate = sample_rate
 
     def set_topic(self, topic):
         self.topic = topic
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Raw IQ blocks published to Kafka, so decoding can run on other hosts than
+the receiver.
+
+The stream of the dongle is cut into fixed size blocks that can be decoded
+independently of each other. Every block starts with the tail of the block
+before it, laid out like the blocks of adsb_multiprocess, and only preambles
+from the owned index on belong to the block.
+
+Unlike the pool of adsb_multiprocess, the consumers do not know which
+preamble hits the block before accepted, so the skipping of hits inside an
+accepted message starts afresh from the first carried sample of every block.
+That is an approximation: it only differs from decoding the stream as a whole
+when the hits of the carried samples overlap each other all the way to the
+owned index, so that the skipping from the carried samples and from the
+block before never meet on the same hit. A message starting just past the
+owned index may then be decoded by both blocks or by neither.
+
+A block is published as a compressed record:
+
+    offset  size  field
+    0       4     magic b"ADIB"
+    4       1     format version
+    5       8     sequence number of the block, counted from 0
+    13      8     start time, float64 seconds since the epoch of sample 0
+    21      8     sample rate, float64 samples per second
+    29      4     overlap, samples repeated from the previous block
+    33      4     owned, index of the first sample whose preambles belong
+                  to the block
+    37      ...   zlib compressed interleaved unsigned 8 bit IQ bytes
+
+All fields are little-endian.
+"""
+
+import struct
+import zlib
+
+import adsb_capture
+import adsb_multiprocess
+import adsb_parser
+import adsb_rtlsdr
+import numpy
+
+BLOCK_HEADER = struct.Struct("<4sBQddII")
+BLOCK_MAGIC = b"ADIB"
+BLOCK_VERSION = 1
+
+# zlib favours speed, the receiver host is the one short on CPU
+COMPRESSION_LEVEL = 1
+
+# Number of new samples in a block, 256k samples is a record of about 512 kB,
+# below the default 1 MB record size limit of the brokers
+BLOCK_SIZE = adsb_parser.CHUNK_SIZE
+
+
+def encode(sequence, start_time, data, overlap=0, owned=0,
+           sample_rate=adsb_rtlsdr.SAMPLE_RATE):
+    """Returns the record of a block of raw IQ bytes"""
+
+    header = BLOCK_HEADER.pack(
+        BLOCK_MAGIC,
+        BLOCK_VERSION,
+        sequence,
+        start_time,
+        sample_rate,
+        overlap,
+        owned
+    )
+
+    return header + zlib.compress(
+        numpy.asarray(data, dtype=numpy.uint8).tobytes(), COMPRESSION_LEVEL)
+
+
+def decode(record):
+    """
+    Returns the (sequence, start time, IQ bytes, overlap, owned, sample rate)
+    of a block record
+    """
+
+    magic, version, sequence, start_time, sample_rate, overlap, owned = \
+        BLOCK_HEADER.unpack_from(record)
+
+    if magic != BLOCK_MAGIC or version != BLOCK_VERSION:
+        raise ValueError("Not a raw IQ block record")
+
+    data = numpy.frombuffer(
+        zlib.decompress(record[BLOCK_HEADER.size:]), dtype=numpy.uint8)
+
+    return sequence, start_time, data, overlap, owned, sample_rate
+
+
+def decode_messages(parser, record):
+    """
+    Returns the ADS-B messages owned by a block record, skipping overlapping
+    preamble hits from the start of the block, see the module documentation
+    """
+
+    _, start_time, data, _, owned, sample_rate = decode(record)
+
+    return adsb_multiprocess.decode_block(
+        parser,
+        adsb_rtlsdr.bytes_to_magnitude(data),
+        owned,
+        start_time,
+        sample_rate
+    )
+
+
+class AdsbBlocker:
+    """
+    Class cutting a stream of raw IQ byte chunks into block records.
+
+    Block start times are counted from the samples read, anchored to the
+    time the last chunk was received.
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE,
+                 sample_rate=adsb_rtlsdr.SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.block_bytes = (
+            adsb_multiprocess.CARRY + block_size) * adsb_capture.SAMPLE_BYTES
+        self.carry_bytes = adsb_multiprocess.CARRY * adsb_capture.SAMPLE_BYTES
+
+        self.buffer = numpy.zeros(self.block_bytes, dtype=numpy.uint8)
+        self.length = 0
+        self.overlap = 0
+        self.owned = 0
+        self.sequence = 0
+
+        # sample number of the first sample of the block and the number of
+        # samples read up to the last chunk
+        self.block_start = 0
+        self.samples_read = 0
+        self.received = None
+
+    def add(self, data, received):
+        """
+        Adds a chunk of raw IQ bytes received at the given time and yields
+        the records of the blocks it completes
+        """
+
+        data = numpy.frombuffer(data, dtype=numpy.uint8)
+        self.samples_read += len(data) // adsb_capture.SAMPLE_BYTES
+        self.received = received
+
+        offset = 0
+        while offset < len(data):
+            count = min(self.block_bytes - self.length, len(data) - offset)
+            self.buffer[self.length:self.length + count] = \
+                data[offset:offset + count]
+            self.length += count
+            offset += count
+
+            if self.length == self.block_bytes:
+                yield self.record()
+
+                # the next block starts with the tail of this one
+                self.buffer[:self.carry_bytes] = \
+                    self.buffer[-self.carry_bytes:]
+                self.length = self.carry_bytes
+                self.overlap = adsb_multiprocess.CARRY
+                self.owned = adsb_multiprocess.OVERLAP
+                self.block_start += (
+                    self.block_bytes - self.carry_bytes
+                ) // adsb_capture.SAMPLE_BYTES
+
+    def flush(self):
+        """Yields the record of the last, partial block"""
+
+        samples = self.length // adsb_capture.SAMPLE_BYTES
+        if samples >= self.owned + adsb_parser.MESSAGE_LENGTH:
+            yield self.record()
+
+        self.length = 0
+
+    def record(self):
+        """Returns the record of the block in the buffer"""
+
+        start_time = self.received - (
+            self.samples_read - self.block_start) / self.sample_rate
+
+        record = encode(
+            self.sequence,
+            start_time,
+            self.buffer[:self.length],
+            self.overlap,
+            self.owned,
+            self.sample_rate
+        )
+        self.sequence += 1
+
+        return record
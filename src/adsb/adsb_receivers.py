@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Receives ADS-B from several sources at once, one process per source.
+
+Every source is a dongle, a capture file or a replay, given as a spec:
+
+    rtlsdr:<index or serial>    dongle by device index or serial number
+    capture:<path>              capture file, decoded as fast as possible
+    replay:<path>[@<speed>]     capture file at a multiple of real time
+
+A spec may be prefixed with "<id>=" to name the source, otherwise the spec
+itself is the source ID. Every process streams its source through its own
+StreamingAdsbParser and sends the decoded messages, tagged with the source
+ID, back with a watermark: the time of the oldest sample it has not parsed
+yet. Recordings are timestamped from their sample count since the start of
+the replay. Messages of all the sources are merged by their sample clock
+timestamp and released once every source still running has passed their
+time. A source whose process dies without ending its stream is ended once
+nothing has been received for POLL_INTERVAL seconds, so it never holds up
+the rest.
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import queue
+import time
+
+import adsb_columns
+import adsb_oversampled
+import adsb_replay
+import adsb_rtlsdr
+import numpy
+
+RTLSDR = "rtlsdr"
+CAPTURE = "capture"
+REPLAY = "replay"
+
+KINDS = [RTLSDR, CAPTURE, REPLAY]
+
+# Seconds without results after which the worker processes are checked
+POLL_INTERVAL = 1.0
+
+LOGGER = logging.getLogger(__name__)
+
+
+def parse_source(spec):
+    """Returns the (source ID, kind, argument) of a source spec"""
+
+    source_id, separator, source = spec.partition("=")
+    if not separator or ":" in source_id:
+        source_id = source = spec
+
+    kind, _, argument = source.partition(":")
+    if kind not in KINDS:
+        raise ValueError(f"Unknown source: {spec}")
+
+    return source_id, kind, argument
+
+
+def open_source(kind, argument):
+    """Returns the source of a parsed spec, with the interface of AdsbRtlSdr"""
+
+    if kind == RTLSDR:
+        if argument.isdigit() or not argument:
+            return adsb_rtlsdr.AdsbRtlSdr(device_index=int(argument or 0))
+        return adsb_rtlsdr.AdsbRtlSdr(serial_number=argument)
+
+    if kind == CAPTURE:
+        return adsb_replay.AdsbReplay.from_capture(argument, speed=None)
+
+    path, _, speed = argument.rpartition("@")
+    if not path:
+        path, speed = argument, adsb_replay.SPEED
+
+    return adsb_replay.AdsbReplay.from_capture(path, speed=float(speed))
+
+
+async def forward(source_id, kind, argument, results):
+    """Decodes a source and puts its messages on the results queue"""
+
+    source = None
+    messages = []
+
+    try:
+        source = open_source(kind, argument)
+        sample_rate = getattr(source, "sample_rate", adsb_rtlsdr.SAMPLE_RATE)
+        parser = adsb_oversampled.streaming_parser(sample_rate)
+
+        # Recordings are replayed faster than real time, so their clock runs
+        # on the sample count from the start of the replay instead of the
+        # time chunks are received
+        begin = time.time()
+        received = None
+
+        async for data in source.stream_bytes():
+            if kind != RTLSDR:
+                received = begin + (parser.samples_read + len(data) // 2) \
+                    / sample_rate
+
+            results.put((
+                source_id,
+                parser.feed_bytes_batch(data, received),
+                parser.watermark
+            ))
+
+        messages = parser.flush_batch()
+    finally:
+        if source is not None:
+            source.close()
+
+        # a watermark of None marks the end of the source
+        results.put((source_id, messages, None))
+
+
+def receive_worker(source_id, kind, argument, results):
+    """Worker process receiving a single source"""
+    asyncio.run(forward(source_id, kind, argument, results))
+
+
+class AdsbMerger:
+    """
+    Class merging the messages of several sources in timestamp order.
+
+    Messages are held until every running source has reported a watermark
+    past their timestamp, so a message is never released before an older
+    one of another source. The held messages are kept as a single batch in
+    arrival order and every release is sorted at once, keeping equal
+    timestamps in arrival order.
+    """
+
+    def __init__(self, sources):
+        self.watermarks = dict.fromkeys(sources, -math.inf)
+        self.pending = adsb_columns.AdsbMessages.empty()
+
+    def __bool__(self):
+        return bool(self.watermarks)
+
+    def __contains__(self, source_id):
+        return source_id in self.watermarks
+
+    def add(self, source_id, messages, watermark):
+        """
+        Adds the messages of a source, tagged with its ID, and returns the
+        messages that can be released
+        """
+
+        self.pending = adsb_columns.AdsbMessages.concatenate([
+            self.pending, adsb_columns.as_batch(messages).tag(source_id)])
+
+        if watermark is None:
+            self.watermarks.pop(source_id, None)
+        else:
+            self.watermarks[source_id] = watermark
+
+        limit = min(self.watermarks.values(), default=math.inf)
+
+        timestamps = self.pending.timestamps
+        released = numpy.flatnonzero(timestamps <= limit)
+        if not len(released):
+            return adsb_columns.AdsbMessages.empty()
+
+        order = numpy.argsort(timestamps[released], kind="stable")
+        messages = self.pending.select(released[order])
+        self.pending = self.pending.select(timestamps > limit)
+
+        return messages
+
+
+class AdsbReceivers:
+    """
+    Class for receiving several sources, each decoded in its own process,
+    as a single stream of messages
+    """
+
+    def __init__(self, sources):
+        self.sources = [parse_source(spec) for spec in sources]
+
+        source_ids = [source_id for source_id, _, _ in self.sources]
+        if len(set(source_ids)) != len(source_ids):
+            raise ValueError(f"Duplicate source IDs: {source_ids}")
+
+        self.results = multiprocessing.Queue()
+        self.workers = []
+
+    def start(self):
+        """Starts a worker process for every source"""
+
+        self.workers = [
+            multiprocessing.Process(
+                target=receive_worker,
+                args=(source_id, kind, argument, self.results),
+                daemon=True
+            )
+            for source_id, kind, argument in self.sources
+        ]
+
+        for worker in self.workers:
+            worker.start()
+
+    def close(self):
+        """Stops the worker processes"""
+
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+        self.workers = []
+
+    def end_dead_sources(self, merger):
+        """
+        Ends the sources of the worker processes that died without ending
+        their stream and returns the messages that can be released
+        """
+
+        released = []
+
+        for (source_id, _, _), worker in zip(self.sources, self.workers):
+            if source_id in merger and not worker.is_alive():
+                LOGGER.error("Source %s died with exit code %s",
+                             source_id, worker.exitcode)
+                released.append(merger.add(source_id, [], None))
+
+        return adsb_columns.AdsbMessages.concatenate(released)
+
+    async def get_messages(self):
+        """
+        Yields the merged messages of all the sources in batches, every
+        message tagged with its source ID, until every source has ended
+        """
+
+        loop = asyncio.get_running_loop()
+        merger = AdsbMerger(source_id for source_id, _, _ in self.sources)
+
+        self.start()
+        try:
+            while merger:
+                try:
+                    result = await loop.run_in_executor(
+                        None, self.results.get, True, POLL_INTERVAL)
+                except queue.Empty:
+                    messages = self.end_dead_sources(merger)
+                else:
+                    messages = merger.add(*result)
+
+                if messages:
+                    yield messages
+        finally:
+            self.close()
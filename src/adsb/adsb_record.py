@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Compact binary record of a single decoded Mode S message, the value published
+to Kafka for every message.
+
+    offset  size  field
+    0       8     timestamp, float64 seconds since the epoch
+    8       4     signal level, float32 mean magnitude of the preamble pulses
+    12      1     message length in bytes, 7 or 14
+    13      7/14  raw message bytes
+
+All fields are little-endian. Records are keyed by the 3 byte ICAO address of
+the aircraft so all the messages of an aircraft land on the same partition
+and keep their order.
+"""
+
+import struct
+
+import adsb_crc
+
+RECORD_HEADER = struct.Struct("<dfB")
+
+# Downlink formats that carry the ICAO address in bytes 2 to 4, the others
+# overlay it on the parity
+# https://mode-s.org/decode/content/ads-b/8-error-control.html
+ADDRESS_FORMATS = [11, 17, 18]
+
+
+def encode(frame, timestamp, signal_level):
+    """Returns the binary record of a message given as raw bytes"""
+    return RECORD_HEADER.pack(timestamp, signal_level, len(frame)) + frame
+
+
+def decode(record):
+    """Returns the (frame, timestamp, signal level) stored in a record"""
+
+    timestamp, signal_level, length = RECORD_HEADER.unpack_from(record)
+    start = RECORD_HEADER.size
+
+    return bytes(record[start:start + length]), timestamp, signal_level
+
+
+def icao_address(frame):
+    """Returns the 3 byte ICAO address of the aircraft that sent a message"""
+
+    if frame[0] >> 3 in ADDRESS_FORMATS:
+        return bytes(frame[1:4])
+
+    return adsb_crc.syndrome(frame).to_bytes(3, "big")
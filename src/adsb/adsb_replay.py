@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Replays recorded or synthetic raw IQ bytes in place of the dongle, so the
+whole producer pipeline can be load tested and profiled without a receiver.
+
+The replay has the streaming interface of AdsbRtlSdr. Chunks are released at
+the rate the dongle would deliver them, at a multiple of that rate, or as
+fast as the pipeline takes them, and the recording can be looped forever.
+"""
+
+import asyncio
+
+import adsb_capture
+import adsb_oversampled
+import adsb_parser
+import adsb_rtlsdr
+import adsb_signal
+import numpy
+
+# Number of samples in a chunk of the replay
+CHUNK_SIZE = adsb_parser.CHUNK_SIZE
+
+# Multiple of the real time rate chunks are replayed at, None replays them as
+# fast as they are taken
+SPEED = 1.0
+
+# Replies per second of a synthetic recording, a busy site
+FRAMES_PER_SECOND = 1000
+
+
+class AdsbReplay:
+    """Class for streaming a recording of raw IQ bytes like AdsbRtlSdr"""
+
+    def __init__(
+        self,
+        data,
+        sample_rate=adsb_rtlsdr.SAMPLE_RATE,
+        speed=SPEED,
+        loop=False,
+        chunk_size=CHUNK_SIZE
+    ):
+        self.data = numpy.asarray(data, dtype=numpy.uint8)
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.loop = loop
+        self.chunk_size = chunk_size
+
+        self.closed = False
+
+    @classmethod
+    def from_capture(cls, path, **kwargs):
+        """Returns a replay of a capture file"""
+
+        capture = adsb_capture.AdsbCaptureReader(path)
+        return cls(capture.data, capture.sample_rate, **kwargs)
+
+    @classmethod
+    def synthetic(
+        cls,
+        seconds,
+        frames_per_second=FRAMES_PER_SECOND,
+        snr=20,
+        seed=None,
+        **kwargs
+    ):
+        """Returns a replay of seconds of random synthetic replies"""
+
+        length = int(seconds * adsb_rtlsdr.SAMPLE_RATE)
+        rng = numpy.random.default_rng(seed)
+        frames = adsb_signal.random_frames(
+            max(1, int(seconds * frames_per_second)), rng)
+
+        signal, _ = adsb_signal.generate(frames, length, snr=snr, seed=seed)
+
+        return cls(adsb_signal.iq_to_bytes(signal), **kwargs)
+
+    def close(self):
+        """Stops the replay"""
+        self.closed = True
+
+    def chunks(self):
+        """Yields the raw IQ bytes in chunks, over and over when looping"""
+
+        step = self.chunk_size * adsb_capture.SAMPLE_BYTES
+
+        while not self.closed and len(self.data):
+            for start in range(0, len(self.data), step):
+                if self.closed:
+                    return
+                yield self.data[start:start + step]
+
+            if not self.loop:
+                return
+
+    async def stream_bytes(self):
+        """
+        Streams the raw interleaved IQ bytes, releasing every chunk once the
+        dongle would have received all of its samples
+        """
+
+        loop = asyncio.get_running_loop()
+        begin = loop.time()
+        samples = 0
+
+        for chunk in self.chunks():
+            samples += len(chunk) // adsb_capture.SAMPLE_BYTES
+
+            delay = 0
+            if self.speed:
+                delay = begin + samples / (
+                    self.sample_rate * self.speed) - loop.time()
+
+            # always yields to the event loop, even when not pacing
+            await asyncio.sleep(max(delay, 0))
+
+            yield chunk
+
+    async def get_messages(self):
+        """Parses the replay and yields the ADS-B messages of every chunk"""
+
+        parser = adsb_oversampled.streaming_parser(self.sample_rate)
+
+        async for data in self.stream_bytes():
+            yield parser.feed_bytes_batch(data)
+
+        # unlike the dongle the replay ends
+        yield parser.flush_batch()
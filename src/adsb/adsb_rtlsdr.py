@@ -12,36 +12,87 @@ number of years.
 https://mode-s.org/decode/content/ads-b/1-basics.html
 """
 
-import rtlsdr
+import numpy
 
 # The Secondar Surveillance Radar (SSR) transmits interrogations using the
 # 1030 MHz radio frequency and the aircraft transponder transmits replies using
 # the 1090 MHz radio frequency.
 CENTER_FREQUENCY = 1090e6
 
+# One sample per 0.5 μs chip. Faster rates, see adsb_oversampled, catch the
+# frames that start between two samples.
 SAMPLE_RATE = 2e6
 
+# The dongle delivers every sample as an unsigned 8 bit I byte followed by an
+# unsigned 8 bit Q byte, centered on 127.5. Read as a little-endian uint16,
+# each pair indexes this table of all 65,536 possible magnitudes, which skips
+# the conversion to complex128 and the square root for every sample. The
+# magnitudes are scaled the same as numpy.absolute of the pyrtlsdr samples.
+#
+# https://osmocom.org/projects/rtl-sdr/wiki/Rtl-sdr
+IQ_LEVELS = (numpy.arange(256, dtype=numpy.float32) - 127.5) / 127.5
+IQ_PAIRS = numpy.arange(65536)
+MAGNITUDE_TABLE = numpy.hypot(IQ_LEVELS[IQ_PAIRS & 0xFF], IQ_LEVELS[IQ_PAIRS >> 8])
+
+
+def iq_pairs(data):
+    """Returns raw interleaved IQ bytes as one uint16 value per sample"""
+    return numpy.asarray(data, dtype=numpy.uint8).view("<u2")
+
+
+def lookup_magnitude(pairs, out=None):
+    """Returns the magnitude of each IQ pair using the magnitude table"""
+    return numpy.take(MAGNITUDE_TABLE, pairs, out=out, mode="clip")
+
+
+def bytes_to_magnitude(data):
+    """Returns the magnitude of every sample in raw interleaved IQ bytes"""
+    return lookup_magnitude(iq_pairs(data))
+
 
 class AdsbRtlSdr:
-    """Class for streaming samples of ADS-B"""
+    """
+    Class for streaming samples of ADS-B from the dongle with the given
+    device index, or the given serial number when there are several, at the
+    given sample rate
+    """
+
+    def __init__(self, device_index=0, serial_number=None,
+                 sample_rate=SAMPLE_RATE):
+        # imported here so the parsers can use the magnitude table and
+        # constants of this module on machines without librtlsdr
+        import rtlsdr  # pylint: disable=import-outside-toplevel
 
-    def __init__(self):
-        self.sdr = rtlsdr.RtlSdr()
-        self.sdr.sample_rate = SAMPLE_RATE
+        self.sample_rate = sample_rate
+
+        self.sdr = rtlsdr.RtlSdr(
+            device_index=device_index, serial_number=serial_number)
+        self.sdr.sample_rate = sample_rate
         self.sdr.center_freq = CENTER_FREQUENCY
         self.sdr.gain = "auto"
 
     def close(self):
         return self.sdr.close()
 
+    async def stream_bytes(self):
+        """Streams the raw interleaved IQ bytes of the dongle"""
+
+        async for data in self.sdr.stream(format="bytes"):
+            # copied since the dongle reuses its transfer buffers
+            yield numpy.frombuffer(data, dtype=numpy.uint8).copy()
+
+        await self.sdr.stop()
+
     async def get_messages(self):
         """
-            Parses the current RTL-SDR stream and returns the ADS-B messages
+            Parses the current RTL-SDR stream and yields the ADS-B messages of
+            every chunk
         """
 
-        async for samples in self.sdr.stream():
-            # parse the samples
-            print(str(len(samples)))
+        # imported here since the parser depends on this module
+        import adsb_oversampled  # pylint: disable=import-outside-toplevel
 
-        await self.sdr.stop()
-        return []
+        parser = adsb_oversampled.streaming_parser(self.sample_rate)
+
+        async for data in self.stream_bytes():
+            yield parser.feed_bytes_batch(data)
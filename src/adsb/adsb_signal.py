@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+"""
+Generates synthetic ADS-B IQ samples, so the decoder can be exercised on a
+machine without a dongle.
+
+Known Mode S frames are Pulse Position Modulated into the magnitude envelope
+of a 1090 MHz reply, shifted by a carrier frequency offset, buried in complex
+white Gaussian noise at a given Signal to Noise Ratio (SNR) and quantized to
+the unsigned 8 bit IQ bytes the dongle delivers. Every sample integrates the
+envelope over its sampling interval, so sample rates that are not a multiple
+of the 2 MHz chip rate and frames starting between two samples come out the
+way a real receiver sees them.
+
+https://mode-s.org/decode/content/ads-b/1-basics.html
+"""
+
+import adsb_crc
+import adsb_parser
+import adsb_rtlsdr
+import numpy
+
+# Mode S pulses are 0.5 μs chips, the preamble is 16 chips followed by two
+# chips per data bit
+CHIP_RATE = 2e6
+
+# Amplitude of a pulse relative to the full scale of the dongle, leaving
+# headroom for noise and overlapping replies
+AMPLITUDE = 0.5
+
+# Capability of a generated DF17 frame, airborne with any level
+CAPABILITY = 5
+
+
+def make_frame(icao, me, downlink_format=17, capability=CAPABILITY):
+    """
+    Returns a 14 byte extended squitter for the given ICAO address and 56 bit
+    ME field with a correct parity.
+    """
+
+    data = (
+        (downlink_format << 83)
+        | (capability << 80)
+        | (icao << 56)
+        | me
+    ).to_bytes(11, "big")
+
+    frame = numpy.zeros((1, adsb_crc.MESSAGE_BYTES), dtype=numpy.uint8)
+    frame[0, :11] = list(data)
+    parity = int(adsb_crc.checksum(frame, 11)[0])
+
+    return data + parity.to_bytes(adsb_crc.CRC_BYTES, "big")
+
+
+def random_frames(count, rng):
+    """Returns count DF17 frames with random addresses and content"""
+
+    return [
+        make_frame(
+            int(rng.integers(1, 1 << 24)),
+            int(rng.integers(0, 1 << 56, dtype=numpy.uint64))
+        )
+        for _ in range(count)
+    ]
+
+
+def chips(frame):
+    """Returns the on/off chips of the preamble and PPM data of a frame"""
+
+    bits = numpy.unpackbits(numpy.frombuffer(frame, dtype=numpy.uint8))
+
+    # A 1 bit is a pulse followed by a flat chip, a 0 bit the reverse
+    data = numpy.empty(2 * len(bits), dtype=numpy.float64)
+    data[0::2] = bits
+    data[1::2] = 1 - bits
+
+    return numpy.concatenate([adsb_parser.PREAMBLE, data])
+
+
+def envelope(frame, start, sample_rate=adsb_rtlsdr.SAMPLE_RATE):
+    """
+    Returns the first sample index and the sampled magnitude envelope of a
+    frame starting start samples into the signal, start may be fractional.
+    Every sample is the mean of the chips over its sampling interval.
+    """
+
+    sequence = chips(frame)
+    chips_per_sample = CHIP_RATE / sample_rate
+
+    first = int(numpy.floor(start))
+    count = int(numpy.ceil(
+        start + len(sequence) / chips_per_sample)) - first + 1
+
+    # sample edges in chips since the start of the frame
+    edges = (first + numpy.arange(count + 1) - start) * chips_per_sample
+    edges = numpy.clip(edges, 0, len(sequence))
+
+    # integral of the chips up to every edge
+    cumulative = numpy.concatenate([[0], numpy.cumsum(sequence)])
+    whole = numpy.floor(edges).astype(int)
+    partial = edges - whole
+    integral = cumulative[whole] + partial * numpy.append(sequence, 0)[whole]
+
+    return first, numpy.diff(integral) / chips_per_sample
+
+
+def generate(
+    frames,
+    length,
+    snr=20,
+    frequency_offset=0,
+    overlap=0,
+    sample_rate=adsb_rtlsdr.SAMPLE_RATE,
+    amplitude=AMPLITUDE,
+    phase=None,
+    seed=None
+):
+    """
+    Generates length complex samples holding the given frames.
+
+    Frames are spread over the signal at random fractional sample positions,
+    without overlapping each other except for the given fraction of frames,
+    which start part way through the previous frame. snr is the ratio of the
+    pulse power to the noise power in dB and frequency_offset the carrier
+    offset from the center frequency in Hz. Given a phase, every frame starts
+    that fraction of a sample after a whole sample instead.
+
+    Returns the samples and the fractional start sample of every frame.
+    """
+
+    rng = numpy.random.default_rng(seed)
+
+    # room for a frame and a gap of the same length
+    frame_length = adsb_parser.MESSAGE_LENGTH * sample_rate / CHIP_RATE
+    slot = 2 * frame_length
+
+    # the last slot is left out so that a frame starting at its very end
+    # still fits
+    count = int(length // slot) - 1
+    if len(frames) > count:
+        raise ValueError("Too many frames for the signal length")
+
+    slots = numpy.sort(rng.choice(count, size=len(frames), replace=False))
+    starts = (slots + rng.random(len(frames))) * slot
+
+    # an overlapping frame starts part way through the previous frame once
+    # that one has been placed, so a run of overlapping frames is chained
+    overlapping = rng.random(len(frames)) < overlap
+    overlapping[0] = False
+    offsets = rng.uniform(0.2, 0.8, len(frames)) * frame_length
+    for index in numpy.flatnonzero(overlapping).tolist():
+        starts[index] = starts[index - 1] + offsets[index]
+
+    if phase is not None:
+        starts = numpy.floor(starts) + phase
+
+    magnitude = numpy.zeros(length)
+    carrier = numpy.zeros(length)
+
+    for frame, start in zip(frames, starts):
+        first, pulses = envelope(frame, start, sample_rate)
+        pulses = pulses[:length - first]
+
+        # overlapping replies add up with their own carrier phase
+        reply = magnitude[first:first + len(pulses)] * numpy.exp(
+            1j * carrier[first:first + len(pulses)])
+        reply += amplitude * pulses * numpy.exp(
+            1j * rng.uniform(0, 2 * numpy.pi))
+        magnitude[first:first + len(pulses)] = numpy.abs(reply)
+        carrier[first:first + len(pulses)] = numpy.angle(reply)
+
+    time = numpy.arange(length) / sample_rate
+    signal = magnitude * numpy.exp(
+        1j * (carrier + 2 * numpy.pi * frequency_offset * time))
+
+    noise_deviation = amplitude / numpy.sqrt(2 * 10 ** (snr / 10))
+    signal += rng.normal(0, noise_deviation, length) \
+        + 1j * rng.normal(0, noise_deviation, length)
+
+    return signal.astype(numpy.complex64), starts
+
+
+def iq_to_bytes(samples):
+    """Quantizes complex samples into interleaved unsigned 8 bit IQ bytes"""
+
+    data = numpy.empty(2 * len(samples), dtype=numpy.float32)
+    data[0::2] = samples.real
+    data[1::2] = samples.imag
+
+    return numpy.clip(
+        numpy.round(data * 127.5 + 127.5), 0, 255).astype(numpy.uint8)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+"""
+Grid index over the positions of the tracked aircraft, answering radius,
+bounding box and nearest aircraft queries without scanning every aircraft.
+
+The earth is cut into cells of CELL_SIZE degrees of latitude and longitude.
+The longitude of a cell is narrowed to fit a whole number of cells around the
+earth, so they wrap around the antimeridian without a narrower last one.
+Every aircraft is kept in the set of its cell and moved when it crosses into
+another one, so a query only visits the cells overlapping its area. Nearest
+aircraft queries search rings of cells around the point, outwards, until no
+unvisited cell can hold anything closer.
+
+Positions that are not updated for ttl seconds expire, the oldest first.
+Every update and every query expires them at its own time, so a query never
+returns an aircraft that has not been heard from for longer than ttl.
+
+https://en.wikipedia.org/wiki/Haversine_formula
+"""
+
+import collections
+import heapq
+import math
+
+# Degrees of latitude and longitude of a cell, about 15 nm north to south
+CELL_SIZE = 0.25
+
+# Seconds a position is kept after its last update
+TTL = 60
+
+# Mean radius of the earth in nautical miles
+EARTH_RADIUS = 3440.065
+
+NM_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Returns the great circle distance between two points in nautical miles"""
+
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * \
+        math.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class AdsbSpatialIndex:
+    """
+    Class indexing aircraft positions by ICAO address in a lat/lon grid.
+
+    Positions are kept in least recently updated order, so updating a
+    position and expiring the idle ones are both O(1).
+    """
+
+    def __init__(self, cell_size=CELL_SIZE, ttl=TTL):
+        self.cell_size = cell_size
+        self.ttl = ttl
+
+        self.rows = math.ceil(180 / cell_size)
+        self.columns = math.ceil(360 / cell_size)
+
+        # degrees of longitude of a cell, at most cell_size
+        self.column_size = 360 / self.columns
+
+        # (latitude, longitude, timestamp, cell) of every aircraft and the
+        # addresses in every non-empty cell
+        self.positions = collections.OrderedDict()
+        self.cells = collections.defaultdict(set)
+
+    def __contains__(self, icao):
+        return icao in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def cell(self, latitude, longitude):
+        """Returns the (row, column) of the cell of a position"""
+
+        row = min(int((latitude + 90) / self.cell_size), self.rows - 1)
+        return row, self.column(longitude) % self.columns
+
+    def column(self, longitude):
+        """
+        Returns the column of a longitude, 180 degrees being one past the
+        last column
+        """
+        return int((longitude + 180) / self.column_size)
+
+    def get(self, icao):
+        """Returns the (latitude, longitude) of an aircraft or None"""
+
+        position = self.positions.get(icao)
+        return position[:2] if position is not None else None
+
+    def update(self, icao, latitude, longitude, timestamp):
+        """Sets the position of an aircraft, moving it to its new cell"""
+
+        self.expire(timestamp)
+
+        cell = self.cell(latitude, longitude)
+
+        previous = self.positions.pop(icao, None)
+        if previous is not None and previous[3] != cell:
+            self.discard(icao, previous[3])
+
+        self.positions[icao] = (latitude, longitude, timestamp, cell)
+        self.cells[cell].add(icao)
+
+    def remove(self, icao):
+        """Removes an aircraft from the index"""
+
+        position = self.positions.pop(icao, None)
+        if position is not None:
+            self.discard(icao, position[3])
+
+    def discard(self, icao, cell):
+        """Removes an address from a cell, dropping the cell once empty"""
+
+        addresses = self.cells[cell]
+        addresses.discard(icao)
+        if not addresses:
+            del self.cells[cell]
+
+    def expire(self, now):
+        """Removes the positions not updated for ttl seconds"""
+
+        while self.positions:
+            icao, position = next(iter(self.positions.items()))
+            if now - position[2] <= self.ttl:
+                break
+            self.positions.popitem(last=False)
+            self.discard(icao, position[3])
+
+    def scan(self, rows, columns):
+        """Yields the (icao, latitude, longitude) of a range of cells"""
+
+        for row in rows:
+            if not 0 <= row < self.rows:
+                continue
+
+            for column in columns:
+                addresses = self.cells.get((row, column % self.columns))
+                if not addresses:
+                    continue
+
+                for icao in addresses:
+                    latitude, longitude, _, _ = self.positions[icao]
+                    yield icao, latitude, longitude
+
+    def box(self, south, west, north, east, now):
+        """
+        Returns the addresses of the aircraft inside a bounding box at time
+        now, which crosses the antimeridian when west is greater than east
+        """
+
+        self.expire(now)
+
+        south_row, _ = self.cell(south, west)
+        north_row, _ = self.cell(north, east)
+
+        west_column = self.column(west)
+        east_column = self.column(east)
+        crosses = east < west
+        if crosses:
+            east_column += self.columns
+
+        columns = range(west_column, east_column + 1)
+        if len(columns) > self.columns:
+            columns = range(self.columns)
+
+        return [
+            icao
+            for icao, latitude, longitude in self.scan(
+                range(south_row, north_row + 1), columns)
+            if south <= latitude <= north and (
+                (west <= longitude or longitude <= east) if crosses
+                else west <= longitude <= east
+            )
+        ]
+
+    def radius(self, latitude, longitude, radius, now):
+        """
+        Returns the (distance, icao) of the aircraft within radius nautical
+        miles of a point at time now, in no particular order
+        """
+
+        self.expire(now)
+
+        degrees = radius / NM_PER_DEGREE
+        rows, columns = self.around(latitude, longitude, degrees)
+
+        results = []
+        for icao, lat, lon in self.scan(rows, columns):
+            nm = distance(latitude, longitude, lat, lon)
+            if nm <= radius:
+                results.append((nm, icao))
+
+        return results
+
+    def around(self, latitude, longitude, degrees):
+        """
+        Returns the rows and columns of the cells within the given degrees of
+        latitude of a point
+        """
+
+        row, column = self.cell(latitude, longitude)
+        row_span = math.ceil(degrees / self.cell_size)
+
+        # a degree of longitude shrinks towards the poles
+        highest = min(abs(latitude) + degrees, 90)
+        if highest >= 89.999:
+            column_span = self.columns
+        else:
+            column_span = min(self.columns, math.ceil(
+                degrees / math.cos(math.radians(highest)) / self.column_size))
+
+        columns = range(column - column_span, column + column_span + 1)
+        if len(columns) > self.columns:
+            columns = range(self.columns)
+
+        return range(row - row_span, row + row_span + 1), columns
+
+    def nearest(self, latitude, longitude, count, now):
+        """
+        Returns the (distance, icao) of the nearest aircraft at time now,
+        closest first
+        """
+
+        self.expire(now)
+
+        if count <= 0:
+            return []
+
+        row, column = self.cell(latitude, longitude)
+
+        # max heap of the closest aircraft found so far
+        closest = []
+        visited = set()
+
+        ring = 0
+        while len(visited) < len(self.cells):
+            for cell in self.ring(row, column, ring):
+                if cell in visited or cell not in self.cells:
+                    continue
+                visited.add(cell)
+
+                for icao in self.cells[cell]:
+                    lat, lon, _, _ = self.positions[icao]
+                    item = (-distance(latitude, longitude, lat, lon), icao)
+                    if len(closest) < count:
+                        heapq.heappush(closest, item)
+                    elif item > closest[0]:
+                        heapq.heapreplace(closest, item)
+
+            if len(closest) == len(self.positions):
+                break
+
+            # no unvisited cell is closer than the rings searched so far
+            if len(closest) == count and -closest[0][0] <= self.covered(
+                    latitude, ring):
+                break
+
+            ring += 1
+            if ring > max(self.rows, self.columns):
+                break
+
+        return sorted((-nm, icao) for nm, icao in closest)
+
+    def ring(self, row, column, ring):
+        """Yields the cells at the given ring distance around a cell"""
+
+        for r in range(row - ring, row + ring + 1):
+            if not 0 <= r < self.rows:
+                continue
+
+            if abs(r - row) == ring:
+                columns = range(column - ring, column + ring + 1)
+            else:
+                columns = (column - ring, column + ring)
+
+            for c in columns:
+                yield r, c % self.columns
+
+    def covered(self, latitude, ring):
+        """
+        Returns the distance in nautical miles within which every cell has
+        been searched after the given ring around a point
+        """
+
+        highest = min(abs(latitude) + (ring + 1) * self.cell_size, 90)
+        return ring * self.column_size * NM_PER_DEGREE * math.cos(
+            math.radians(highest))
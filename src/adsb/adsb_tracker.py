@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+"""
+Keeps the state of every aircraft heard by the receiver, built up from the
+ADS-B messages of the aircraft.
+
+Positions are broadcast in Compact Position Reporting (CPR) format, which
+alternates between even and odd frames. The first position of an aircraft
+needs an even and an odd frame received close together (global decoding);
+afterwards every single frame is decoded relative to the last known position
+(local decoding). Surface positions are only decoded with a reference
+position, the receiver's or the aircraft's last known one, and frames are
+only paired with frames of the same position class, since surface, barometric
+and GNSS positions encode their coordinates differently.
+
+https://mode-s.org/decode/content/ads-b/3-airborne-position.html
+"""
+
+import collections
+
+import pyModeS
+
+# Seconds an aircraft is kept after its last message
+TTL = 60
+
+# Upper bound on the number of aircraft tracked at once, the aircraft idle
+# the longest is evicted first
+MAX_AIRCRAFT = 10000
+
+# Seconds between an even and an odd frame for global position decoding.
+# Frames further apart may belong to different CPR zones.
+CPR_PAIR_WINDOW = 10
+
+# Seconds a known position stays valid as a local decoding reference
+REFERENCE_TTL = 180
+
+# ADS-B type codes
+# https://mode-s.org/decode/content/ads-b/1-basics.html
+IDENTIFICATION_TYPECODES = range(1, 5)
+SURFACE_POSITION_TYPECODES = range(5, 9)
+AIRBORNE_POSITION_TYPECODES = list(range(9, 19)) + list(range(20, 23))
+VELOCITY_TYPECODE = 19
+
+# Position classes whose even and odd frames can be paired
+SURFACE = "surface"
+BAROMETRIC = "barometric"
+GNSS = "gnss"
+
+POSITION_CLASSES = {
+    **dict.fromkeys(SURFACE_POSITION_TYPECODES, SURFACE),
+    **dict.fromkeys(range(9, 19), BAROMETRIC),
+    **dict.fromkeys(range(20, 23), GNSS),
+}
+
+ADSB_DOWNLINK_FORMATS = [17, 18]
+
+
+def none_if_nan(value):
+    """Returns None for a missing float column value"""
+    return None if value != value else value
+
+
+class Aircraft:
+    """State of a single aircraft"""
+
+    __slots__ = [
+        "icao",
+        "callsign",
+        "altitude",
+        "latitude",
+        "longitude",
+        "position_time",
+        "speed",
+        "heading",
+        "vertical_rate",
+        "cpr_frames",
+        "last_seen",
+        "messages",
+    ]
+
+    def __init__(self, icao):
+        self.icao = icao
+        self.callsign = None
+        self.altitude = None
+        self.latitude = None
+        self.longitude = None
+        self.position_time = None
+        self.speed = None
+        self.heading = None
+        self.vertical_rate = None
+
+        # last (message, timestamp) of every (position class, odd flag) for
+        # global position decoding
+        self.cpr_frames = {}
+
+        self.last_seen = None
+        self.messages = 0
+
+
+class AircraftTracker:
+    """
+    Class tracking aircraft by ICAO address.
+
+    The aircraft are kept in least recently seen order, so updating an
+    aircraft and evicting the idle ones are both O(1) per message.
+    """
+
+    def __init__(
+        self, ttl=TTL, max_aircraft=MAX_AIRCRAFT, reference=None, index=None
+    ):
+        self.ttl = ttl
+        self.max_aircraft = max_aircraft
+
+        # (latitude, longitude) of the receiver, needed for surface positions
+        self.reference = reference
+
+        # adsb_spatial.AdsbSpatialIndex kept up to date with the positions
+        self.index = index
+
+        self.aircraft = collections.OrderedDict()
+
+    def __contains__(self, icao):
+        return icao in self.aircraft
+
+    def __iter__(self):
+        return iter(self.aircraft.values())
+
+    def __len__(self):
+        return len(self.aircraft)
+
+    def get(self, icao):
+        """Returns the tracked aircraft with the given ICAO address or None"""
+        return self.aircraft.get(icao)
+
+    def evict(self, now):
+        """Removes the aircraft that have not been heard for ttl seconds"""
+
+        while self.aircraft:
+            aircraft = next(iter(self.aircraft.values()))
+            if now - aircraft.last_seen <= self.ttl:
+                break
+            self.remove_oldest()
+
+    def remove_oldest(self):
+        """Removes the aircraft idle the longest"""
+
+        icao, _ = self.aircraft.popitem(last=False)
+
+        if self.index is not None:
+            self.index.remove(icao)
+
+    def update_messages(self, messages):
+        """Updates the tracker with a batch of parser messages"""
+
+        for message in messages:
+            self.update(message[0], message[1])
+
+    def update(self, message, timestamp):
+        """
+        Updates the aircraft that sent the given hex message and returns it.
+        Returns None for messages that do not carry an ICAO address.
+        """
+
+        icao = pyModeS.icao(message)
+        if icao is None:
+            return None
+
+        aircraft = self.touch(icao, timestamp)
+
+        if pyModeS.df(message) in ADSB_DOWNLINK_FORMATS:
+            self.update_adsb(aircraft, message, timestamp)
+
+        return aircraft
+
+    def update_columns(self, messages, columns):
+        """
+        Updates the tracker with a batch of parser messages and their fields
+        decoded by adsb_columns.decode. Only positions are decoded one message
+        at a time, since CPR decoding depends on the earlier frames of the
+        aircraft. The hex messages are only built for the positions.
+        """
+
+        # imported here since adsb_columns depends on this module
+        import adsb_columns  # pylint: disable=import-outside-toplevel
+
+        batch = adsb_columns.as_batch(messages)
+
+        rows = zip(
+            range(len(batch)),
+            batch.timestamps.tolist(),
+            columns["icao"].tolist(),
+            columns["typecode"].tolist(),
+            columns["callsign"].tolist(),
+            columns["altitude"].tolist(),
+            columns["speed"].tolist(),
+            columns["heading"].tolist(),
+            columns["vertical_rate"].tolist(),
+        )
+
+        for (
+            index, timestamp, icao, typecode, callsign, altitude, speed,
+            heading, vertical_rate
+        ) in rows:
+            aircraft = self.touch(f"{icao:06X}", timestamp)
+
+            if typecode in IDENTIFICATION_TYPECODES:
+                aircraft.callsign = callsign
+
+            elif typecode == VELOCITY_TYPECODE:
+                aircraft.speed = none_if_nan(speed)
+                aircraft.heading = none_if_nan(heading)
+                aircraft.vertical_rate = none_if_nan(vertical_rate)
+
+            elif typecode in AIRBORNE_POSITION_TYPECODES:
+                aircraft.altitude = none_if_nan(altitude)
+                self.update_position(
+                    aircraft, batch[index][0], timestamp, typecode)
+
+            elif typecode in SURFACE_POSITION_TYPECODES:
+                self.update_position(
+                    aircraft, batch[index][0], timestamp, typecode)
+
+    def touch(self, icao, timestamp):
+        """Returns the aircraft with the given address, added if new"""
+
+        self.evict(timestamp)
+
+        aircraft = self.aircraft.get(icao)
+        if aircraft is None:
+            if len(self.aircraft) >= self.max_aircraft:
+                self.remove_oldest()
+
+            aircraft = Aircraft(icao)
+            self.aircraft[icao] = aircraft
+        else:
+            self.aircraft.move_to_end(icao)
+
+        aircraft.last_seen = timestamp
+        aircraft.messages += 1
+
+        return aircraft
+
+    def update_adsb(self, aircraft, message, timestamp):
+        """Merges the content of an ADS-B message into the aircraft state"""
+
+        typecode = pyModeS.typecode(message)
+
+        if typecode in IDENTIFICATION_TYPECODES:
+            aircraft.callsign = pyModeS.adsb.callsign(message).rstrip("_")
+
+        elif typecode == VELOCITY_TYPECODE:
+            velocity = pyModeS.adsb.velocity(message)
+            if velocity is not None:
+                aircraft.speed, aircraft.heading, aircraft.vertical_rate, _ = \
+                    velocity
+
+        elif typecode in AIRBORNE_POSITION_TYPECODES:
+            aircraft.altitude = pyModeS.adsb.altitude(message)
+            self.update_position(aircraft, message, timestamp, typecode)
+
+        elif typecode in SURFACE_POSITION_TYPECODES:
+            self.update_position(aircraft, message, timestamp, typecode)
+
+    def update_position(self, aircraft, message, timestamp, typecode):
+        """Decodes the CPR position of a message, globally or locally"""
+
+        position_class = POSITION_CLASSES[typecode]
+        odd = pyModeS.adsb.oe_flag(message)
+        aircraft.cpr_frames[position_class, odd] = (message, timestamp)
+
+        reference = self.reference
+        if (
+            aircraft.position_time is not None
+            and timestamp - aircraft.position_time <= REFERENCE_TTL
+        ):
+            reference = (aircraft.latitude, aircraft.longitude)
+
+        # pyModeS raises a RuntimeError for frames it can not decode together
+        try:
+            if aircraft.position_time is not None and reference is not None:
+                position = pyModeS.adsb.position_with_ref(message, *reference)
+            else:
+                position = self.global_position(
+                    aircraft, position_class, reference)
+        except RuntimeError:
+            position = None
+
+        if position is not None and position[0] is not None:
+            aircraft.latitude, aircraft.longitude = position
+            aircraft.position_time = timestamp
+
+            if self.index is not None:
+                self.index.update(
+                    aircraft.icao, aircraft.latitude, aircraft.longitude,
+                    timestamp)
+
+    @staticmethod
+    def global_position(aircraft, position_class, reference):
+        """
+        Returns the position decoded from the last even and odd frames of a
+        position class, or None without a recent pair. Surface frames also
+        need a reference position.
+        """
+
+        even = aircraft.cpr_frames.get((position_class, 0))
+        odd = aircraft.cpr_frames.get((position_class, 1))
+        if (
+            even is None
+            or odd is None
+            or abs(even[1] - odd[1]) > CPR_PAIR_WINDOW
+        ):
+            return None
+
+        if position_class == SURFACE and reference is None:
+            return None
+
+        lat_ref, lon_ref = reference or (None, None)
+        return pyModeS.adsb.position(
+            even[0], odd[0], even[1], odd[1], lat_ref, lon_ref)
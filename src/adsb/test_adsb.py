@@ -3,13 +3,11 @@
 Run this file on the captured data file
 """
 
-import adsb_parser
-import numpy as np
+import adsb_capture
 
 
 # capture1 = 200001122AB752
-samples = np.loadtxt("target/capture1.txt", delimiter=',', dtype=np.complex128)
-print(len(samples))
+capture = adsb_capture.AdsbCaptureReader("target/capture1.iq")
+print(len(capture))
 
-parser = adsb_parser.AdsbParser()
-parser.parse_samples(samples)
+print(list(capture.messages()))
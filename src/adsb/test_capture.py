@@ -6,7 +6,7 @@ Run this file when a plane is near to capture a single set of samples.
 # Python Standard Libraries
 import os
 
-import numpy
+import adsb_capture
 import rtlsdr
 
 sdr = rtlsdr.RtlSdr()
@@ -14,8 +14,18 @@ sdr.sample_rate = 2e6
 sdr.center_freq = 1090e6
 sdr.gain = "auto"
 
-samples = sdr.read_samples(100*1024)
+# raw interleaved IQ bytes, two per sample
+data = sdr.read_bytes(2*100*1024)
+
+# the settings can not be read back once the device is closed
+sample_rate = sdr.sample_rate
+center_frequency = sdr.center_freq
 sdr.close()
 
 os.makedirs("target", exist_ok=True)
-numpy.savetxt("target/capture.txt", samples, delimiter=",")
+with adsb_capture.AdsbCaptureWriter(
+    "target/capture.iq",
+    sample_rate=sample_rate,
+    center_frequency=center_frequency
+) as capture:
+    capture.write(data)
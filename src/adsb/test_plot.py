@@ -3,13 +3,11 @@
 Run this file when a plane is near to capture a single set of samples.
 """
 
-import adsb_parser
-import numpy
+import adsb_capture
+import adsb_diagnostics
 
-samples = numpy.loadtxt(
-    "target/capture.txt",
-    delimiter=',',
-    dtype=numpy.complex128
-)
+capture = adsb_capture.AdsbCaptureReader("target/capture.iq")
 
-adsb_parser.AdsbRtlSdr.plot_psd(samples)
+for samples in capture.samples():
+    adsb_diagnostics.plot_psd(samples)
+    break
@@ -0,0 +1,176 @@
+"""Tests of writing and querying the segments of a frame archive"""
+
+import os
+
+import adsb_archive
+import adsb_columns
+import numpy
+import pytest
+
+SEGMENT_FRAMES = 30
+
+# Addresses of the random frames
+ICAOS = [0x4840D6, 0x485020, 0x40621D, 0xA1B2C3]
+
+
+def random_messages(rng, count, start=0.0):
+    """
+    Returns a batch of random DF17 frames of a few addresses, in time order
+    from start
+    """
+
+    frames = rng.integers(0, 256, (count, 14), dtype=numpy.uint8)
+    frames[:, 0] = 0x8D
+
+    icaos = numpy.array(ICAOS, dtype=numpy.uint32)[
+        rng.integers(len(ICAOS), size=count)]
+    frames[:, 1] = icaos >> 16
+    frames[:, 2] = (icaos >> 8) & 0xFF
+    frames[:, 3] = icaos & 0xFF
+
+    return adsb_columns.AdsbMessages(
+        frames,
+        numpy.full(count, 112),
+        start + numpy.sort(rng.uniform(0, 100, count)),
+        rng.uniform(0, 1, count)
+    )
+
+
+def write(directory, batches, segment_frames=SEGMENT_FRAMES):
+    """Writes batches of messages to an archive and closes it"""
+
+    with adsb_archive.AdsbArchiveWriter(
+            str(directory), segment_frames) as writer:
+        for messages in batches:
+            writer.write(messages)
+
+
+def segment_sizes(directory):
+    """Returns the number of records of every segment, oldest first"""
+
+    return [
+        len(adsb_archive.read_segment(path))
+        for path in adsb_archive.segment_paths(str(directory))
+    ]
+
+
+def brute_force(records, icao=None, start=-numpy.inf, end=numpy.inf):
+    """Returns the matching records by scanning all of them"""
+
+    mask = (records["timestamp"] >= start) & (records["timestamp"] <= end)
+    if icao is not None:
+        mask &= records["icao"] == icao
+
+    return records[mask]
+
+
+def test_segments_roll_over_at_segment_frames(tmp_path):
+    rng = numpy.random.default_rng(0)
+    write(tmp_path, [random_messages(rng, count) for count in (7, 40, 25)])
+
+    assert segment_sizes(tmp_path) == [30, 30, 12]
+
+    for path in adsb_archive.segment_paths(str(tmp_path)):
+        assert os.path.exists(path + adsb_archive.INDEX_SUFFIX)
+
+
+def test_records(tmp_path):
+    messages = adsb_columns.as_batch([
+        ["8D4840D6202CC371C32CE0576098", 100.0, 0.5],
+        ["5D484FDEA248F5", 101.0, 0.25],
+    ])
+    write(tmp_path, [messages])
+
+    records = adsb_archive.AdsbArchiveReader(str(tmp_path)).query()
+
+    assert records["timestamp"].tolist() == [100.0, 101.0]
+    assert records["icao"].tolist() == [0x4840D6, 0x484FDE]
+    assert records["downlink_format"].tolist() == [17, 11]
+    assert records["length"].tolist() == [14, 7]
+    assert records["signal_level"].tolist() == [0.5, 0.25]
+    assert records["frame"][1, :7].tobytes().hex().upper() == "5D484FDEA248F5"
+
+
+@pytest.mark.parametrize("icao", [None, *ICAOS, 0x123456])
+@pytest.mark.parametrize("start, end", [
+    (-numpy.inf, numpy.inf),
+    (20.0, 60.0),
+    (150.0, 250.0),
+    (500.0, 600.0),
+])
+def test_query_matches_brute_force(tmp_path, icao, start, end):
+    rng = numpy.random.default_rng(1)
+    batches = [random_messages(rng, 45, 100.0 * index) for index in range(4)]
+    write(tmp_path, batches)
+
+    # an open segment is scanned instead of using an index
+    writer = adsb_archive.AdsbArchiveWriter(str(tmp_path), SEGMENT_FRAMES)
+    extra = random_messages(rng, 10, 150.0)
+    writer.write(extra)
+
+    records = adsb_archive.to_records(
+        adsb_columns.AdsbMessages.concatenate(batches + [extra]))
+    expected = brute_force(records, icao, start, end)
+    expected = expected[numpy.argsort(expected["timestamp"], kind="stable")]
+
+    result = adsb_archive.AdsbArchiveReader(str(tmp_path)).query(
+        icao, start, end)
+
+    assert result.dtype == adsb_archive.FRAME_DTYPE
+    assert result.tobytes() == expected.tobytes()
+
+    writer.close()
+
+
+def test_reopen_indexes_a_segment_left_open(tmp_path):
+    rng = numpy.random.default_rng(2)
+    first = random_messages(rng, 40)
+
+    writer = adsb_archive.AdsbArchiveWriter(str(tmp_path), SEGMENT_FRAMES)
+    writer.write(first)
+
+    # the writer is lost without being closed
+    writer.file.close()
+    last = adsb_archive.segment_paths(str(tmp_path))[-1]
+    assert not os.path.exists(last + adsb_archive.INDEX_SUFFIX)
+
+    second = random_messages(rng, 5, 100.0)
+    write(tmp_path, [second])
+
+    assert os.path.exists(last + adsb_archive.INDEX_SUFFIX)
+    assert segment_sizes(tmp_path) == [30, 10, 5]
+
+    records = adsb_archive.to_records(
+        adsb_columns.AdsbMessages.concatenate([first, second]))
+    reader = adsb_archive.AdsbArchiveReader(str(tmp_path))
+
+    for icao in ICAOS:
+        assert reader.query(icao).tobytes() == \
+            brute_force(records, icao).tobytes()
+
+
+def test_new_segments_follow_the_last_after_retention(tmp_path):
+    rng = numpy.random.default_rng(3)
+    old = random_messages(rng, 90)
+    write(tmp_path, [old])
+
+    # the oldest segments are deleted to keep the archive to its retention
+    for path in adsb_archive.segment_paths(str(tmp_path))[:2]:
+        os.remove(path)
+        os.remove(path + adsb_archive.INDEX_SUFFIX)
+
+    new = random_messages(rng, 35, 100.0)
+    write(tmp_path, [new])
+
+    paths = adsb_archive.segment_paths(str(tmp_path))
+    assert [adsb_archive.segment_number(path) for path in paths] == [2, 3, 4]
+    assert segment_sizes(tmp_path) == [30, 30, 5]
+
+    records = adsb_archive.to_records(
+        adsb_columns.AdsbMessages.concatenate([old.select(range(60, 90)), new]))
+    reader = adsb_archive.AdsbArchiveReader(str(tmp_path))
+
+    assert reader.query().tobytes() == records.tobytes()
+    for icao in ICAOS:
+        assert reader.query(icao, 100.0).tobytes() == \
+            brute_force(records, icao, 100.0).tobytes()
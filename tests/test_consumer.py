@@ -0,0 +1,71 @@
+"""Tests of decoding raw IQ blocks in a consumer group"""
+
+import threading
+
+import adsb_broker
+import adsb_consumer
+import adsb_producer
+import adsb_raw
+import adsb_replay
+
+RAW_TOPIC = "adsb-raw"
+TOPIC = "adsb"
+GROUP = "adsb-decoder"
+
+
+class RecordingConsumer(adsb_consumer.AdsbDecoderConsumer):
+    """Decoder consumer remembering the sequence of every block it decodes"""
+
+    def __init__(self, consumer, producer):
+        super().__init__(consumer, producer)
+        self.sequences = []
+
+    def decode(self, record):
+        self.sequences.append(adsb_raw.decode(record)[0])
+        return super().decode(record)
+
+
+def producer(broker, topic=TOPIC):
+    """Returns an AdsbProducer sending to the local broker"""
+
+    result = adsb_producer.AdsbProducer()
+    result.producer = broker.producer()
+    result.set_topic(topic)
+
+    return result
+
+
+def test_blocks_are_decoded_once_by_the_group():
+    broker = adsb_broker.LocalBroker()
+
+    raw = producer(broker)
+    raw.set_raw_topic(RAW_TOPIC)
+
+    replay = adsb_replay.AdsbReplay.synthetic(1, seed=0)
+    blocker = adsb_raw.AdsbBlocker()
+    for data in replay.chunks():
+        for record in blocker.add(data, 0.0):
+            raw.publish_block(record)
+    for record in blocker.flush():
+        raw.publish_block(record)
+
+    blocks = raw.sent
+    assert blocks > adsb_broker.PARTITIONS
+
+    # both members join before either reads
+    members = [
+        RecordingConsumer(broker.consumer(RAW_TOPIC, GROUP), producer(broker))
+        for _ in range(2)
+    ]
+    threads = [threading.Thread(target=member.run) for member in members]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sequences = [member.sequences for member in members]
+    assert all(sequences)
+    assert sorted(sequences[0] + sequences[1]) == list(range(blocks))
+
+    published = sum(len(log) for log in broker.topics[TOPIC])
+    assert published == sum(member.messages for member in members) > 0
@@ -0,0 +1,122 @@
+"""Tests of the Mode S CRC of whole batches against pyModeS"""
+
+import adsb_columns
+import adsb_crc
+import numpy
+import pyModeS
+
+# Examples of https://mode-s.org/decode/
+LONG_MESSAGES = [
+    "8D4840D6202CC371C32CE0576098",
+    "8D485020994409940838175B284F",
+    "8D40621D58C382D690C8AC2863A7",
+    "8D40621D58C386435CC412692AD6",
+]
+
+# All-call reply, its parity overlaid with the interrogator identifier
+SHORT_MESSAGES = ["5D484FDEA248F5"]
+
+
+def batch(messages):
+    """Returns the frames and lengths of hex messages"""
+
+    messages = adsb_columns.as_batch(
+        [[message, 0.0, 0.0] for message in messages])
+    return messages.frames, messages.lengths
+
+
+def random_messages(rng, count, length):
+    """Returns random hex messages of length bytes"""
+
+    return [
+        bytes(rng.integers(0, 256, length, dtype=numpy.uint8)).hex().upper()
+        for _ in range(count)
+    ]
+
+
+def test_table_is_the_crc_of_every_leading_byte():
+    for byte in range(256):
+        message = f"{byte:02X}" + "00" * 3
+        assert adsb_crc.CRC_TABLE[byte] == pyModeS.crc(message)
+
+
+def test_syndromes_of_known_messages():
+    messages = LONG_MESSAGES + SHORT_MESSAGES
+    frames, lengths = batch(messages)
+
+    frame_syndromes = adsb_crc.syndromes(frames, lengths).tolist()
+
+    assert frame_syndromes == [pyModeS.crc(message) for message in messages]
+    assert frame_syndromes[:len(LONG_MESSAGES)] == [0] * len(LONG_MESSAGES)
+
+
+def test_syndromes_of_random_messages():
+    rng = numpy.random.default_rng(0)
+    messages = random_messages(rng, 200, 14) + random_messages(rng, 200, 7)
+    frames, lengths = batch(messages)
+
+    expected = [pyModeS.crc(message) for message in messages]
+    assert adsb_crc.syndromes(frames, lengths).tolist() == expected
+    assert [
+        adsb_crc.syndrome(bytes.fromhex(message)) for message in messages
+    ] == expected
+
+
+def test_every_single_bit_error_outside_the_format_is_corrected():
+    for message in LONG_MESSAGES:
+        frames, lengths = batch([message] * adsb_crc.LONG_MESSAGE_BITS)
+        original = frames[0].copy()
+
+        bits = numpy.arange(adsb_crc.LONG_MESSAGE_BITS)
+        frames[bits, bits >> 3] ^= (0x80 >> (bits & 7)).astype(numpy.uint8)
+        flipped = frames.copy()
+
+        frame_syndromes = adsb_crc.syndromes(frames, lengths)
+        assert numpy.all(frame_syndromes != 0)
+
+        corrected = adsb_crc.correct_single_bit(
+            frames, frame_syndromes, numpy.ones(len(frames), dtype=bool))
+
+        outside = bits >= adsb_crc.DOWNLINK_FORMAT_BITS
+        assert corrected.tolist() == outside.tolist()
+        assert numpy.all(frames[outside] == original)
+        assert numpy.all(frame_syndromes[outside] == 0)
+
+        # flips of the downlink format are left as they are
+        assert numpy.all(frames[~outside] == flipped[~outside])
+        assert numpy.all(frame_syndromes[~outside] != 0)
+
+
+def test_only_the_selected_rows_are_corrected():
+    frames, lengths = batch(LONG_MESSAGES)
+    frames[:, 6] ^= 0x10
+    flipped = frames.copy()
+
+    frame_syndromes = adsb_crc.syndromes(frames, lengths)
+    rows = numpy.array([True, False, True, False])
+    corrected = adsb_crc.correct_single_bit(frames, frame_syndromes, rows)
+
+    assert corrected.tolist() == rows.tolist()
+    assert numpy.all(frames[~rows] == flipped[~rows])
+    assert numpy.all(frame_syndromes[~rows] != 0)
+    assert adsb_crc.syndromes(frames, lengths)[rows].tolist() == [0, 0]
+
+
+def test_double_bit_errors_are_not_corrected():
+    rng = numpy.random.default_rng(1)
+    frames, lengths = batch(LONG_MESSAGES * 50)
+
+    for row in range(len(frames)):
+        first, second = rng.choice(
+            numpy.arange(adsb_crc.DOWNLINK_FORMAT_BITS,
+                         adsb_crc.LONG_MESSAGE_BITS), 2, replace=False)
+        for bit in (first, second):
+            frames[row, bit >> 3] ^= 0x80 >> (bit & 7)
+    flipped = frames.copy()
+
+    frame_syndromes = adsb_crc.syndromes(frames, lengths)
+    corrected = adsb_crc.correct_single_bit(
+        frames, frame_syndromes, numpy.ones(len(frames), dtype=bool))
+
+    assert not corrected.any()
+    assert numpy.all(frames == flipped)
@@ -0,0 +1,109 @@
+"""Tests of suppressing duplicate and rate limited messages"""
+
+import adsb_columns
+import adsb_dedup
+
+# Examples of https://mode-s.org/decode/
+IDENTIFICATION = "8D4840D6202CC371C32CE0576098"
+VELOCITY = "8D485020994409940838175B284F"
+AIRBORNE_EVEN = "8D40621D58C382D690C8AC2863A7"
+AIRBORNE_ODD = "8D40621D58C386435CC412692AD6"
+ALL_CALL = "5D484FDEA248F5"
+
+# Other even airborne position of the same aircraft
+AIRBORNE_EVEN_LATER = "8D40621D58C382D690C8AC000000"
+
+
+def passed(dedup, messages):
+    """Returns the hex messages of a batch passed by the deduplicator"""
+    return [message[0] for message in dedup.filter(messages)]
+
+
+def test_repeated_frames_within_the_window_are_suppressed():
+    dedup = adsb_dedup.AdsbDeduplicator(window=1.0)
+
+    assert passed(dedup, [
+        [IDENTIFICATION, 100.0, 0.5],
+        [IDENTIFICATION, 100.5, 0.5],
+        [ALL_CALL, 100.6, 0.5],
+        [ALL_CALL, 100.7, 0.5],
+        [IDENTIFICATION, 101.0, 0.5],
+    ]) == [IDENTIFICATION, ALL_CALL, IDENTIFICATION]
+
+    assert dedup.duplicates == 2
+    assert dedup.limited == 0
+
+
+def test_window_spans_batches():
+    dedup = adsb_dedup.AdsbDeduplicator(window=1.0)
+
+    assert passed(dedup, [[VELOCITY, 100.0, 0.5]]) == [VELOCITY]
+    assert passed(dedup, [[VELOCITY, 100.9, 0.5]]) == []
+    assert passed(dedup, [[VELOCITY, 101.0, 0.5]]) == [VELOCITY]
+
+
+def test_zero_window_passes_duplicates():
+    dedup = adsb_dedup.AdsbDeduplicator(window=0)
+    messages = [[VELOCITY, 100.0, 0.5], [VELOCITY, 100.0, 0.5]]
+
+    assert passed(dedup, messages) == [VELOCITY, VELOCITY]
+    assert dedup.duplicates == 0
+
+
+def test_batches_stay_batches():
+    dedup = adsb_dedup.AdsbDeduplicator()
+    batch = adsb_columns.as_batch([
+        [VELOCITY, 100.0, 0.5],
+        [VELOCITY, 100.1, 0.5],
+    ]).tag("a")
+
+    result = dedup.filter(batch)
+
+    assert isinstance(result, adsb_columns.AdsbMessages)
+    assert list(result) == [[VELOCITY, 100.0, 0.5, "a"]]
+
+
+def test_positions_are_rate_limited_per_aircraft_and_kind():
+    dedup = adsb_dedup.AdsbDeduplicator(
+        window=0, rate_limits=adsb_dedup.POSITION_RATE_LIMITS)
+
+    assert passed(dedup, [
+        [AIRBORNE_EVEN, 100.0, 0.5],
+        [AIRBORNE_EVEN_LATER, 100.2, 0.5],
+        [VELOCITY, 100.3, 0.5],
+        [VELOCITY, 100.4, 0.5],
+        [AIRBORNE_EVEN_LATER, 100.5, 0.5],
+    ]) == [AIRBORNE_EVEN, VELOCITY, VELOCITY, AIRBORNE_EVEN_LATER]
+
+    assert dedup.limited == 1
+
+
+def test_rate_limit_passes_both_cpr_formats():
+    dedup = adsb_dedup.AdsbDeduplicator(
+        window=0, rate_limits={adsb_dedup.AIRBORNE_POSITION: 10.0})
+
+    # even frames arrive just before the odd ones every time, limiting the
+    # two together would never pass an odd frame
+    messages = []
+    for second in range(5):
+        messages.append([AIRBORNE_EVEN, 100.0 + second, 0.5])
+        messages.append([AIRBORNE_ODD, 100.1 + second, 0.5])
+
+    assert passed(dedup, messages) == [AIRBORNE_EVEN, AIRBORNE_ODD]
+    assert dedup.limited == 8
+
+
+def test_rate_keys():
+    batch = adsb_columns.as_batch([
+        [AIRBORNE_EVEN, 100.0, 0.5],
+        [AIRBORNE_ODD, 100.0, 0.5],
+        [IDENTIFICATION, 100.0, 0.5],
+        [ALL_CALL, 100.0, 0.5],
+    ])
+
+    assert adsb_dedup.rate_keys(batch) == [
+        (0x40621D, adsb_dedup.AIRBORNE_POSITION, False),
+        (0x40621D, adsb_dedup.AIRBORNE_POSITION, True),
+        (0x4840D6, adsb_dedup.IDENTIFICATION, None),
+        None,
+    ]
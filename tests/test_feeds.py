@@ -0,0 +1,190 @@
+"""Tests of the Beast and SBS-1 encoding of the feeds on known messages"""
+
+import datetime
+
+import adsb_feeds
+import adsb_tracker
+import numpy
+import pytest
+
+# Examples of https://mode-s.org/decode/
+IDENTIFICATION = "8D4840D6202CC371C32CE0576098"
+VELOCITY = "8D485020994409940838175B284F"
+AIRBORNE_EVEN = "8D40621D58C382D690C8AC2863A7"
+AIRBORNE_ODD = "8D40621D58C386435CC412692AD6"
+ALL_CALL = "5D484FDEA248F5"
+
+# clock and signal level of 0x1A1A1A and 0x1A, the Beast escape byte
+ESCAPED_TIMESTAMP = 0x1A1A1A / adsb_feeds.BEAST_CLOCK
+ESCAPED_LEVEL = 0.103
+
+
+def fields(line):
+    """Returns the fields of an SBS-1 line"""
+
+    assert line.endswith("\r\n")
+    return line[:-2].split(",")
+
+
+def sbs_lines(messages, tracker=None):
+    """Returns the SBS-1 lines of parser messages as field lists"""
+
+    if tracker is None:
+        tracker = adsb_tracker.AircraftTracker()
+
+    buffer = adsb_feeds.encode_sbs(messages, tracker).decode()
+    return [fields(line + "\r\n") for line in buffer.split("\r\n")[:-1]]
+
+
+def test_beast_frame_escapes_every_escape_byte():
+    frame = bytes.fromhex("5D1A4FDEA248F5")
+
+    assert adsb_feeds.beast_frame(
+        frame, ESCAPED_TIMESTAMP, ESCAPED_LEVEL) == bytes.fromhex(
+            "1A32"
+            "0000001A1A1A1A1A1A"
+            "1A1A"
+            "5D1A1A4FDEA248F5"
+        )
+
+
+def test_beast_frame_types_and_clock():
+    short = adsb_feeds.beast_frame(bytes.fromhex(ALL_CALL), 1.0, 1.0)
+    long = adsb_feeds.beast_frame(bytes.fromhex(IDENTIFICATION), 2.0, 0.0)
+
+    assert short == b"\x1a2" + (12_000_000).to_bytes(6, "big") + b"\xff" + \
+        bytes.fromhex(ALL_CALL)
+    assert long == b"\x1a3" + (24_000_000).to_bytes(6, "big") + b"\x00" + \
+        bytes.fromhex(IDENTIFICATION)
+
+
+def test_beast_clock_wraps_at_48_bits():
+    timestamp = (2 ** 48 + 12_000_000) / adsb_feeds.BEAST_CLOCK
+    frame = adsb_feeds.beast_frame(bytes.fromhex(ALL_CALL), timestamp, 0.5)
+
+    assert frame[2:8] == (12_000_000).to_bytes(6, "big")
+
+
+def test_encode_beast_joins_the_frames_of_a_batch():
+    messages = [
+        [ALL_CALL, 1.0, 0.5],
+        [IDENTIFICATION, 2.0, 0.25],
+    ]
+
+    assert adsb_feeds.encode_beast(messages) == b"".join(
+        adsb_feeds.beast_frame(bytes.fromhex(message), timestamp, level)
+        for message, timestamp, level in messages
+    )
+
+
+def test_encode_sbs_lines():
+    timestamp = 1_700_000_000.25
+    lines = sbs_lines([
+        [IDENTIFICATION, timestamp, 0.5],
+        [VELOCITY, timestamp, 0.5],
+        [ALL_CALL, timestamp, 0.5],
+    ])
+
+    time = datetime.datetime.fromtimestamp(timestamp)
+    assert [line[6:10] for line in lines] == [[
+        time.strftime("%Y/%m/%d"), time.strftime("%H:%M:%S.250"),
+        time.strftime("%Y/%m/%d"), time.strftime("%H:%M:%S.250"),
+    ]] * 3
+
+    identification, velocity, all_call = lines
+
+    assert identification[:2] == ["MSG", "1"]
+    assert identification[4] == "4840D6"
+    assert identification[10] == "KLM1023"
+
+    assert velocity[:2] == ["MSG", "4"]
+    assert velocity[4] == "485020"
+    assert velocity[12:17] == ["159", "182.9", "", "", "-832"]
+
+    assert all_call[:2] == ["MSG", "8"]
+    assert all_call[4] == "484FDE"
+    assert len(all_call) == 22
+
+
+def test_encode_sbs_reports_positions_decoded_from_the_message():
+    odd, even = sbs_lines([
+        [AIRBORNE_ODD, 100.0, 0.5],
+        [AIRBORNE_EVEN, 101.0, 0.5],
+    ])
+
+    assert odd[:2] == ["MSG", "3"]
+    assert odd[11] == "38000"
+    assert odd[14:16] == ["", ""]
+    assert odd[21] == "0"
+
+    assert even[11] == "38000"
+    assert [float(value) for value in even[14:16]] == pytest.approx(
+        [52.2572, 3.91937], abs=1e-4)
+
+
+def test_encode_sbs_aircraft_evicted_within_the_batch():
+    tracker = adsb_tracker.AircraftTracker(max_aircraft=1)
+
+    identification, position, _ = sbs_lines([
+        [IDENTIFICATION, 100.0, 0.5],
+        [AIRBORNE_ODD, 100.5, 0.5],
+        [VELOCITY, 101.0, 0.5],
+    ], tracker)
+
+    assert tracker.get("4840D6") is None
+    assert tracker.get("40621D") is None
+
+    assert identification[4] == "4840D6"
+    assert identification[10] == "KLM1023"
+    assert position[4] == "40621D"
+    assert position[11] == "38000"
+    assert position[14:16] == ["", ""]
+
+
+class Transport:
+    """Transport of a feed client with a fixed amount of unsent data"""
+
+    def __init__(self, buffered=0):
+        self.buffered = buffered
+        self.written = []
+        self.aborted = False
+
+    def get_write_buffer_size(self):
+        return self.buffered
+
+    def write(self, data):
+        self.written.append(data)
+
+    def abort(self):
+        self.aborted = True
+
+
+def test_slow_clients_are_dropped():
+    feeds = adsb_feeds.AdsbFeeds(client_buffer=100)
+    fast, slow = Transport(100), Transport(101)
+    feeds.clients["beast"].update([fast, slow])
+
+    messages = [[ALL_CALL, 1.0, 0.5]]
+    feeds.publish(messages)
+
+    assert fast.written == [adsb_feeds.encode_beast(messages)]
+    assert not fast.aborted
+
+    assert slow.written == []
+    assert slow.aborted
+    assert feeds.clients["beast"] == {fast}
+    assert feeds.dropped == 1
+
+
+def test_sbs_is_only_encoded_with_clients():
+    feeds = adsb_feeds.AdsbFeeds()
+    feeds.publish([[IDENTIFICATION, 1.0, 0.5]])
+
+    assert feeds.tracker.get("4840D6") is None
+
+    client = Transport()
+    feeds.clients["sbs"].add(client)
+    feeds.publish([[IDENTIFICATION, 1.0, 0.5]])
+
+    assert fields(client.written[0].decode())[10] == "KLM1023"
+    assert numpy.isclose(feeds.tracker.get("4840D6").last_seen, 1.0)
@@ -0,0 +1,105 @@
+"""Tests of the Prometheus text endpoint of the metrics"""
+
+import urllib.error
+import urllib.request
+
+import adsb_metrics
+import pytest
+
+
+@pytest.fixture
+def metrics():
+    """Returns metrics served on a free port, shut down after the test"""
+
+    result = adsb_metrics.AdsbMetrics()
+    server = result.serve(port=0)
+    result.url = f"http://localhost:{server.server_address[1]}"
+
+    yield result
+
+    server.shutdown()
+    server.server_close()
+
+
+def scrape(metrics, path="/metrics"):
+    """Returns the content type and lines of a response of the endpoint"""
+
+    with urllib.request.urlopen(metrics.url + path, timeout=5) as response:
+        return response.headers["Content-Type"], \
+            response.read().decode().splitlines()
+
+
+def family(lines, name):
+    """Returns the lines of the metric family with the given name"""
+
+    start = next(index for index, line in enumerate(lines)
+                 if line.startswith(f"# HELP {name} "))
+    end = start + 1
+    while end < len(lines) and not lines[end].startswith("# HELP"):
+        end += 1
+
+    return lines[start:end]
+
+
+def test_counter(metrics):
+    metrics.frames.inc(5, "pass")
+    metrics.frames.inc(2, "corrected")
+    metrics.frames.inc(3, "pass")
+    metrics.sent.inc()
+
+    content_type, lines = scrape(metrics)
+    assert content_type == adsb_metrics.CONTENT_TYPE
+
+    assert family(lines, "adsb_frames_total") == [
+        "# HELP adsb_frames_total Demodulated frames by parity check result",
+        "# TYPE adsb_frames_total counter",
+        'adsb_frames_total{result="corrected"} 2',
+        'adsb_frames_total{result="pass"} 8',
+    ]
+    assert family(lines, "adsb_kafka_sent_total")[2:] == [
+        "adsb_kafka_sent_total 1"]
+
+    # counters without a label are exposed before anything is counted
+    assert family(lines, "adsb_kafka_send_errors_total")[2:] == [
+        "adsb_kafka_send_errors_total 0"]
+
+
+def test_histogram(metrics):
+    metrics.send_latency.buckets = [0.1, 1]
+    for amount in (0.05, 0.1, 0.5, 2):
+        metrics.send_latency.observe(amount)
+
+    _, lines = scrape(metrics)
+
+    assert family(lines, "adsb_kafka_send_seconds") == [
+        "# HELP adsb_kafka_send_seconds "
+        "Time from sending a record to its acknowledgement",
+        "# TYPE adsb_kafka_send_seconds histogram",
+        'adsb_kafka_send_seconds_bucket{le="0.1"} 2',
+        'adsb_kafka_send_seconds_bucket{le="1"} 3',
+        'adsb_kafka_send_seconds_bucket{le="+Inf"} 4',
+        "adsb_kafka_send_seconds_sum 2.65",
+        "adsb_kafka_send_seconds_count 4",
+    ]
+
+
+def test_labelled_histogram(metrics):
+    with metrics.stage("detect"):
+        pass
+    with metrics.stage("demodulate"):
+        pass
+
+    _, lines = scrape(metrics)
+    stages = family(lines, "adsb_stage_seconds")
+
+    assert stages[1] == "# TYPE adsb_stage_seconds histogram"
+    assert 'adsb_stage_seconds_bucket{stage="detect",le="+Inf"} 1' in stages
+    assert 'adsb_stage_seconds_count{stage="demodulate"} 1' in stages
+    assert len(stages) == 2 + 2 * (len(adsb_metrics.LATENCY_BUCKETS) + 3)
+
+
+def test_profile_without_profiler(metrics):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        scrape(metrics, "/profile")
+
+    assert error.value.code == 404
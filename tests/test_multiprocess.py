@@ -0,0 +1,71 @@
+"""Tests of skipping overlapping preamble hits across the blocks of the pool"""
+
+import adsb_columns
+import adsb_crc
+import adsb_multiprocess
+import adsb_oversampled
+import adsb_parser
+import adsb_replay
+import numpy
+import pytest
+
+BLOCK_SIZE = 1000
+
+
+def candidates(positions):
+    """Returns a batch with a message at every given position"""
+
+    count = len(positions)
+    return adsb_columns.AdsbMessages(
+        numpy.zeros((count, adsb_crc.MESSAGE_BYTES), dtype=numpy.uint8),
+        numpy.full(count, adsb_crc.SHORT_MESSAGE_BITS),
+        numpy.zeros(count),
+        numpy.zeros(count),
+        positions
+    )
+
+
+def test_every_hit_is_accepted_once_across_blocks():
+    rng = numpy.random.default_rng(0)
+    length = adsb_multiprocess.CARRY + BLOCK_SIZE
+    samples = 50 * BLOCK_SIZE + length
+
+    # dense hits, so hits inside a message straddle many block boundaries
+    hits = numpy.unique(rng.integers(0, samples, samples // 20))
+
+    accepted = []
+    resume = 0
+    for block_start in range(0, samples - length + 1, BLOCK_SIZE):
+        owned = adsb_multiprocess.OVERLAP if block_start else 0
+        block = hits[(hits >= block_start) & (
+            hits <= block_start + length - adsb_parser.MESSAGE_LENGTH)]
+
+        links = adsb_multiprocess.skip_links(block - block_start, owned)
+        messages, resume = adsb_multiprocess.accept(
+            candidates(sorted(links)), links, block_start, resume)
+
+        accepted.extend(block_start + int(position)
+                        for position in messages.positions)
+
+    expected = adsb_parser.AdsbParser.skip_overlapping(
+        hits[hits <= block_start + length - adsb_parser.MESSAGE_LENGTH])
+
+    assert accepted == expected.tolist()
+
+
+def test_pool_decodes_the_same_messages_as_the_streaming_parser():
+    chunks = list(adsb_replay.AdsbReplay.synthetic(1, seed=0).chunks())
+
+    parser = adsb_parser.StreamingAdsbParser()
+    expected = [message[0] for chunk in chunks
+                for message in parser.feed_bytes(chunk)]
+    expected += [message[0] for message in parser.flush()]
+
+    with adsb_multiprocess.AdsbDecodePool(2, block_size=100_000) as pool:
+        assert [message[0] for message in pool.messages(chunks)] == expected
+
+
+def test_pool_refuses_oversampled_rates():
+    with pytest.raises(ValueError):
+        adsb_multiprocess.AdsbDecodePool(
+            2, sample_rate=adsb_oversampled.OVERSAMPLED_RATES[0])
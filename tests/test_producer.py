@@ -0,0 +1,124 @@
+"""Tests of the Kafka records, keys and headers the producer publishes"""
+
+import asyncio
+
+import adsb_columns
+import adsb_producer
+import adsb_record
+import adsb_replay
+
+# Examples of https://mode-s.org/decode/
+IDENTIFICATION = "8D4840D6202CC371C32CE0576098"
+ALL_CALL = "5D484FDEA248F5"
+SURVEILLANCE = "20001838CA3804"
+
+
+class Future:
+    """Future of a send, resolved by the test"""
+
+    def __init__(self):
+        self.callbacks = []
+        self.errbacks = []
+
+    def add_callback(self, function, *args):
+        self.callbacks.append((function, args))
+
+    def add_errback(self, function, *args):
+        self.errbacks.append((function, args))
+
+    def succeed(self):
+        for function, args in self.callbacks:
+            function(*args, None)
+
+    def fail(self):
+        for function, args in self.errbacks:
+            function(*args, Exception())
+
+
+class KafkaProducer:
+    """Producer recording what is sent"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, topic, value=None, key=None, headers=None):
+        future = Future()
+        self.sent.append((topic, value, key, headers, future))
+        return future
+
+    def flush(self):
+        pass
+
+
+def producer():
+    """Returns a producer publishing to a recording Kafka producer"""
+
+    result = adsb_producer.AdsbProducer()
+    result.producer = KafkaProducer()
+    result.set_topic("adsb")
+
+    return result
+
+
+def replayed_frames(workers=None):
+    """Returns the frames published from a synthetic replay"""
+
+    publisher = producer()
+    publisher.sdr = adsb_replay.AdsbReplay.synthetic(1, seed=0, speed=0)
+    if workers:
+        publisher.set_decode_workers(workers)
+
+    asyncio.run(publisher.run())
+
+    return [adsb_record.decode(value)[0]
+            for _, value, *_ in publisher.producer.sent]
+
+
+def test_records_and_keys():
+    publisher = producer()
+    messages = [
+        [IDENTIFICATION, 100.0, 0.5],
+        [ALL_CALL, 101.0, 0.25],
+        [SURVEILLANCE, 102.0, 0.125],
+    ]
+
+    publisher.publish(messages)
+
+    sent = publisher.producer.sent
+    assert [topic for topic, *_ in sent] == ["adsb"] * 3
+    assert [headers for _, _, _, headers, _ in sent] == [None] * 3
+
+    for (message, timestamp, level), (_, value, key, _, _) in zip(
+            messages, sent):
+        frame = bytes.fromhex(message)
+        assert adsb_record.decode(value) == (frame, timestamp, level)
+        assert key == adsb_record.icao_address(frame)
+
+
+def test_source_header():
+    publisher = producer()
+
+    publisher.publish(
+        adsb_columns.as_batch([[IDENTIFICATION, 100.0, 0.5]]).tag("north"))
+
+    (_, _, _, headers, _), = publisher.producer.sent
+    assert headers == [("source", b"north")]
+
+
+def test_delivery_counts():
+    publisher = producer()
+    publisher.publish([[IDENTIFICATION, 100.0, 0.5], [ALL_CALL, 101.0, 0.5]])
+
+    first, second = [future for *_, future in publisher.producer.sent]
+    first.succeed()
+    second.fail()
+
+    assert publisher.sent == 1
+    assert publisher.failed == 1
+
+
+def test_decode_workers_publish_the_same_frames():
+    frames = replayed_frames()
+
+    assert frames
+    assert replayed_frames(workers=2) == frames
@@ -0,0 +1,64 @@
+"""Tests of merging the messages of several sources"""
+
+import asyncio
+import itertools
+import math
+import queue
+
+import adsb_capture
+import adsb_receivers
+import adsb_replay
+
+
+def record(path, seed):
+    """Writes a synthetic capture and returns its source spec"""
+
+    replay = adsb_replay.AdsbReplay.synthetic(0.25, seed=seed)
+    with adsb_capture.AdsbCaptureWriter(str(path)) as writer:
+        writer.write(replay.data)
+
+    return f"{adsb_receivers.CAPTURE}:{path}"
+
+
+def receive(spec):
+    """Returns the (source ID, messages, watermark) results of a source"""
+
+    results = queue.Queue()
+    asyncio.run(adsb_receivers.forward(
+        spec, *adsb_receivers.parse_source(spec)[1:], results))
+
+    return [results.get() for _ in range(results.qsize())]
+
+
+def test_merge_recorded_captures(tmp_path):
+    sources = [record(tmp_path / f"{seed}.iq", seed) for seed in (1, 2)]
+    results = [receive(spec) for spec in sources]
+    assert all(result[-1][2] is None for result in results)
+
+    merger = adsb_receivers.AdsbMerger(sources)
+    released = []
+
+    # the sources take turns, as their processes would
+    for result in itertools.zip_longest(*results):
+        for item in filter(None, result):
+            messages = merger.add(*item)
+
+            # nothing is released past the watermark of a running source
+            limit = min(merger.watermarks.values(), default=math.inf)
+            assert all(message[1] <= limit for message in messages)
+
+            released.extend(messages)
+
+    assert not merger
+    assert not merger.pending
+
+    timestamps = [message[1] for message in released]
+    assert timestamps == sorted(timestamps)
+
+    for spec, result in zip(sources, results):
+        decoded = sorted(
+            message[0] for _, messages, _ in result for message in messages)
+        assert decoded
+        assert sorted(
+            message[0] for message in released if message[-1] == spec
+        ) == decoded
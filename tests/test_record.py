@@ -0,0 +1,52 @@
+"""Tests of the binary Kafka record of a message"""
+
+import struct
+
+import adsb_record
+import pyModeS
+import pytest
+
+# Examples of https://mode-s.org/decode/
+IDENTIFICATION = bytes.fromhex("8D4840D6202CC371C32CE0576098")
+ALL_CALL = bytes.fromhex("5D484FDEA248F5")
+
+# Surveillance altitude reply, its address overlaid on the parity
+SURVEILLANCE = bytes.fromhex("20001838CA3804")
+
+
+@pytest.mark.parametrize("frame", [IDENTIFICATION, ALL_CALL])
+def test_round_trip(frame):
+    record = adsb_record.encode(frame, 1_700_000_000.123456, 0.25)
+
+    assert len(record) == 13 + len(frame)
+    assert adsb_record.decode(record) == (frame, 1_700_000_000.123456, 0.25)
+
+
+def test_header_layout():
+    record = adsb_record.encode(ALL_CALL, 1.5, 0.75)
+
+    assert record[:8] == struct.pack("<d", 1.5)
+    assert record[8:12] == struct.pack("<f", 0.75)
+    assert record[12] == 7
+    assert record[13:] == ALL_CALL
+
+
+def test_decode_ignores_trailing_bytes():
+    record = adsb_record.encode(ALL_CALL, 1.5, 0.75) + b"\x00" * 7
+
+    assert adsb_record.decode(memoryview(record))[0] == ALL_CALL
+
+
+def test_signal_level_is_stored_as_float32():
+    _, _, signal_level = adsb_record.decode(
+        adsb_record.encode(ALL_CALL, 1.5, 0.1))
+
+    assert signal_level == pytest.approx(0.1)
+    assert signal_level == struct.unpack("<f", struct.pack("<f", 0.1))[0]
+
+
+def test_icao_address():
+    assert adsb_record.icao_address(IDENTIFICATION) == bytes.fromhex("4840D6")
+    assert adsb_record.icao_address(ALL_CALL) == bytes.fromhex("484FDE")
+    assert adsb_record.icao_address(SURVEILLANCE) == bytes.fromhex(
+        pyModeS.icao(SURVEILLANCE.hex()))
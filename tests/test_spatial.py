@@ -0,0 +1,172 @@
+"""Tests of the spatial index queries against a brute force search"""
+
+import adsb_spatial
+import numpy
+import pytest
+
+TTL = 60
+
+# Query points, two of them next to the antimeridian and one near a pole
+POINTS = [
+    (52.0, 4.5),
+    (0.0, 179.9),
+    (-33.9, -179.95),
+    (85.0, 30.0),
+    (-10.0, -60.0),
+]
+
+
+def random_positions(rng, count):
+    """
+    Returns random (icao, latitude, longitude, timestamp) positions, half of
+    them around the query points
+    """
+
+    latitudes = numpy.degrees(numpy.arcsin(rng.uniform(-1, 1, count)))
+    longitudes = rng.uniform(-180, 180, count)
+
+    near = rng.integers(len(POINTS), size=count // 2)
+    latitudes[:count // 2] = numpy.clip(
+        numpy.array(POINTS)[near, 0] + rng.normal(0, 3, count // 2), -90, 90)
+    longitudes[:count // 2] = (numpy.array(POINTS)[near, 1] + rng.normal(
+        0, 6, count // 2) + 180) % 360 - 180
+
+    timestamps = rng.uniform(0, 100, count)
+
+    return [
+        (f"{index:06X}", latitude, longitude, timestamp)
+        for index, (latitude, longitude, timestamp) in enumerate(zip(
+            latitudes.tolist(), longitudes.tolist(), timestamps.tolist()))
+    ]
+
+
+def build(positions, cell_size):
+    """Returns an index of the positions, updated in timestamp order"""
+
+    index = adsb_spatial.AdsbSpatialIndex(cell_size=cell_size, ttl=TTL)
+    for icao, latitude, longitude, timestamp in sorted(
+            positions, key=lambda position: position[3]):
+        index.update(icao, latitude, longitude, timestamp)
+
+    return index
+
+
+def alive(positions, now):
+    """Returns the positions not expired at time now"""
+    return [position for position in positions if now - position[3] <= TTL]
+
+
+def distances(positions, latitude, longitude):
+    """Returns the (distance, icao) of every position from a point"""
+
+    return sorted(
+        (adsb_spatial.distance(latitude, longitude, lat, lon), icao)
+        for icao, lat, lon, _ in positions
+    )
+
+
+@pytest.fixture(params=[0.25, 1.0, 7.0])
+def cell_size(request):
+    return request.param
+
+
+@pytest.fixture
+def positions():
+    return random_positions(numpy.random.default_rng(0), 3000)
+
+
+def test_distance():
+    assert adsb_spatial.distance(0, 0, 0, 1) == pytest.approx(
+        adsb_spatial.NM_PER_DEGREE)
+    assert adsb_spatial.distance(0, 179.5, 0, -179.5) == pytest.approx(
+        adsb_spatial.NM_PER_DEGREE)
+    assert adsb_spatial.distance(89, 0, 89, 180) == pytest.approx(
+        2 * adsb_spatial.NM_PER_DEGREE)
+
+
+def test_radius(positions, cell_size):
+    index = build(positions, cell_size)
+    now = 100.0
+
+    for latitude, longitude in POINTS:
+        for radius in (10, 100, 500):
+            expected = [
+                (nm, icao) for nm, icao in distances(
+                    alive(positions, now), latitude, longitude)
+                if nm <= radius
+            ]
+
+            assert sorted(index.radius(
+                latitude, longitude, radius, now)) == expected
+
+
+def test_nearest(positions, cell_size):
+    index = build(positions, cell_size)
+    now = 100.0
+
+    for latitude, longitude in POINTS:
+        expected = distances(alive(positions, now), latitude, longitude)
+
+        for count in (1, 5, 50):
+            assert index.nearest(latitude, longitude, count, now) == \
+                expected[:count]
+
+
+def test_nearest_of_more_than_every_aircraft(positions):
+    index = build(positions[:20], 1.0)
+
+    assert index.nearest(0.0, 179.9, 100, 100.0) == distances(
+        alive(positions[:20], 100.0), 0.0, 179.9)
+    assert index.nearest(0.0, 0.0, 0, 100.0) == []
+
+
+@pytest.mark.parametrize("south, west, north, east", [
+    (50.0, 3.0, 54.0, 7.0),
+    (-5.0, 170.0, 5.0, -170.0),
+    (-40.0, 175.0, -30.0, -175.0),
+    (80.0, -180.0, 90.0, 180.0),
+    (-90.0, -180.0, 90.0, 180.0),
+])
+def test_box(positions, cell_size, south, west, north, east):
+    index = build(positions, cell_size)
+    now = 100.0
+
+    if west <= east:
+        inside = [
+            icao for icao, lat, lon, _ in alive(positions, now)
+            if south <= lat <= north and west <= lon <= east
+        ]
+    else:
+        inside = [
+            icao for icao, lat, lon, _ in alive(positions, now)
+            if south <= lat <= north and (west <= lon or lon <= east)
+        ]
+
+    assert sorted(index.box(south, west, north, east, now)) == sorted(inside)
+
+
+def test_queries_expire_positions():
+    index = adsb_spatial.AdsbSpatialIndex(ttl=TTL)
+    index.update("A", 52.0, 4.5, 0.0)
+    index.update("B", 52.1, 4.6, 30.0)
+
+    assert sorted(
+        icao for _, icao in index.radius(52.0, 4.5, 50, 60.0)) == ["A", "B"]
+
+    assert [icao for _, icao in index.nearest(52.0, 4.5, 5, 61.0)] == ["B"]
+    assert "A" not in index
+
+    assert index.box(51.0, 4.0, 53.0, 5.0, 91.0) == []
+    assert len(index) == 0
+    assert not index.cells
+
+
+def test_moving_aircraft_changes_cell():
+    index = adsb_spatial.AdsbSpatialIndex(cell_size=1.0, ttl=TTL)
+    index.update("A", 52.5, 4.5, 0.0)
+    index.update("A", 10.5, -179.5, 1.0)
+
+    assert index.get("A") == (10.5, -179.5)
+    assert index.box(52.0, 4.0, 53.0, 5.0, 1.0) == []
+    assert index.box(10.0, 179.0, 11.0, -179.0, 1.0) == ["A"]
+    assert len(index.cells) == 1
@@ -0,0 +1,120 @@
+"""
+Tests of the CPR position decoding of AircraftTracker on the example messages
+of https://mode-s.org/decode/
+"""
+
+import adsb_columns
+import adsb_crc
+import adsb_tracker
+import numpy
+import pytest
+
+# Even and odd airborne positions with barometric altitude, type code 11, and
+# the position decoded when the even one is the latest
+AIRBORNE_EVEN = "8D40621D58C382D690C8AC2863A7"
+AIRBORNE_ODD = "8D40621D58C386435CC412692AD6"
+AIRBORNE_POSITION = (52.2572, 3.91937)
+
+# Even and odd surface positions, type code 7, near the reference position
+SURFACE_EVEN = "8C4841753AAB238733C8CD4020B1"
+SURFACE_ODD = "8C4841753A8A35323FAEBDAC702D"
+SURFACE_REFERENCE = (51.99, 4.375)
+SURFACE_POSITION = (52.32061, 4.73473)
+
+AIRBORNE_ICAO = "40621D"
+SURFACE_ICAO = "484175"
+
+
+def rewrite(message, icao=None, typecode=None):
+    """
+    Returns an extended squitter with its address or type code replaced and
+    its parity recomputed
+    """
+
+    data = bytearray.fromhex(message)
+    if icao is not None:
+        data[1:4] = bytes.fromhex(icao)
+    if typecode is not None:
+        data[4] = (typecode << 3) | (data[4] & 0x7)
+
+    frames = numpy.zeros((1, adsb_crc.MESSAGE_BYTES), dtype=numpy.uint8)
+    frames[0] = list(data)
+    parity = int(adsb_crc.checksum(frames, 11)[0])
+    data[11:] = parity.to_bytes(adsb_crc.CRC_BYTES, "big")
+
+    return data.hex().upper()
+
+
+def position(aircraft):
+    """Returns the position of an aircraft, None if it has none"""
+
+    if aircraft.position_time is None:
+        return None
+
+    return aircraft.latitude, aircraft.longitude
+
+
+def test_airborne_pair():
+    tracker = adsb_tracker.AircraftTracker()
+
+    tracker.update(AIRBORNE_ODD, 100.0)
+    aircraft = tracker.update(AIRBORNE_EVEN, 101.0)
+
+    assert position(aircraft) == pytest.approx(AIRBORNE_POSITION, abs=1e-4)
+
+
+def test_surface_pair_without_reference():
+    tracker = adsb_tracker.AircraftTracker()
+
+    tracker.update(SURFACE_EVEN, 100.0)
+    aircraft = tracker.update(SURFACE_ODD, 101.0)
+
+    assert position(aircraft) is None
+
+
+def test_surface_pair_with_reference():
+    tracker = adsb_tracker.AircraftTracker(reference=SURFACE_REFERENCE)
+
+    tracker.update(SURFACE_EVEN, 100.0)
+    aircraft = tracker.update(SURFACE_ODD, 101.0)
+
+    assert position(aircraft) == pytest.approx(SURFACE_POSITION, abs=1e-4)
+
+
+def test_airborne_and_surface_frames_are_not_paired():
+    tracker = adsb_tracker.AircraftTracker(reference=SURFACE_REFERENCE)
+
+    tracker.update(AIRBORNE_ODD, 100.0)
+    aircraft = tracker.update(rewrite(SURFACE_EVEN, icao=AIRBORNE_ICAO), 101.0)
+    assert position(aircraft) is None
+
+    aircraft = tracker.update(AIRBORNE_EVEN, 102.0)
+    assert position(aircraft) == pytest.approx(AIRBORNE_POSITION, abs=1e-4)
+
+
+def test_barometric_and_gnss_frames_are_not_paired():
+    tracker = adsb_tracker.AircraftTracker()
+
+    tracker.update(AIRBORNE_EVEN, 100.0)
+    aircraft = tracker.update(rewrite(AIRBORNE_ODD, typecode=20), 101.0)
+    assert position(aircraft) is None
+
+    aircraft = tracker.update(rewrite(AIRBORNE_EVEN, typecode=20), 102.0)
+    assert position(aircraft) == pytest.approx(AIRBORNE_POSITION, abs=1e-4)
+
+
+def test_update_columns_surface_pair_without_reference():
+    tracker = adsb_tracker.AircraftTracker()
+    messages = [
+        [SURFACE_EVEN, 100.0, 0.5],
+        [SURFACE_ODD, 101.0, 0.5],
+        [AIRBORNE_ODD, 102.0, 0.5],
+        [AIRBORNE_EVEN, 103.0, 0.5],
+    ]
+
+    columns = adsb_columns.decode(adsb_columns.frames_from_messages(messages))
+    tracker.update_columns(messages, columns)
+
+    assert position(tracker.get(SURFACE_ICAO)) is None
+    assert position(tracker.get(AIRBORNE_ICAO)) == pytest.approx(
+        AIRBORNE_POSITION, abs=1e-4)